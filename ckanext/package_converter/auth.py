@@ -0,0 +1,8 @@
+def package_converter_stats(context, data_dict):
+    # sysadmins only, they are not checked against auth functions
+    return {'success': False, 'msg': 'Only sysadmins can see the conversion stats'}
+
+
+def package_converter_profile(context, data_dict):
+    # sysadmins only, profiling runs the conversion without the cache
+    return {'success': False, 'msg': 'Only sysadmins can profile the conversions'}
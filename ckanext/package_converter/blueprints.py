@@ -1,9 +1,21 @@
+import json
+import time
+import zipfile
+
 import ckan.model as model
 import ckan.plugins.toolkit as toolkit
 
 from logging import getLogger
 
-from flask import Blueprint, make_response
+from flask import Blueprint, Response, make_response, request, stream_with_context
+from werkzeug.http import is_resource_modified
+
+from ckanext.package_converter.logic import get_dataset_dict, get_export_validators, get_view_key, search_datasets, \
+    convert_dataset, get_export_value, get_export_context, get_record_content
+from ckanext.package_converter.store import get_stored_export
+from ckanext.package_converter.oai import get_oai_response
+from ckanext.package_converter.model.record import Record
+from ckanext.package_converter.model.metadata_format import MetadataFormats
 
 log = getLogger(__name__)
 
@@ -24,6 +36,25 @@ def get_blueprints(name, module):
         resource_export
     )
 
+    blueprint.add_url_rule(
+        u"/export/catalog.<file_format>.<extension>",
+        u"catalog_export",
+        catalog_export
+    )
+
+    blueprint.add_url_rule(
+        u"/oai",
+        u"oai_pmh",
+        oai_pmh,
+        methods=[u'GET', u'POST']
+    )
+
+    blueprint.add_url_rule(
+        u"/package_converter/metrics",
+        u"metrics",
+        metrics
+    )
+
     return blueprint
 
 
@@ -40,16 +71,29 @@ def package_export(package_id, file_format='', extension='xml'):
         'user': toolkit.g.user
     }
 
-    content_type = 'text / plain'
-    if extension == 'xml':
-        content_type = 'application/xml'
-    elif extension == 'json':
-        content_type = 'application/json'
-
     headers = {u'Content-Disposition': 'attachment; filename=' + package_id + '_' + file_format + '.' + extension,
-               u'Content-Type': content_type}
+               u'Content-Type': _get_content_type(file_format, extension)}
+
+    try:
+        dataset_dict = get_dataset_dict(package_id, context, type='package')
+    except toolkit.ObjectNotFound:
+        toolkit.abort(404, 'Dataset not found')
+
+    # unchanged datasets are not converted again
+    view_key = get_view_key(context)
+    etag, last_modified = get_export_validators(dataset_dict, file_format, view_key, type='package')
+    if _is_not_modified(etag, last_modified):
+        return _not_modified_response(etag, last_modified)
+
+    # rendered when the dataset changed, the dataset was read with access checked
+    stored_export = get_stored_export(dataset_dict, file_format, view_key, type='package')
+    if stored_export:
+        response = make_response(stored_export[0], 200, headers)
+        _set_validators(response, etag, last_modified)
+        return response
 
     try:
+        context['dataset_dict'] = dataset_dict
         converted_package = toolkit.get_action(
             'package_export')(
             context,
@@ -58,7 +102,9 @@ def package_export(package_id, file_format='', extension='xml'):
     except toolkit.ObjectNotFound:
         toolkit.abort(404, 'Dataset not found')
 
-    return make_response(converted_package, 200, headers)
+    response = make_response(converted_package, 200, headers)
+    _set_validators(response, etag, last_modified)
+    return response
 
 
 def resource_export(resource_id, package_id='', file_format='', extension='xml'):
@@ -73,16 +119,29 @@ def resource_export(resource_id, package_id='', file_format='', extension='xml')
         'user': toolkit.g.user
     }
 
-    content_type = 'text / plain'
-    if extension == 'xml':
-        content_type = 'application/xml'
-    elif extension == 'json':
-        content_type = 'application/json'
-
     headers = {u'Content-Disposition': 'attachment; filename=' + resource_id + '_' + file_format + '.' + extension,
-               u'Content-Type': content_type}
+               u'Content-Type': _get_content_type(file_format, extension)}
 
     try:
+        dataset_dict = get_dataset_dict(resource_id, context, type='resource')
+    except toolkit.ObjectNotFound:
+        toolkit.abort(404, 'Dataset/Resource not found')
+
+    # unchanged datasets are not converted again
+    view_key = get_view_key(context)
+    etag, last_modified = get_export_validators(dataset_dict, file_format, view_key, type='resource')
+    if _is_not_modified(etag, last_modified):
+        return _not_modified_response(etag, last_modified)
+
+    # rendered when the dataset changed, the dataset was read with access checked
+    stored_export = get_stored_export(dataset_dict, file_format, view_key, type='resource')
+    if stored_export:
+        response = make_response(stored_export[0], 200, headers)
+        _set_validators(response, etag, last_modified)
+        return response
+
+    try:
+        context['dataset_dict'] = dataset_dict
         converted_resource = toolkit.get_action(
             'resource_export')(
             context,
@@ -91,4 +150,167 @@ def resource_export(resource_id, package_id='', file_format='', extension='xml')
     except toolkit.ObjectNotFound:
         toolkit.abort(404, 'Dataset/Resource not found')
 
-    return make_response(converted_resource, 200, headers)
+    response = make_response(converted_resource, 200, headers)
+    _set_validators(response, etag, last_modified)
+    return response
+
+
+def catalog_export(file_format='', extension='xml'):
+    """Stream all the datasets, or the ones matching the q and fq parameters, converted to a format.
+
+    The extension sets the output: 'ndjson' gives one JSON line per dataset, 'zip' one file per dataset,
+    any other the converted records one after the other.
+    """
+    context = {
+        'model': model,
+        'session': model.Session,
+        'user': toolkit.g.user
+    }
+
+    matching_metadata_formats = MetadataFormats().get_metadata_formats(file_format.lower())
+    if not matching_metadata_formats:
+        toolkit.abort(404, 'Metadata format unknown {0}'.format(file_format))
+    output_format = matching_metadata_formats[0]
+
+    datasets = search_datasets(context, query=request.args.get('q', ''), filter_query=request.args.get('fq', ''))
+    view_key = get_view_key(context, 'package_search')
+    if extension == 'ndjson':
+        chunks = _iter_ndjson(datasets, output_format, view_key)
+        content_type = 'application/x-ndjson'
+    elif extension == 'zip':
+        chunks = _iter_zip(datasets, output_format, view_key)
+        content_type = 'application/zip'
+    else:
+        chunks = _iter_concatenated(datasets, output_format, view_key)
+        content_type = _get_content_type(file_format, extension)
+
+    headers = {u'Content-Disposition': 'attachment; filename=catalog_' + file_format + '.' + extension}
+    return Response(stream_with_context(chunks), mimetype=content_type, headers=headers)
+
+
+def oai_pmh():
+    """Answer the OAI-PMH requests, the list responses are paged with resumption tokens and streamed.
+    """
+    context = {
+        'model': model,
+        'session': model.Session,
+        'user': toolkit.g.user
+    }
+
+    arguments = dict([(name, request.values.getlist(name)) for name in request.values.keys()])
+    chunks = get_oai_response(arguments, request.base_url, context)
+    return Response(stream_with_context(chunk.encode('utf-8') for chunk in chunks), mimetype='text/xml')
+
+
+def metrics():
+    """Return the conversion stats in the Prometheus text format, to sysadmins (or their API token).
+    """
+    context = {
+        'model': model,
+        'session': model.Session,
+        'user': toolkit.g.user
+    }
+
+    try:
+        prometheus_text = toolkit.get_action('package_converter_stats')(context, {'format': 'prometheus'})
+    except toolkit.NotAuthorized:
+        toolkit.abort(403, 'Not authorized to see the conversion stats')
+    except toolkit.ObjectNotFound:
+        toolkit.abort(404, 'Conversion stats are disabled')
+    return Response(prometheus_text, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _iter_converted_datasets(datasets, output_format, view_key):
+    # one dataset converted at a time, failed conversions are logged and skipped
+    export_context = get_export_context()
+    for dataset_dict in datasets:
+        converted_record = convert_dataset(dataset_dict, output_format, export_context=export_context,
+                                           view_key=view_key)
+        if isinstance(converted_record, Record):
+            yield dataset_dict, converted_record
+        else:
+            log.warning('Catalog export skipped {0}: {1}'.format(dataset_dict.get('id'), converted_record))
+
+
+def _get_text(converted_record):
+    converted_content = get_record_content(converted_record)
+    if isinstance(converted_content, bytes):
+        converted_content = converted_content.decode('utf-8')
+    return converted_content
+
+
+def _iter_concatenated(datasets, output_format, view_key):
+    for dataset_dict, converted_record in _iter_converted_datasets(datasets, output_format, view_key):
+        yield (_get_text(converted_record).rstrip('\n') + '\n').encode('utf-8')
+
+
+def _iter_ndjson(datasets, output_format, view_key):
+    for dataset_dict, converted_record in _iter_converted_datasets(datasets, output_format, view_key):
+        line = {'id': dataset_dict.get('id'), 'name': dataset_dict.get('name'),
+                'format': output_format.get_format_name(), 'content': get_export_value(converted_record)}
+        yield (json.dumps(line, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+class _ZipStream(object):
+    # write-only file for zipfile, emptied after each entry so the archive is never held in memory
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _iter_zip(datasets, output_format, view_key):
+    zip_stream = _ZipStream()
+    zip_file = zipfile.ZipFile(zip_stream, 'w', zipfile.ZIP_DEFLATED)
+    for dataset_dict, converted_record in _iter_converted_datasets(datasets, output_format, view_key):
+        zip_info = zipfile.ZipInfo('{0}.{1}'.format(dataset_dict.get('name') or dataset_dict.get('id'),
+                                                    output_format.get_file_extension()),
+                                   time.localtime()[:6])
+        zip_info.compress_type = zipfile.ZIP_DEFLATED
+        zip_file.writestr(zip_info, _get_text(converted_record).encode('utf-8'))
+        yield zip_stream.pop()
+    zip_file.close()
+    yield zip_stream.pop()
+
+
+def _get_content_type(file_format, extension):
+    # mimetype of the requested format, or of the formats using the extension
+    matching_metadata_formats = MetadataFormats().get_metadata_formats(file_format.lower())
+    if not matching_metadata_formats:
+        matching_metadata_formats = MetadataFormats().get_metadata_formats_by_extension(extension)
+    if matching_metadata_formats:
+        return matching_metadata_formats[0].get_mimetype()
+    return 'text/plain'
+
+
+def _is_not_modified(etag, last_modified):
+    if not etag:
+        return False
+    return not is_resource_modified(request.environ, etag=etag, last_modified=last_modified)
+
+
+def _set_validators(response, etag, last_modified):
+    if etag:
+        response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    return response
+
+
+def _not_modified_response(etag, last_modified):
+    return _set_validators(make_response('', 304), etag, last_modified)
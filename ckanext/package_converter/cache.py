@@ -0,0 +1,176 @@
+import collections
+import hashlib
+import importlib
+import os
+import tempfile
+import threading
+import time
+
+from logging import getLogger
+
+log = getLogger(__name__)
+
+DEFAULT_CACHE_BACKEND = 'memory'
+DEFAULT_CACHE_SIZE = 500
+DEFAULT_CACHE_TTL = 3600
+
+
+class ExportCache(object):
+    """Cache of converted records, keyed by tuples of strings.
+
+    Entries are stored as (content bytes, mimetype).
+    """
+
+    def __init__(self, ttl=DEFAULT_CACHE_TTL):
+        self.ttl = ttl
+
+    def get(self, key):
+        raise NotImplementedError('This is an abstract class and cannot be used as a cache')
+
+    def set(self, key, content, mimetype):
+        raise NotImplementedError('This is an abstract class and cannot be used as a cache')
+
+    def clear(self):
+        raise NotImplementedError('This is an abstract class and cannot be used as a cache')
+
+    def _is_expired(self, timestamp):
+        return self.ttl > 0 and (time.time() - timestamp) > self.ttl
+
+    @staticmethod
+    def _encode_content(content):
+        if isinstance(content, bytes):
+            return content
+        return content.encode('utf-8')
+
+    def __repr__(self):
+        return '{cache_class}(ttl={ttl})'.format(cache_class=type(self).__name__, ttl=self.ttl)
+
+
+class MemoryExportCache(ExportCache):
+    """In-process LRU cache with a time to live per entry."""
+
+    def __init__(self, size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL):
+        ExportCache.__init__(self, ttl)
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            timestamp, content, mimetype = entry
+            if self._is_expired(timestamp):
+                del self.entries[key]
+                return None
+            # move to the end, most recently used
+            del self.entries[key]
+            self.entries[key] = entry
+            return content, mimetype
+
+    def set(self, key, content, mimetype):
+        entry = (time.time(), self._encode_content(content), mimetype)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = entry
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class FileExportCache(ExportCache):
+    """Cache storing one file per entry in a directory, shared by all the processes using it."""
+
+    def __init__(self, directory, ttl=DEFAULT_CACHE_TTL):
+        ExportCache.__init__(self, ttl)
+        self.directory = directory
+
+    def _get_path(self, key):
+        digest = hashlib.sha1(u'\n'.join(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, key):
+        path = self._get_path(key)
+        try:
+            if self._is_expired(os.path.getmtime(path)):
+                os.remove(path)
+                return None
+            with open(path, 'rb') as cache_file:
+                mimetype = cache_file.readline().decode('utf-8').rstrip('\n')
+                content = cache_file.read()
+        except (IOError, OSError):
+            return None
+        return content, mimetype
+
+    def set(self, key, content, mimetype):
+        path = self._get_path(key)
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            # write to a temporary file first so readers never see partial entries
+            file_descriptor, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(file_descriptor, 'wb') as cache_file:
+                cache_file.write(mimetype.encode('utf-8') + b'\n')
+                cache_file.write(self._encode_content(content))
+            os.rename(tmp_path, path)
+        except (IOError, OSError) as e:
+            log.warning('Cannot write export cache entry {0}: {1}'.format(path, e))
+
+    def clear(self):
+        for root, dirs, files in os.walk(self.directory):
+            for file_name in files:
+                try:
+                    os.remove(os.path.join(root, file_name))
+                except OSError:
+                    pass
+
+    def __repr__(self):
+        return '{cache_class}(directory={directory}, ttl={ttl})'.format(
+            cache_class=type(self).__name__, directory=self.directory, ttl=self.ttl)
+
+
+_export_cache = None
+
+
+def get_export_cache():
+    return _export_cache
+
+
+def set_export_cache(export_cache):
+    global _export_cache
+    _export_cache = export_cache
+
+
+def configure_export_cache(config):
+    """Create the export cache set in the configuration.
+
+    package_converter.cache can be 'memory', 'file', 'none' or the full path to an ExportCache subclass,
+    constructed with the ttl as only parameter.
+    """
+    backend = config.get('package_converter.cache', DEFAULT_CACHE_BACKEND).strip()
+    ttl = int(config.get('package_converter.cache.ttl', DEFAULT_CACHE_TTL))
+
+    if backend == 'none':
+        export_cache = None
+    elif backend == 'memory':
+        size = int(config.get('package_converter.cache.size', DEFAULT_CACHE_SIZE))
+        export_cache = MemoryExportCache(size=size, ttl=ttl)
+    elif backend == 'file':
+        default_directory = os.path.join(config.get('cache_dir', tempfile.gettempdir()), 'package_converter')
+        directory = config.get('package_converter.cache.directory', default_directory)
+        export_cache = FileExportCache(directory, ttl=ttl)
+    else:
+        module_name, class_name = backend.rsplit('.', 1)
+        cache_class = getattr(importlib.import_module(module_name), class_name)
+        if not issubclass(cache_class, ExportCache):
+            raise TypeError('Cache class {cache_class} is not a subclass of {export_cache_class}.'.format(
+                cache_class=cache_class, export_cache_class=ExportCache))
+        export_cache = cache_class(ttl)
+
+    log.debug('Export cache: {0}'.format(export_cache))
+    set_export_cache(export_cache)
+    return export_cache
@@ -0,0 +1,210 @@
+import io
+import multiprocessing
+import os
+import time
+
+import click
+
+import ckan.model as model
+import ckan.plugins.toolkit as toolkit
+
+from ckanext.package_converter.logic import search_datasets, get_dataset_record, convert_dataset, get_export_context, \
+    get_view_key, _get_cache_key
+from ckanext.package_converter.model.metadata_format import MetadataFormats
+from ckanext.package_converter.model.converter import Converters
+from ckanext.package_converter.model.record import Record
+from ckanext.package_converter.cache import get_export_cache, MemoryExportCache
+from ckanext.package_converter.store import get_export_store, get_store_context
+
+from logging import getLogger
+
+log = getLogger(__name__)
+
+# export context of the current process, set by _init_worker
+_export_context = None
+
+
+@click.group(name=u'package-converter', short_help=u'Package converter commands')
+def package_converter():
+    pass
+
+
+@package_converter.command(u'render', short_help=u'Pre-render the datasets in all the output formats')
+@click.option(u'-f', u'--format', u'format_names', multiple=True,
+              help=u'Output format name, repeat for several (default: all the formats converted from ckan)')
+@click.option(u'-o', u'--output-dir', default=None,
+              help=u'Directory to write <format>/<dataset name>.<extension> files to (default: the export store)')
+@click.option(u'-q', u'--query', default=u'*:*', help=u'package_search query selecting the datasets')
+@click.option(u'-w', u'--workers', default=multiprocessing.cpu_count(), type=int, help=u'Number of processes')
+@click.option(u'-c', u'--chunk-size', default=10, type=int, help=u'Datasets sent to a process at a time')
+def render(format_names, output_dir, query, workers, chunk_size):
+    u"""Convert the datasets to the output formats in a pool of processes.
+
+    The records are written to the output directory or, by default, to the export store
+    (package_converter.store = true), where they never expire and are served until the dataset changes.
+    """
+    ckan_format = MetadataFormats().get_metadata_formats('ckan')[0]
+    if format_names:
+        output_format_names = [format_name.lower() for format_name in format_names]
+        unknown_format_names = [format_name for format_name in output_format_names
+                                if not MetadataFormats().get_metadata_formats(format_name)]
+        if unknown_format_names:
+            raise click.BadParameter(u'Metadata format unknown {0}'.format(u', '.join(unknown_format_names)))
+    else:
+        output_format_names = sorted(set([output_format.get_format_name() for output_format in
+                                          Converters().get_reachable_formats(ckan_format)]))
+
+    if not output_dir and not get_export_store():
+        if isinstance(get_export_cache(), MemoryExportCache):
+            raise click.UsageError(u'No output directory given and package_converter.cache = memory is local to '
+                                   u'each worker process, give --output-dir or enable package_converter.store')
+        raise click.UsageError(u'No output directory given and the export store is disabled, give --output-dir or '
+                               u'enable package_converter.store (export cache entries expire)')
+
+    if output_dir:
+        site_user = toolkit.get_action(u'get_site_user')({u'ignore_auth': True}, {})
+        datasets = search_datasets({u'ignore_auth': True, u'user': site_user[u'name']}, query=query)
+    else:
+        # the store is only served to anonymous requests, the datasets are read as in render_package_exports
+        datasets = _iter_store_datasets(search_datasets(get_store_context(), query=query))
+    # resolved in the main process and copied to the workers, which then need no application context
+    export_context = get_export_context()
+    try:
+        export_context.get_package_names()
+    except Exception as e:
+        log.warning(u'Cannot load the package names, the workers load them: {0}'.format(e))
+
+    click.echo(u'Rendering {0} with {1} workers'.format(u', '.join(output_format_names), workers))
+    start_time = time.time()
+    num_datasets = 0
+    num_records = 0
+    failures = []
+    pool = None
+    if workers > 1:
+        # the forked workers must open their own database connections
+        model.Session.remove()
+        model.meta.engine.dispose()
+        pool = _get_fork_context().Pool(workers, initializer=_init_worker, initargs=(export_context,))
+    else:
+        _init_worker(export_context)
+    try:
+        # datasets are read in the main process and sent to the workers a batch at a time
+        for tasks in _iter_task_batches(datasets, output_format_names, output_dir,
+                                        max(workers, 1) * max(chunk_size, 1)):
+            if pool:
+                results = pool.imap_unordered(_render_dataset, tasks, chunksize=max(chunk_size, 1))
+            else:
+                results = [_render_dataset(task) for task in tasks]
+            for dataset_id, num_rendered, dataset_failures in results:
+                num_datasets += 1
+                num_records += num_rendered
+                failures += [(dataset_id, format_name, message) for format_name, message in dataset_failures]
+            click.echo(u'{0} datasets rendered'.format(num_datasets))
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    elapsed_time = max(time.time() - start_time, 0.001)
+    for dataset_id, format_name, message in failures:
+        click.echo(u'FAILED {0} {1}: {2}'.format(dataset_id, format_name, (message.strip().splitlines() or [u''])[0]),
+                   err=True)
+    click.echo(u'{0} datasets, {1} records in {2:.1f} s ({3:.1f} datasets/s, {4:.1f} records/s), {5} failures'.format(
+        num_datasets, num_records, elapsed_time, num_datasets / elapsed_time, num_records / elapsed_time,
+        len(failures)))
+
+
+def _iter_store_datasets(datasets):
+    # the package_show dicts the stored exports are keyed with, not the package_search ones
+    for dataset_dict in datasets:
+        try:
+            yield toolkit.get_action(u'package_show')(get_store_context(), {u'id': dataset_dict[u'id']})
+        except (toolkit.ObjectNotFound, toolkit.NotAuthorized):
+            log.warning(u'Cannot read {0} as an anonymous user, not stored'.format(dataset_dict[u'id']))
+
+
+def _iter_task_batches(datasets, output_format_names, output_dir, batch_size):
+    tasks = []
+    for dataset_dict in datasets:
+        tasks += [(dataset_dict, output_format_names, output_dir)]
+        if len(tasks) >= batch_size:
+            yield tasks
+            tasks = []
+    if tasks:
+        yield tasks
+
+
+def _get_fork_context():
+    # the workers inherit the formats, converters, cache and store configured by the plugin in this process,
+    # spawned workers would not run update_config
+    if hasattr(multiprocessing, 'get_context'):
+        return multiprocessing.get_context('fork')
+    # Python 2 always forks
+    return multiprocessing
+
+
+def _init_worker(export_context):
+    global _export_context
+    _export_context = export_context
+
+
+def _render_dataset(task):
+    # runs in the worker processes, returns (dataset id, number of records rendered, [(format name, message)])
+    dataset_dict, output_format_names, output_dir = task
+    num_rendered = 0
+    failures = []
+    try:
+        dataset_record = get_dataset_record(dataset_dict, export_context=_export_context)
+    except Exception as e:
+        return dataset_dict.get(u'id'), 0, [(format_name, str(e)) for format_name in output_format_names]
+
+    for format_name in output_format_names:
+        output_format = MetadataFormats().get_metadata_formats(format_name)[0]
+        try:
+            converted_record = convert_dataset(dataset_dict, output_format, dataset_record=dataset_record,
+                                               use_cache=False)
+            if not isinstance(converted_record, Record):
+                failures += [(format_name, converted_record or u'No conversion chain')]
+                continue
+            if output_dir:
+                _write_record(output_dir, dataset_dict, converted_record)
+            else:
+                _store_record(dataset_dict, converted_record)
+            num_rendered += 1
+        except Exception as e:
+            log.warning(u'Cannot render {0} as {1}: {2}'.format(dataset_dict.get(u'id'), format_name, e))
+            failures += [(format_name, str(e))]
+    return dataset_dict.get(u'id'), num_rendered, failures
+
+
+def _write_record(output_dir, dataset_dict, converted_record):
+    metadata_format = converted_record.get_metadata_format()
+    format_dir = os.path.join(output_dir, metadata_format.get_format_name())
+    if not os.path.isdir(format_dir):
+        try:
+            os.makedirs(format_dir)
+        except OSError:
+            # created by another worker
+            if not os.path.isdir(format_dir):
+                raise
+    file_path = os.path.join(format_dir, u'{0}.{1}'.format(dataset_dict.get(u'name') or dataset_dict.get(u'id'),
+                                                           metadata_format.get_file_extension()))
+    converted_content = converted_record.get_content()
+    if not isinstance(converted_content, bytes):
+        converted_content = converted_content.encode('utf-8')
+    with io.open(file_path, 'wb') as output_file:
+        output_file.write(converted_content)
+
+
+def _store_record(dataset_dict, converted_record):
+    # keyed like the exports rendered when a package changes, so they are served until the next revision
+    output_format = converted_record.get_metadata_format()
+    cache_key = _get_cache_key(dataset_dict, 'package', output_format, get_view_key(get_store_context()))
+    if not cache_key:
+        raise ValueError(u'Dataset without id or metadata_modified cannot be stored')
+    get_export_store().set((dataset_dict[u'id'],) + cache_key, converted_record.get_content(),
+                           output_format.get_mimetype())
+
+
+def get_commands():
+    return [package_converter]
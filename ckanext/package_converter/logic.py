@@ -1,14 +1,30 @@
+import datetime
+import hashlib
 import traceback
+import six
+import ckan.lib.helpers as helpers
 import ckan.plugins.toolkit as toolkit
 
-from ckanext.package_converter.model.metadata_format import MetadataFormats, FormatType
+from ckanext.package_converter.model.metadata_format import MetadataFormats, FormatType, XMLMetadataFormat
 from ckanext.package_converter.model.converter import Converters
-from ckanext.package_converter.model.record import JSONRecord
+from ckanext.package_converter.model.record import Record, JSONRecord, XMLRecord
+from ckanext.package_converter.model.export_context import ExportContext, DEFAULT_VALID_URL_SCHEMES, \
+    set_export_context_factory
+from ckanext.package_converter.model.stats import timed, count_cache_lookup, get_conversion_stats
+from ckanext.package_converter.cache import get_export_cache
+from ckanext.package_converter.profiling import profile_call, DEFAULT_PROFILE_LIMIT, PROFILE_SORT_KEYS
 
 from logging import getLogger
 
 log = getLogger(__name__)
 
+BULK_EXPORT_BATCH_SIZE = 100
+BULK_EXPORT_LIMIT = 1000
+
+# placeholders routed by url_for, replaced by the ExportContext url path fields
+_URL_ID = 'package-converter-id'
+_URL_RESOURCE_ID = 'package-converter-resource-id'
+
 
 @toolkit.side_effect_free
 def package_export(context, data_dict):
@@ -50,6 +66,291 @@ def resource_export(context, data_dict):
     return _export(data_dict, context, type='resource')
 
 
+@toolkit.side_effect_free
+def package_export_bulk(context, data_dict):
+    """Return many datasets converted to many formats.
+
+    The datasets are read with package_search, in batches, and each one is converted to all the formats
+    from a single record.
+
+    :param ids: the IDs or names of the datasets (optional if q is given)
+    :type ids: list of strings
+
+    :param q: a package_search query selecting the datasets (optional if ids are given)
+    :type q: string
+
+    :param fq: a package_search filter query (optional)
+    :type fq: string
+
+    :param formats: the output format names
+    :type formats: list of strings
+
+    :param limit: the maximum number of datasets exported for a query (optional, default 1000)
+    :type limit: int
+
+    :returns: the converted metadata by dataset id and format name, and the errors by dataset id and format
+        name or by requested id for the datasets not found
+    :rtype: dictionary
+    """
+
+    ids = _as_list(data_dict.get('ids'))
+    query = data_dict.get('q', '')
+    if not ids and not query:
+        raise toolkit.ValidationError({'ids': 'missing ids or q'})
+
+    output_formats = []
+    for output_format_name in _as_list(data_dict.get('formats')):
+        matching_metadata_formats = MetadataFormats().get_metadata_formats(output_format_name.lower())
+        if not matching_metadata_formats:
+            raise toolkit.ValidationError({'formats': 'Metadata format unknown {0}'.format(output_format_name)})
+        output_formats += [matching_metadata_formats[0]]
+    if not output_formats:
+        raise toolkit.ValidationError({'formats': 'missing formats'})
+
+    try:
+        limit = int(data_dict.get('limit', BULK_EXPORT_LIMIT))
+    except ValueError:
+        raise toolkit.ValidationError({'limit': 'limit must be an integer'})
+
+    log.debug("Action package_export_bulk: Converting {0} to {1}".format(ids or query, data_dict.get('formats')))
+    results = {}
+    errors = {}
+    found_ids = set()
+    export_context = get_export_context()
+    view_key = get_view_key(context, 'package_search')
+    for dataset_dict in search_datasets(context, ids, query, data_dict.get('fq', ''), limit):
+        if dataset_dict.get('id') in found_ids:
+            continue
+        found_ids.update([dataset_dict.get('id'), dataset_dict.get('name')])
+        dataset_record = get_dataset_record(dataset_dict, export_context=export_context)
+        for output_format in output_formats:
+            converted_record = convert_dataset(dataset_dict, output_format, dataset_record=dataset_record,
+                                               view_key=view_key)
+            output_format_name = output_format.get_format_name()
+            if isinstance(converted_record, Record):
+                results.setdefault(dataset_dict['id'], {})[output_format_name] = get_export_value(
+                    converted_record)
+            else:
+                errors.setdefault(dataset_dict['id'], {})[output_format_name] = converted_record
+
+    for id in ids:
+        if id not in found_ids:
+            errors[id] = 'Dataset not found'
+    return {'results': results, 'errors': errors}
+
+
+@toolkit.side_effect_free
+def package_resources_export(context, data_dict):
+    """Return all the resources of a dataset converted to a format, DataCite by default.
+
+    The dataset is read once and the package part of the resource records converted once for all of them.
+
+    :param id: the ID or name of the dataset
+    :type id: string
+
+    :param format: the output format name (optional, default datacite)
+    :type format: string
+
+    :returns: the converted metadata by resource id, and the errors by resource id
+    :rtype: dictionary
+    """
+    try:
+        id = data_dict['id']
+    except KeyError:
+        raise toolkit.ValidationError({'id': 'missing id'})
+
+    output_format_name = data_dict.get('format', 'datacite').lower()
+    matching_metadata_formats = MetadataFormats().get_metadata_formats(output_format_name)
+    if not matching_metadata_formats:
+        raise toolkit.ValidationError({'format': 'Metadata format unknown {0}'.format(output_format_name)})
+    output_format = matching_metadata_formats[0]
+
+    log.debug("Action package_resources_export: Converting resources of {0} to {1}".format(id, output_format_name))
+    package_dict = toolkit.get_action('package_show')(dict(context), {'id': id})
+    results = {}
+    errors = {}
+    export_context = get_export_context()
+    view_key = get_view_key(context)
+    for resource_dict in package_dict.get('resources', []):
+        # as returned by get_dataset_dict for resources
+        dataset_dict = dict(resource_dict, package_dict=package_dict)
+        converted_record = convert_dataset(dataset_dict, output_format, type='resource', export_context=export_context,
+                                           view_key=view_key)
+        if isinstance(converted_record, Record):
+            results[resource_dict['id']] = get_export_value(converted_record)
+        else:
+            errors[resource_dict['id']] = converted_record
+    return {'results': results, 'errors': errors}
+
+
+@toolkit.side_effect_free
+def package_converter_stats(context, data_dict):
+    """Return the latency percentiles of the export stages and the hit ratios of the caches, sysadmins only.
+
+    :param format: 'prometheus' for the Prometheus text exposition format (optional, default a dictionary)
+    :type format: string
+
+    :returns: the latency summaries by stage and name, in seconds, and the cache lookups by cache and format
+    :rtype: dictionary or string
+    """
+    toolkit.check_access('package_converter_stats', context, data_dict)
+    conversion_stats = get_conversion_stats()
+    if conversion_stats is None:
+        raise toolkit.ObjectNotFound('Conversion stats are disabled')
+    if data_dict.get('format', '').lower() == 'prometheus':
+        return conversion_stats.format_prometheus()
+    return conversion_stats.get_stats()
+
+
+@toolkit.side_effect_free
+def package_converter_profile(context, data_dict):
+    """Convert a dataset or resource under cProfile and tracemalloc, without the export cache, sysadmins only.
+
+    :param id: the ID or name of the dataset or resource
+    :type id: string
+
+    :param format: the output format name
+    :type format: string
+
+    :param type: 'package' or 'resource' (optional, default package)
+    :type type: string
+
+    :param limit: the number of functions returned (optional, default 20)
+    :type limit: int
+
+    :param sort: 'cumulative', 'tottime' or 'calls' (optional, default cumulative)
+    :type sort: string
+
+    :returns: the converted metadata as package_export_bulk returns it, or the error, and the profile with the
+        duration in seconds, the peak memory in bytes (null without tracemalloc) and the top functions
+    :rtype: dictionary
+    """
+    toolkit.check_access('package_converter_profile', context, data_dict)
+    try:
+        id = data_dict['id']
+    except KeyError:
+        raise toolkit.ValidationError({'id': 'missing id'})
+    type = data_dict.get('type', 'package')
+    if type not in ['package', 'resource']:
+        raise toolkit.ValidationError({'type': 'type must be package or resource'})
+    output_format_name = data_dict.get('format', '').lower()
+    matching_metadata_formats = MetadataFormats().get_metadata_formats(output_format_name)
+    if not matching_metadata_formats:
+        raise toolkit.ValidationError({'format': 'Metadata format unknown {0}'.format(output_format_name)})
+    output_format = matching_metadata_formats[0]
+    try:
+        limit = int(data_dict.get('limit', DEFAULT_PROFILE_LIMIT))
+    except ValueError:
+        raise toolkit.ValidationError({'limit': 'limit must be an integer'})
+    sort = data_dict.get('sort', 'cumulative')
+    if sort not in PROFILE_SORT_KEYS:
+        raise toolkit.ValidationError({'sort': 'sort must be one of {0}'.format(', '.join(PROFILE_SORT_KEYS))})
+
+    # only the conversion and serialization are profiled
+    dataset_dict = get_dataset_dict(id, dict(context), type)
+    export_context = get_export_context()
+
+    def convert():
+        converted_record = convert_dataset(dataset_dict, output_format, type, export_context=export_context,
+                                           use_cache=False)
+        if isinstance(converted_record, Record):
+            return {'result': get_export_value(converted_record)}
+        return {'error': converted_record}
+
+    log.debug("Action package_converter_profile: Converting {0} {1} to {2}".format(type, id, output_format_name))
+    export, profile = profile_call(convert, limit, sort)
+    log.info('Profiled conversion of {0} {1} to {2}: {3:.3f} s, peak memory {4}'.format(
+        type, id, output_format_name, profile['duration'], profile['peak_memory']))
+    return dict(export, profile=profile)
+
+
+def _as_list(value):
+    if not value:
+        return []
+    if isinstance(value, six.string_types):
+        return value.replace(',', ' ').split()
+    return list(value)
+
+
+def search_datasets(context, ids=None, query='', filter_query='', limit=None):
+    """Yield the datasets with the ids or names given, or matching the query, reading them batch by batch.
+
+    Only one batch is held in memory, the datasets matching a query are all read unless limited. They are
+    sorted as in OAI-PMH, so the batches are pages of the same order.
+    """
+    search_batches = []
+    if ids:
+        for start in range(0, len(ids), BULK_EXPORT_BATCH_SIZE):
+            id_batch = u' OR '.join([u'"{0}"'.format(id.replace('"', ''))
+                                     for id in ids[start:start + BULK_EXPORT_BATCH_SIZE]])
+            search_batches += [(u'id:({0}) OR name:({0})'.format(id_batch), 0, BULK_EXPORT_BATCH_SIZE)]
+    else:
+        search_batches = _get_query_batches(query or '*:*', limit)
+
+    for batch_query, start, rows in search_batches:
+        search_dict = {'q': batch_query, 'start': start, 'rows': rows, 'sort': 'metadata_modified asc, id asc',
+                       'include_private': True}
+        if filter_query:
+            search_dict['fq'] = filter_query
+        search_result = toolkit.get_action('package_search')(dict(context), search_dict)
+        for dataset_dict in search_result.get('results', []):
+            yield dataset_dict
+        if not ids and (start + rows >= search_result.get('count', 0) or not search_result.get('results')):
+            break
+
+
+def _get_query_batches(query, limit=None):
+    start = 0
+    while limit is None or start < limit:
+        rows = BULK_EXPORT_BATCH_SIZE if limit is None else min(BULK_EXPORT_BATCH_SIZE, limit - start)
+        yield query, start, rows
+        start += rows
+
+
+def get_export_value(converted_record):
+    # JSON formats as dicts, the rest as text
+    if converted_record.get_metadata_format().get_format_type() == FormatType.JSON:
+        return converted_record.get_json_dict()
+    converted_content = get_record_content(converted_record)
+    if isinstance(converted_content, bytes):
+        converted_content = converted_content.decode('utf-8')
+    return converted_content
+
+
+def get_embedded_json(dataset_dict, output_format_name='schemaorg'):
+    """Return a dataset converted to a JSON format as compact text that can be embedded in a script element,
+    '' if it cannot be converted.
+
+    Only the embedded text is cached, per package revision and user of the request: the dataset given may have
+    been changed for the view by other plugins, so it is converted without the export cache.
+    """
+    matching_metadata_formats = MetadataFormats().get_metadata_formats(output_format_name)
+    if not matching_metadata_formats or matching_metadata_formats[0].get_format_type() != FormatType.JSON:
+        return ''
+    output_format = matching_metadata_formats[0]
+
+    export_cache = get_export_cache()
+    cache_key = _get_cache_key(dataset_dict, 'package', output_format, get_view_key({}))
+    if export_cache and cache_key:
+        cache_key += ('embedded',)
+        cached_entry = export_cache.get(cache_key)
+        count_cache_lookup('embedded', output_format_name, bool(cached_entry))
+        if cached_entry:
+            return cached_entry[0].decode('utf-8')
+
+    converted_record = convert_dataset(dataset_dict, output_format, use_cache=False)
+    if not isinstance(converted_record, Record):
+        log.warning('Cannot embed {0} as {1}: {2}'.format(dataset_dict.get('id'), output_format_name,
+                                                          converted_record))
+        return ''
+    embedded_json = JSONRecord(output_format, get_export_value(converted_record), compact=True).get_content()
+    # a closing tag in a value would end the script element
+    embedded_json = embedded_json.replace('</', '<\\/')
+    if export_cache and cache_key:
+        export_cache.set(cache_key, embedded_json, output_format.get_mimetype())
+    return embedded_json
+
+
 def _export(data_dict, context, type='package'):
     try:
         id = data_dict['id']
@@ -69,7 +370,8 @@ def _export(data_dict, context, type='package'):
         log.debug("No response object")
         r = False
 
-    converted_record = export_as_record(id, output_format_name, context, type)
+    converted_record = export_as_record(id, output_format_name, context, type,
+                                        dataset_dict=context.get('dataset_dict'))
     try:
         if r and not context.get('as_dict', False):
             log.debug("there is a response object")
@@ -79,7 +381,7 @@ def _export(data_dict, context, type='package'):
             if converted_record.get_metadata_format().get_format_type() == FormatType.JSON:
                 log.debug("JSON format, returning dict")
                 return converted_record.get_json_dict()
-        converted_content = converted_record.get_content()
+        converted_content = get_record_content(converted_record)
         log.debug("returning converted content")
         return converted_content
     except:
@@ -87,38 +389,168 @@ def _export(data_dict, context, type='package'):
         return str(converted_record)
 
 
-def export_as_record(id, output_format_name, context={}, type='package'):
-    # assuming type=package
-    ckan_format_name = 'ckan'
+def get_view_key(context, action='package_show'):
+    """Return the view of the datasets read with the context: the action reading them and the user.
 
-    if type == 'resource':
-        ckan_format_name = 'ckan_resource'
-        dataset_dict = toolkit.get_action('resource_show')(context, {'id': id})
-        # include package data to inherit
-        package_id = dataset_dict.get('package_id')
-        if package_id:
-            package_dict = toolkit.get_action('package_show')(context, {'id': package_id})
-            dataset_dict['package_dict'] = package_dict
+    It is part of the keys of the cached and stored exports, as plugins may change the dataset dicts by user
+    and package_search dicts may differ from package_show ones. Anonymous requests have the user ''. None if
+    the context has no user outside of a request, the exports are then not cached.
+    """
+    if 'user' in context:
+        user = context['user']
     else:
-        dataset_dict = toolkit.get_action('package_show')(context, {'id': id})
+        user = _get_request_user()
+        if user is None:
+            return None
+    return u'{0}:{1}'.format(action, user or u'')
+
+
+def _get_request_user():
+    # the user the actions default to, None outside of a request
+    try:
+        return toolkit.g.user or u''
+    except (AttributeError, RuntimeError, TypeError):
+        return None
+
+
+def get_dataset_dict(id, context={}, type='package'):
+    with timed('package_show', type):
+        if type == 'resource':
+            dataset_dict = toolkit.get_action('resource_show')(context, {'id': id})
+            # include package data to inherit
+            package_id = dataset_dict.get('package_id')
+            if package_id:
+                package_dict = toolkit.get_action('package_show')(context, {'id': package_id})
+                dataset_dict['package_dict'] = package_dict
+        else:
+            dataset_dict = toolkit.get_action('package_show')(context, {'id': id})
+    return dataset_dict
+
+
+def get_export_validators(dataset_dict, output_format_name, view_key, type='package'):
+    """Return the ETag and the last modification datetime of the converted dataset read in the view,
+    (None, None) if the format is unknown, the dataset has no revision or there is no view.
+
+    Both change with the package revision and with the converters: the last modification is the later of
+    metadata_modified and the time the converters were loaded, so replaced converters are never answered
+    as not modified.
+    """
+    matching_metadata_formats = MetadataFormats().get_metadata_formats(output_format_name.lower())
+    if not matching_metadata_formats:
+        return None, None
+    cache_key = _get_cache_key(dataset_dict, type, matching_metadata_formats[0], view_key)
+    if not cache_key:
+        return None, None
+    etag = hashlib.md5(u'\n'.join(cache_key).encode('utf-8')).hexdigest()
+    last_modified = _parse_metadata_modified(cache_key[4])
+    if last_modified:
+        last_modified = max(last_modified, Converters().get_loaded_time())
+    return etag, last_modified
+
+
+def export_as_record(id, output_format_name, context={}, type='package', dataset_dict=None):
+    # the dataset may have been fetched already by the caller
+    if not dataset_dict:
+        dataset_dict = get_dataset_dict(id, context, type)
 
     matching_metadata_formats = MetadataFormats().get_metadata_formats(output_format_name)
     if not matching_metadata_formats:
         return 'Metadata format unknown {output_format_name}'.format(output_format_name=output_format_name)
     output_format = matching_metadata_formats[0]
 
+    return convert_dataset(dataset_dict, output_format, type, view_key=get_view_key(context))
+
+
+def get_dataset_record(dataset_dict, type='package', export_context=None):
+    ckan_format = MetadataFormats().get_metadata_formats(_get_ckan_format_name(type))[0]
+    return JSONRecord(ckan_format, dataset_dict, export_context=export_context)
+
+
+def get_export_context():
+    """Return the site URLs and URL paths used by the converters, resolved from the CKAN configuration and routes.
+
+    Built once per request or job and passed to all its conversions, they need no request context after that.
+    """
+    config = toolkit.config
+    site_url = config.get('ckan.site_url', '')
+    protocol, host = helpers.get_site_protocol_and_host()
+    thumbnail = config.get('package_converter.thumbnail', '')
+    return ExportContext(
+        site_url, site_root=u'{0}://{1}'.format(protocol, host), url_paths=_get_url_paths(),
+        thumbnail_url=helpers.url_for_static_or_external(thumbnail, qualified=True) if thumbnail else '',
+        related_url_prefix=config.get('datacite_publication.url_prefix', site_url + '/dataset'),
+        valid_url_schemes=config.get('ckan.valid_url_schemes', '').lower().split() or DEFAULT_VALID_URL_SCHEMES,
+        package_names_loader=get_package_names)
+
+
+def _get_url_paths():
+    url_paths = {'dataset': toolkit.url_for(controller='dataset', action='read', id=_URL_ID)}
+    for controller in ['resource', 'dataset_resource']:
+        url_paths[controller] = toolkit.url_for(controller=controller, action='read', id=_URL_ID,
+                                                resource_id=_URL_RESOURCE_ID)
+    return dict([(controller, url_path.replace(_URL_RESOURCE_ID, '{resource_id}').replace(_URL_ID, '{id}'))
+                 for controller, url_path in url_paths.items()])
+
+
+def get_package_names():
+    # names of the datasets linked as related datasets, loaded at most once per export context
+    return toolkit.get_action('package_list')(context={'ignore_auth': False}, data_dict={})
+
+
+# records converted without an export context get one from the CKAN configuration and routes
+set_export_context_factory(get_export_context)
+
+
+def _get_ckan_format_name(type='package'):
+    # assuming type=package
+    if type == 'resource':
+        return 'ckan_resource'
+    return 'ckan'
+
+
+def convert_dataset(dataset_dict, output_format, type='package', dataset_record=None, export_context=None,
+                    use_cache=True, view_key=None):
+    """Return the dataset converted to the output format as a record, or an error message.
+
+    A dataset_record given is shared by successive conversions of the same dataset, with its decoded fields.
+    An export_context given is shared by the conversions of a request or job, the default one is built otherwise.
+    The conversion is cached for the view_key the dataset was read with (see get_view_key), never without one.
+    With use_cache=False the dataset is converted even if cached, and the result is not cached.
+    """
+    output_format_name = output_format.get_format_name()
+
+    # unchanged datasets are served from the cache
+    export_cache = get_export_cache() if use_cache and view_key else None
+    cache_key = _get_cache_key(dataset_dict, type, output_format, view_key) if export_cache else None
+    if export_cache and cache_key:
+        with timed('cache_lookup', output_format_name):
+            cached_entry = export_cache.get(cache_key)
+        count_cache_lookup('export', output_format_name, bool(cached_entry))
+        if cached_entry:
+            log.debug('Export cache hit {0}'.format(cache_key))
+            return _get_cached_record(output_format, cached_entry[0])
+
     # get dataset as record
-    try:
-        ckan_format = MetadataFormats().get_metadata_formats(ckan_format_name)[0]
-        dataset_record = JSONRecord(ckan_format, dataset_dict)
-    except Exception as e:
-        log.error('Cannot create record in format {0}, Exception: {1}, {2}'.format(ckan_format_name, e,
-                                                                                   traceback.format_exc()))
-        return 'Cannot create record in format {0}'.format(ckan_format_name)
+    if dataset_record is None:
+        try:
+            dataset_record = get_dataset_record(dataset_dict, type, export_context=export_context)
+        except Exception as e:
+            ckan_format_name = _get_ckan_format_name(type)
+            log.error('Cannot create record in format {0}, Exception: {1}, {2}'.format(ckan_format_name, e,
+                                                                                       traceback.format_exc()))
+            return 'Cannot create record in format {0}'.format(ckan_format_name)
     # convert
     try:
         converted_record = Converters().get_conversion(dataset_record, output_format)
         if converted_record:
+            # RDF records are XML records too, but have no schema
+            if isinstance(converted_record, XMLRecord) and \
+                    isinstance(converted_record.get_metadata_format(), XMLMetadataFormat) and \
+                    toolkit.asbool(toolkit.config.get('package_converter.validate_exports', False)):
+                _validate_record(converted_record)
+            if export_cache and cache_key and get_record_content(converted_record):
+                export_cache.set(cache_key, converted_record.get_content(),
+                                 converted_record.get_metadata_format().get_mimetype())
             return converted_record
         else:
             raise Exception('Cannot convert')
@@ -126,3 +558,47 @@ def export_as_record(id, output_format_name, context={}, type='package'):
         log.warning("Exception raised while converting: " + traceback.format_exc())
         return ('No converter available for format {0} \n\n (Exception: {1})'.format(output_format_name,
                                                                                      traceback.format_exc(limit=1)))
+
+
+def get_record_content(converted_record):
+    """Return the content of a converted record, timing its serialization when it is built from a dict or DOM."""
+    if converted_record.content is not None:
+        return converted_record.content
+    with timed('serialize', converted_record.get_metadata_format().get_format_name()):
+        return converted_record.get_content()
+
+
+def _validate_record(xml_record):
+    # invalid records are still returned, validation only reports them
+    try:
+        if not xml_record.validate():
+            log.warning('Exported record is not valid {0}'.format(xml_record.get_metadata_format().get_format_name()))
+    except Exception as e:
+        log.warning('Cannot validate exported record {0}: {1}'.format(
+            xml_record.get_metadata_format().get_format_name(), e))
+
+
+def _get_cache_key(dataset_dict, type, output_format, view_key):
+    # the package revision changes with any update of the package or its resources
+    package_dict = dataset_dict.get('package_dict', dataset_dict) if type == 'resource' else dataset_dict
+    metadata_modified = package_dict.get('metadata_modified')
+    if not metadata_modified or not dataset_dict.get('id') or not view_key:
+        return None
+    return (dataset_dict['id'], type, output_format.get_format_name(), output_format.get_version(),
+            metadata_modified, Converters().get_fingerprint(), view_key)
+
+
+def _parse_metadata_modified(metadata_modified):
+    for date_format in ['%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S']:
+        try:
+            return datetime.datetime.strptime(metadata_modified, date_format)
+        except ValueError:
+            pass
+    return None
+
+
+def _get_cached_record(output_format, content):
+    cached_record = Record(output_format, content.decode('utf-8'))
+    if output_format.get_format_type() == FormatType.JSON:
+        return JSONRecord.from_record(cached_record)
+    return cached_record
@@ -1,11 +1,54 @@
 from . record import Record, XMLRecord
-from . metadata_format import MetadataFormats, XMLMetadataFormat
+from . metadata_format import MetadataFormats, XMLMetadataFormat, FormatType
+from . stats import timed
+import datetime
 import importlib
+import hashlib
+import os
+import threading
 
 from logging import getLogger
 
 log = getLogger(__name__)
 
+EXTENSION_DISTRIBUTION = 'ckanext-package_converter'
+
+# input and output formats, as (name, version), of the converters shipped with the extension by class path,
+# registered without importing their module (tests/test_converter.py checks them against the classes)
+BUILTIN_CONVERTER_FORMATS = {
+    'ckanext.package_converter.model.scheming_converter.Datacite43SchemingConverter':
+        (('ckan', ''), ('datacite', '4.4')),
+    'ckanext.package_converter.model.scheming_resource_converter.Datacite43SchemingResourceConverter':
+        (('ckan_resource', ''), ('datacite', '4.4')),
+    'ckanext.package_converter.model.envidat_iso_converter.Iso19139Converter': (('ckan', ''), ('iso19139', '1.0')),
+    'ckanext.package_converter.model.envidat_dif_converter.GcmdDifConverter': (('ckan', ''), ('gcmd_dif', '10.2')),
+    'ckanext.package_converter.model.envidat_dcat_ap_ch_converter.DcatApChConverter':
+        (('ckan', ''), ('dcat-ap-ch', '1.0')),
+    'ckanext.package_converter.model.envidat_bibtex_converter.BibtexConverter': (('ckan', ''), ('bibtex', '')),
+    'ckanext.package_converter.model.envidat_ris_converter.RisConverter': (('ckan', ''), ('ris', '')),
+    'ckanext.package_converter.model.envidat_readme_converter.ReadmeConverter': (('ckan', ''), ('plain-text', '')),
+    'ckanext.package_converter.model.envidat_csv_converter.CsvConverter': (('ckan', ''), ('csv', '')),
+    'ckanext.package_converter.model.envidat_schemaorg_dataset_converter.SchemaOrgDadatasetConverter':
+        (('ckan', ''), ('schemaorg', '')),
+}
+
+
+# stylesheets shipped with the extension by input and output format, as (name, version)
+BUILTIN_XSL_CONVERTERS = [
+    (('datacite', '4.4'), ('oai_dc', ''), 'datacite_v.4.3_to_oai_dc_v2.0.xsl'),
+    (('datacite', '4.4'), ('dcat', ''), 'datacite-to-dcat-ap.xsl'),
+]
+
+XSL_DIRECTORY = os.path.join(os.path.dirname(__file__), '../public/package_converter_xsl')
+
+
+def get_extension_version():
+    try:
+        import pkg_resources
+        return pkg_resources.get_distribution(EXTENSION_DISTRIBUTION).version
+    except Exception:
+        return ''
+
 
 class Converter(object):
 
@@ -72,11 +115,12 @@ class XSLConverter(Converter):
 
     def convert(self, record):
         if self.can_convert(record):
+            if issubclass(type(self.output_format), XMLMetadataFormat) or \
+                    self.output_format.get_format_type() in [FormatType.XML, FormatType.RDF]:
+                # hand the transformed tree to the next converter without serializing it
+                return XMLRecord.from_dom(self.output_format, record.xsl_transform_dom(self.xsl_path))
             converted_content = self._xsl_transform(self.xsl_path, record)
-            converted_record = Record(self.output_format, converted_content)
-            if issubclass(type(self.output_format), XMLMetadataFormat):
-                return XMLRecord.from_record(converted_record)
-            return converted_record
+            return Record(self.output_format, converted_content)
         else:
             raise TypeError(('Converter is not compatible with the record format {record_format}({record_version}). ' +
                              'Accepted format is XML {input_format}({input_version}).').format(
@@ -92,62 +136,248 @@ class XSLConverter(Converter):
         return super(XSLConverter, self).__unicode__() + u' using XSL {xsl_path}'.format(xsl_path=self.xsl_path)
 
 
+class LazyConverter(Converter):
+    """Descriptor of a converter class with declared formats, imported and instantiated on the first conversion.
+
+    Conversion chains are planned from the declared formats, so registering it imports nothing.
+    """
+
+    def __init__(self, converter_name, input_format, output_format):
+        Converter.__init__(self, input_format, output_format)
+        self.converter_name = converter_name
+        self.converter = None
+        self.lock = threading.Lock()
+
+    def get_converter(self):
+        if self.converter is None:
+            with self.lock:
+                if self.converter is None:
+                    log.debug('Loading converter {0}'.format(self.converter_name))
+                    converter = load_converter(self.converter_name)
+                    if not converter.can_convert_format(self.input_format, self.output_format):
+                        log.warning('Converter {0} does not convert the declared formats {1} -> {2}'.format(
+                            self.converter_name, self.input_format.get_format_name(),
+                            self.output_format.get_format_name()))
+                    self.converter = converter
+        return self.converter
+
+    def can_convert(self, record, check_version=False):
+        return self.get_converter().can_convert(record, check_version=check_version)
+
+    def convert(self, record):
+        return self.get_converter().convert(record)
+
+    def __unicode__(self):
+        return super(LazyConverter, self).__unicode__() + u' loaded from {converter_name}'.format(
+            converter_name=self.converter_name)
+
+
+def load_converter(converter_name):
+    """Import a converter class by its full path and return an instance of it."""
+    package_name, class_name = converter_name.rsplit('.', 1)
+    module = importlib.import_module(package_name)
+    converter_class = getattr(module, class_name)
+    converter = converter_class()
+    if not issubclass(type(converter), Converter):
+        raise TypeError(
+            'Converter class {converter_class} is not a subclass of {standard_converter_class}.'.format(
+                converter_class=converter_class, standard_converter_class=Converter))
+    return converter
+
+
+def _get_declared_format(format_name, version=''):
+    matching_formats = MetadataFormats().get_metadata_formats(format_name, version)
+    if not matching_formats:
+        return None
+    return matching_formats[0]
+
+
+class _ConvertersSnapshot(object):
+    """Converters registered at some point, never modified once published by Converters.
+
+    The fingerprint, the index by output format and the planned chains are computed on first use, for this
+    snapshot only, so a lookup racing with a new converter never stores a stale result in the new snapshot.
+    """
+
+    def __init__(self, converters_dict):
+        # input format name to tuple of converters, latest added first
+        self.converters_dict = converters_dict
+        self.fingerprint = None
+        # UTC, as the package revisions
+        self.loaded_time = datetime.datetime.utcnow()
+        # planned chains by (input name, input version, output name, output version, check_version, limit)
+        self.conversion_chains = {}
+        # converters by lower case output format name
+        self.output_index = None
+
+    def get_all_converters(self):
+        return [converter for converters in self.converters_dict.values() for converter in converters]
+
+
 class Converters(object):
     # Singleton
-    class __Converters:
+    class __Converters(object):
         def __init__(self):
-            self.converters_dict = {}
+            # readers use the current snapshot without locking, writers publish a new one (copy on write)
+            self.snapshot = _ConvertersSnapshot({})
+            self.write_lock = threading.Lock()
+            for input_format_spec, output_format_spec, xsl_name in BUILTIN_XSL_CONVERTERS:
+                self.add_converter(XSLConverter(_get_declared_format(*input_format_spec),
+                                                _get_declared_format(*output_format_spec),
+                                                os.path.join(XSL_DIRECTORY, xsl_name)))
 
         def add_converter(self, converter):
             # TODO: Check duplicates
             key = converter.get_input_format().get_format_name()
-            if key not in self.converters_dict.keys():
-                self.converters_dict[key] = []
-            self.converters_dict[key] = [converter] + self.converters_dict[key]
+            with self.write_lock:
+                converters_dict = dict(self.snapshot.converters_dict)
+                converters_dict[key] = (converter,) + converters_dict.get(key, ())
+                self.snapshot = _ConvertersSnapshot(converters_dict)
 
         def set_converter(self, converter):
             key = converter.get_input_format().get_format_name()
-            if key not in self.converters_dict.keys():
-                self.converters_dict[key] = []
-            self.converters_dict[key] = [converter]
-
-        def add_converter_by_name(self, converter_name):
-            package_name, class_name = converter_name.rsplit('.', 1)
-            module = importlib.import_module(package_name)
-            converter_class = getattr(module, class_name)
-            converter = converter_class()
-            if issubclass(type(converter), Converter):
-                Converters().add_converter(converter)
+            with self.write_lock:
+                converters_dict = dict(self.snapshot.converters_dict)
+                converters_dict[key] = (converter,)
+                self.snapshot = _ConvertersSnapshot(converters_dict)
+
+        def remove_converter(self, converter):
+            key = converter.get_input_format().get_format_name()
+            with self.write_lock:
+                converters_dict = dict(self.snapshot.converters_dict)
+                converters = tuple([registered_converter for registered_converter in converters_dict.get(key, ())
+                                    if registered_converter is not converter])
+                if converters:
+                    converters_dict[key] = converters
+                else:
+                    converters_dict.pop(key, None)
+                self.snapshot = _ConvertersSnapshot(converters_dict)
+
+        def add_converter_by_name(self, converter_name, lazy=True):
+            """Register a converter by the full path of its class, optionally followed by its declared formats
+            as ':<input format>:<output format>', a format being a name or name/version.
+
+            A converter with declared formats, or shipped with the extension, is registered as a LazyConverter
+            and only imported for its first conversion, the others are imported and instantiated now.
+            """
+            converter_spec = converter_name.split(':')
+            converter_name = converter_spec[0]
+            if len(converter_spec) == 3:
+                declared_formats = [tuple(format_spec.split('/', 1)) for format_spec in converter_spec[1:]]
+            elif len(converter_spec) == 1:
+                declared_formats = BUILTIN_CONVERTER_FORMATS.get(converter_name)
             else:
-                raise TypeError(
-                    'Converter class {converter_class} is not a subclass of {standard_converter_class}.'.format(
-                        converter_class=converter_class, standard_converter_class=Converter))
-            return
+                raise ValueError('Converter {0} must be given as <class path>:<input format>:<output format>'.format(
+                    ':'.join(converter_spec)))
+            if lazy and declared_formats:
+                input_format, output_format = [_get_declared_format(*format_spec) for format_spec in declared_formats]
+                if input_format and output_format:
+                    self.add_converter(LazyConverter(converter_name, input_format, output_format))
+                    return
+                # formats registered by the converter module itself
+                log.debug('Formats of converter {0} not registered, importing it'.format(converter_name))
+            self.add_converter(load_converter(converter_name))
 
         def get_num_converters(self):
-            num = 0
-            for key in self.converters_dict.keys():
-                for metadata_converter in self.converters_dict[key]:
-                    num += 1
-            return num
+            return sum([len(converters) for converters in self.snapshot.converters_dict.values()])
+
+        def get_converters_dict(self):
+            return dict([(format_name, list(converters))
+                         for format_name, converters in self.snapshot.converters_dict.items()])
 
         def get_all_converters(self):
-            converters_list = [item for sublist in self.converters_dict.values() for item in sublist]
-            return converters_list
+            return self.snapshot.get_all_converters()
+
+        def get_fingerprint(self):
+            # identifies the registered converters and the extension version, used to key cached conversions
+            snapshot = self.snapshot
+            if snapshot.fingerprint is None:
+                converter_descriptions = sorted([self._get_converter_description(converter)
+                                                 for converter in snapshot.get_all_converters()])
+                converter_descriptions += [get_extension_version()]
+                snapshot.fingerprint = hashlib.md5(u'\n'.join(converter_descriptions).encode('utf-8')).hexdigest()
+            return snapshot.fingerprint
+
+        def get_loaded_time(self):
+            """Return the UTC datetime the registered converters were last changed in this process."""
+            return self.snapshot.loaded_time
+
+        @staticmethod
+        def _get_converter_description(converter):
+            input_format = converter.get_input_format()
+            output_format = converter.get_output_format()
+            # a lazy converter is described as the converter it loads
+            converter_name = getattr(converter, 'converter_name', None) or '{0}.{1}'.format(
+                type(converter).__module__, type(converter).__name__)
+            return (u'{converter_name} {input_format}({input_version}) -> '
+                    u'{output_format}({output_version}) {xsl}').format(
+                converter_name=converter_name,
+                input_format=input_format.get_format_name(), input_version=input_format.get_version(),
+                output_format=output_format.get_format_name(), output_version=output_format.get_version(),
+                xsl=getattr(converter, 'xsl_path', ''))
 
         def get_converters_for_record(self, record, output_format=None, check_version=False):
             input_format = record.get_metadata_format()
             return self.get_converters_for_format(input_format, output_format, check_version)
 
-        def get_converters_for_format(self, input_format, output_format=None, check_version=False):
+        def get_converters_for_format(self, input_format, output_format=None, check_version=False, snapshot=None):
+            snapshot = snapshot or self.snapshot
             matching_converters_list = []
-            for converter in self.converters_dict.get(input_format.get_format_name(), []):
+            for converter in snapshot.converters_dict.get(input_format.get_format_name(), ()):
                 if converter.can_convert_format(input_format, output_format, check_version=check_version):
                     matching_converters_list += [converter]
             return matching_converters_list
 
+        def get_converters_to_format(self, output_format, snapshot=None):
+            snapshot = snapshot or self.snapshot
+            output_index = snapshot.output_index
+            if output_index is None:
+                output_index = {}
+                for converter in snapshot.get_all_converters():
+                    output_name = converter.get_output_format().get_format_name().lower()
+                    output_index[output_name] = output_index.get(output_name, []) + [converter]
+                snapshot.output_index = output_index
+            return output_index.get(output_format.get_format_name().lower(), [])
+
         def find_conversion_chain(self, input_format, output_format, check_version=False, limit=3):
-            initial_converters = self.get_converters_for_format(input_format, check_version=check_version)
+            # planned once per pair of formats, until the converters change
+            snapshot = self.snapshot
+            key = (input_format.get_format_name(), input_format.get_version(), output_format.get_format_name(),
+                   output_format.get_version(), check_version, limit)
+            conversion_chain = snapshot.conversion_chains.get(key)
+            if conversion_chain is None:
+                conversion_chain = []
+                if self.get_converters_to_format(output_format, snapshot=snapshot):
+                    conversion_chain = self._plan_conversion_chain(input_format, output_format, check_version, limit,
+                                                                   snapshot=snapshot)
+                snapshot.conversion_chains[key] = conversion_chain
+            return list(conversion_chain)
+
+        def get_reachable_formats(self, input_format, check_version=False, limit=3):
+            """Return the output formats that can be reached from the input format in at most limit conversions."""
+            snapshot = self.snapshot
+            reachable_formats = []
+            current_formats = [input_format]
+            visited_converters = set()
+            for i in range(limit):
+                next_formats = []
+                for current_format in current_formats:
+                    for converter in self.get_converters_for_format(current_format, check_version=check_version,
+                                                                    snapshot=snapshot):
+                        if id(converter) in visited_converters:
+                            continue
+                        visited_converters.add(id(converter))
+                        converter_output_format = converter.get_output_format()
+                        if converter_output_format not in reachable_formats:
+                            reachable_formats += [converter_output_format]
+                            next_formats += [converter_output_format]
+                current_formats = next_formats
+            return reachable_formats
+
+        def _plan_conversion_chain(self, input_format, output_format, check_version=False, limit=3, snapshot=None):
+            snapshot = snapshot or self.snapshot
+            initial_converters = self.get_converters_for_format(input_format, check_version=check_version,
+                                                                snapshot=snapshot)
 
             converter_chains = []
             for converter in initial_converters:
@@ -162,9 +392,10 @@ class Converters(object):
                 for converter_chain in converter_chains:
                     last_converter = converter_chain[-1]
                     next_converters = self.get_converters_for_format(last_converter.get_output_format(),
-                                                                     check_version=check_version)
+                                                                     check_version=check_version, snapshot=snapshot)
+                    chain_converter_ids = set([id(chain_converter) for chain_converter in converter_chain])
                     for converter in next_converters:
-                        if converter not in converter_chain:
+                        if id(converter) not in chain_converter_ids:
                             new_converter_chain = converter_chain + [converter]
                             if converter.can_convert_to_format(output_format, check_version=check_version):
                                 return new_converter_chain
@@ -182,9 +413,15 @@ class Converters(object):
                                                                                       output_format.get_format_name()))
                 return None
             latest_record = record
-            for converter in conversion_chain:
-                converted_record = converter.convert(latest_record)
-                latest_record = converted_record
+            with timed('conversion', output_format.get_format_name()):
+                for converter in conversion_chain:
+                    with timed('converter', u'{0}->{1}'.format(converter.get_input_format().get_format_name(),
+                                                               converter.get_output_format().get_format_name())):
+                        converted_record = converter.convert(latest_record)
+                    # the next converters of the chain build their URLs from the same context
+                    if converted_record.export_context is None:
+                        converted_record.export_context = latest_record.export_context
+                    latest_record = converted_record
             return latest_record
 
         def __repr__(self):
@@ -195,7 +432,7 @@ class Converters(object):
 
         def __unicode__(self):
             return u'Converters ({num_converters}): {converters_dict}'.format(
-                num_converters=self.get_num_converters(), converters_dict=self.converters_dict)
+                num_converters=self.get_num_converters(), converters_dict=self.get_converters_dict())
 
     instance = None
 
@@ -1,14 +1,10 @@
 import ckanext
 
-import ckan.lib.helpers as helpers
-from ckan.lib.helpers import url_for
-
 from ckanext.package_converter.model.metadata_format import MetadataFormats
 from ckanext.package_converter.model.converter import BaseConverter
 from ckanext.package_converter.model.record import Record, JSONRecord
 
 import collections
-import json
 
 from dateutil.parser import parse
 import string
@@ -29,8 +25,8 @@ class BibtexConverter(BaseConverter):
 
     def convert(self, record):
         if self.can_convert(record):
-            dataset_dict = record.get_json_dict()
-            converted_content = self._bibtex_convert_dataset(dataset_dict)
+            dataset_dict = record.get_decoded_dict()
+            converted_content = self._bibtex_convert_dataset(dataset_dict, record.get_export_context())
             converted_record = Record(self.output_format, converted_content)
             return converted_record
         else:
@@ -43,14 +39,14 @@ class BibtexConverter(BaseConverter):
     def __unicode__(self):
         return super(BibtexConverter, self).__unicode__() + u'BibTex Converter '
 
-    def _bibtex_convert_dataset(self, dataset_dict):
+    def _bibtex_convert_dataset(self, dataset_dict, export_context):
 
         # name as identifier (plus year later)
         name = dataset_dict['name']
         converted_package = u"@misc { " + name
 
         # year (add to name) and journal
-        publication = json.loads(dataset_dict.get('publication', '{}'))
+        publication = dataset_dict.get_decoded('publication', {})
         publication_year = publication["publication_year"]
 
         converted_package += u'-{0}'.format(publication_year)
@@ -63,7 +59,7 @@ class BibtexConverter(BaseConverter):
         converted_package += u',\n\t title = "' + title + u'"'
 
         # author
-        authors = json.loads(dataset_dict.get('author', '[]'))
+        authors = dataset_dict.get_decoded('author', [])
         author_names = []
         for author in authors:
             author_name = ""
@@ -80,9 +76,7 @@ class BibtexConverter(BaseConverter):
 
         # url
         # dataset url as information
-        protocol, host = helpers.get_site_protocol_and_host()
-        url = protocol + '://' + host + url_for(controller='dataset', action='read',
-                                                id=dataset_dict.get('name', ''))
+        url = export_context.get_package_url(dataset_dict.get('name', ''))
         print(url)
         converted_package += u',\n\t url = "' + url + '"'
 
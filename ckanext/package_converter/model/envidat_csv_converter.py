@@ -1,4 +1,3 @@
-import json
 import unicodedata
 from logging import getLogger
 
@@ -19,7 +18,7 @@ class CsvConverter(BaseConverter):
 
     def convert(self, record):
         if self.can_convert(record):
-            dataset_dict = record.get_json_dict()
+            dataset_dict = record.get_decoded_dict()
             converted_content = self._csv_convert_dataset(dataset_dict)
             converted_record = Record(self.output_format, converted_content)
             return converted_record
@@ -43,7 +42,9 @@ class CsvConverter(BaseConverter):
                 if type(value) is not list and type(value) is not dict:
                     # check if it is a json
                     try:
-                        value_json = json.loads(value)
+                        value_json = dataset_dict.get_decoded(key)
+                        if value_json is None:
+                            raise ValueError('not a JSON value')
                         if type(value_json) is dict:
                             value_dict = value_json
                             for subfield_key, subfield_value in value_dict.items():
@@ -86,7 +87,8 @@ class CsvConverter(BaseConverter):
 
     def _format_value(self, value):
         try:
-            text_value = unicodedata.normalize('NFKD', value).encode('ascii', 'ignore')
+            # text again after dropping the non ascii characters, bytes on Python 3
+            text_value = unicodedata.normalize('NFKD', value).encode('ascii', 'ignore').decode('ascii')
         except:
             text_value = str(value)
         return text_value.replace('"', '').replace("'", "").replace('\n', ' ').replace('\r', ' ')
@@ -1,14 +1,10 @@
 import ckanext
 
-import ckan.lib.helpers as helpers
-import ckan.plugins.toolkit as toolkit
-
 from ckanext.package_converter.model.metadata_format import MetadataFormats
 from ckanext.package_converter.model.converter import BaseConverter
-from ckanext.package_converter.model.record import Record, JSONRecord, XMLRecord
+from ckanext.package_converter.model.record import JSONRecord, XMLRecord
 
 import collections
-from xmltodict import unparse
 import json
 
 from dateutil.parser import parse
@@ -30,9 +26,9 @@ class DcatApChConverter(BaseConverter):
 
     def convert(self, record):
         if self.can_convert(record):
-            dataset_dict = record.get_json_dict()
-            converted_content = self._dcat_ap_ch_convert_dataset(dataset_dict)
-            converted_record = XMLRecord.from_record(Record(self.output_format, converted_content))
+            dataset_dict = record.get_decoded_dict()
+            dcat_metadata_dict = self._dcat_ap_ch_convert_dataset(dataset_dict, record.get_export_context())
+            converted_record = XMLRecord.from_dict(self.output_format, dcat_metadata_dict, short_empty_elements=True)
             return converted_record
         else:
             raise TypeError(('Converter is not compatible with the record format {record_format}({record_version}). ' +
@@ -44,7 +40,7 @@ class DcatApChConverter(BaseConverter):
     def __unicode__(self):
         return super(DcatApChConverter, self).__unicode__() + u'DCAT_AP_CH Converter '
 
-    def _dcat_ap_ch_convert_dataset(self, dataset_dict):
+    def _dcat_ap_ch_convert_dataset(self, dataset_dict, export_context):
 
         extras_dict = self._extras_as_dict(dataset_dict.get('extras', {}))
 
@@ -63,9 +59,7 @@ class DcatApChConverter(BaseConverter):
         md_metadata_dict['@xmlns:schema'] = "http://schema.org/"
 
         # get the dataset url
-        protocol, host = helpers.get_site_protocol_and_host()
-        package_url = protocol + '://' + host + toolkit.url_for(controller='dataset', action='read',
-                                                                id=dataset_dict.get('name', ''))
+        package_url = export_context.get_package_url(dataset_dict.get('name', ''))
         md_metadata_dict['dcat:Dataset'] = {'@rdf:about': package_url}
 
         # identifier (MANDATORY)
@@ -97,12 +91,12 @@ class DcatApChConverter(BaseConverter):
             }
 
         # publication (MANDATORY)
-        publisher_name = json.loads(dataset_dict.get('publication', '{}')).get('publisher', '')
+        publisher_name = dataset_dict.get_decoded('publication', {}).get('publisher', '')
         publisher = {'rdf:Description': {'rdfs:label': publisher_name}}
         md_metadata_dict['dcat:Dataset']['dct:publisher'] = publisher
 
         # contact point (MANDATORY)
-        maintainer = json.loads(dataset_dict.get('maintainer', '{}'))
+        maintainer = dataset_dict.get_decoded('maintainer', {})
         maintainer_name = ""
         if maintainer.get('given_name'):
             maintainer_name += maintainer['given_name'].strip() + ' '
@@ -174,9 +168,7 @@ class DcatApChConverter(BaseConverter):
             resource_name = resource.get('name', resource_id)
             resource_notes = self.clean_markup(resource.get('description', 'No description'))
             resource_page_url = package_url + '/resource/' + resource.get('id', '')
-            resource_url = protocol + '://' + host + toolkit.url_for(controller='resource', action='read',
-                                                                     id=dataset_dict.get('id', ''),
-                                                                     resource_id=resource.get('id', ''))
+            resource_url = export_context.get_resource_url(dataset_dict.get('id', ''), resource.get('id', ''))
 
             # >2013-05-11T00:00:00Z</dct:issued>
             resource_creation = parse(resource['created']).strftime("%Y-%m-%dT%H:%M:%SZ")
@@ -244,10 +236,7 @@ class DcatApChConverter(BaseConverter):
         dcat_metadata_dict = collections.OrderedDict()
         dcat_metadata_dict['rdf:RDF'] = md_metadata_dict
 
-        # Convert to xml
-        converted_package = unparse(dcat_metadata_dict, short_empty_elements=True, pretty=True)
-
-        return converted_package
+        return dcat_metadata_dict
 
     # extras as a simple dictionary
     def _extras_as_dict(self, extras):
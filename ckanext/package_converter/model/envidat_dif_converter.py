@@ -1,15 +1,10 @@
-from ckan.common import config
-import ckan.lib.helpers as helpers
-import ckan.plugins.toolkit as toolkit
-
 from ckanext.package_converter.model.metadata_format import MetadataFormats
 from ckanext.package_converter.model.converter import BaseConverter
-from ckanext.package_converter.model.record import Record, JSONRecord, XMLRecord
+from ckanext.package_converter.model.record import JSONRecord, XMLRecord
+from ckanext.package_converter.model.geometry import Geometry
 
 import collections
-from xmltodict import unparse
 import json
-import sys
 import copy
 
 from logging import getLogger
@@ -28,16 +23,15 @@ class GcmdDifConverter(BaseConverter):
 
     def convert(self, record):
         if self.can_convert(record):
-            dataset_dict = record.get_json_dict()
-            converted_content = self._dif_convert_dataset(dataset_dict)
-            converted_record = XMLRecord.from_record(Record(self.output_format, converted_content))
+            dataset_dict = record.get_decoded_dict()
+            export_context = record.get_export_context()
+            gcmd_dif_dict = self._dif_convert_dataset(dataset_dict, export_context)
+            converted_record = XMLRecord.from_dict(self.output_format, gcmd_dif_dict)
 
             # fix issue with dif included XSD
-            current_url = helpers.full_current_url()
-            site_url = current_url.split('//', 3)[0] + '//' + current_url.split('://', 1)[1].split('/', 1)[0]
             # log.debug(" **** Validating record..." + str(converted_record.validate
-            # (custom_replace=[('xs:include schemaLocation="U', 'xs:include schemaLocation="'+ site_url
-            # +'/package_converter_xsd/U')])) + ' ****')
+            # (custom_replace=[('xs:include schemaLocation="U', 'xs:include schemaLocation="'
+            # + export_context.site_root + '/package_converter_xsd/U')])) + ' ****')
             return converted_record
         else:
             raise TypeError(('Converter is not compatible with the record format {record_format}({record_version}). ' +
@@ -49,7 +43,7 @@ class GcmdDifConverter(BaseConverter):
     def __unicode__(self):
         return super(GcmdDifConverter, self).__unicode__() + u'GCMD DIF Converter '
 
-    def _dif_convert_dataset(self, dataset_dict):
+    def _dif_convert_dataset(self, dataset_dict, export_context):
 
         # some values only as custom fields
         extras_dict = self._extras_as_dict(dataset_dict.get('extras', {}))
@@ -81,7 +75,7 @@ class GcmdDifConverter(BaseConverter):
         ## "Dataset_Creator" organization
         author_names = []
         try:
-            for author in json.loads(dataset_dict.get('author', '[]')):
+            for author in dataset_dict.get_decoded('author', []):
                 author_name = ""
                 if author.get('given_name'):
                     author_name += author['given_name'].strip() + ' '
@@ -94,7 +88,7 @@ class GcmdDifConverter(BaseConverter):
 
         ## "Dataset_Editor" maintainer
         try:
-            maintainer = json.loads(dataset_dict.get('maintainer', '{}'))
+            maintainer = dataset_dict.get_decoded('maintainer', {})
 
             maintainer_name = ""
             if maintainer.get('given_name'):
@@ -110,15 +104,15 @@ class GcmdDifConverter(BaseConverter):
 
         ## "Dataset_Series_Name" 
         ## "Dataset_Release_Date"
-        publication_year = json.loads(dataset_dict.get('publication', '{}')).get('publication_year', '')
+        publication_year = dataset_dict.get_decoded('publication', {}).get('publication_year', '')
         dif_metadata_dict['Dataset_Citation']['Dataset_Release_Date'] = publication_year
 
         ## "Dataset_Release_Place" 
         dif_metadata_dict['Dataset_Citation']['Dataset_Release_Place'] = 'Birmensdorf, Switzerland'
 
         ## "Dataset_Publisher"
-        dif_metadata_dict['Dataset_Citation']['Dataset_Publisher'] = json.loads(
-            dataset_dict.get('publication', '{}')).get('publisher', '')
+        dif_metadata_dict['Dataset_Citation']['Dataset_Publisher'] = dataset_dict.get_decoded(
+            'publication', {}).get('publisher', '')
 
         ## "Version"
         dif_metadata_dict['Dataset_Citation']['Version'] = dataset_dict.get('version', '')
@@ -136,13 +130,11 @@ class GcmdDifConverter(BaseConverter):
             identifier['Identifier'] = 'doi:' + doi.strip()
             dif_metadata_dict['Dataset_Citation']['Persistent_Identifier'] = identifier
             ## "Online_Resource"
-        protocol, host = helpers.get_site_protocol_and_host()
-        package_url = protocol + '://' + host + toolkit.url_for(controller='dataset', action='read',
-                                                                id=dataset_dict.get('name', ''))
+        package_url = export_context.get_package_url(dataset_dict.get('name', ''))
         dif_metadata_dict['Dataset_Citation']['Online_Resource'] = package_url
 
         # "Personnel"
-        maintainer = json.loads(dataset_dict.get('maintainer', '{}'))
+        maintainer = dataset_dict.get_decoded('maintainer', {})
         dif_metadata_dict['Personnel'] = collections.OrderedDict()
         dif_metadata_dict['Personnel']['Role'] = "TECHNICAL CONTACT"
         dif_metadata_dict['Personnel']['Contact_Person'] = collections.OrderedDict()
@@ -199,21 +191,18 @@ class GcmdDifConverter(BaseConverter):
         ## <xs:element name="Zone_Identifier" type="xs:string" minOccurs="0"/>
 
         ## "Geometry" [1]
-        try:
-            spatial = json.loads(dataset_dict.get('spatial', '{}'))
-        except:
-            spatial = {}
-        if spatial:
+        # parsed once per record, shared with the other converters
+        geometry = dataset_dict.get_parsed('spatial', Geometry)
+        if geometry:
             dif_metadata_dict['Spatial_Coverage']['Geometry'] = collections.OrderedDict()
             dif_metadata_dict['Spatial_Coverage']['Geometry']['Coordinate_System'] = 'CARTESIAN'
             ### "Bounding_Rectangle"
             bounding_rectangle = collections.OrderedDict()
-            bound_box_coordinates = self._get_bounding_rectangle(spatial.get('coordinates', []))
+            bound_box_coordinates = geometry.get_bounding_box()
+            center_longitude, center_latitude = geometry.get_center()
             bounding_rectangle["Center_Point"] = collections.OrderedDict()
-            bounding_rectangle["Center_Point"]["Point_Longitude"] = str(
-                (bound_box_coordinates[1] + bound_box_coordinates[0]) / 2.0)
-            bounding_rectangle["Center_Point"]["Point_Latitude"] = str(
-                (bound_box_coordinates[3] + bound_box_coordinates[2]) / 2.0)
+            bounding_rectangle["Center_Point"]["Point_Longitude"] = str(center_longitude)
+            bounding_rectangle["Center_Point"]["Point_Latitude"] = str(center_latitude)
             bounding_rectangle["Southernmost_Latitude"] = str(max(bound_box_coordinates[2], -90))
             bounding_rectangle["Northernmost_Latitude"] = str(min(bound_box_coordinates[3], 90))
             bounding_rectangle["Westernmost_Longitude"] = str(max(bound_box_coordinates[0], 0))
@@ -221,23 +210,23 @@ class GcmdDifConverter(BaseConverter):
             dif_metadata_dict['Spatial_Coverage']['Geometry']['Bounding_Rectangle'] = bounding_rectangle
 
             ### <xs:element name="Point" type="Point"/>
-            if spatial.get('type') == 'Point':
+            if geometry.type == 'Point':
                 dif_metadata_dict['Spatial_Coverage']['Geometry']['Point'] = collections.OrderedDict()
                 dif_metadata_dict['Spatial_Coverage']['Geometry']['Point']['Point_Longitude'] = bound_box_coordinates[0]
                 dif_metadata_dict['Spatial_Coverage']['Geometry']['Point']['Point_Latitude'] = bound_box_coordinates[3]
                 latitude = bound_box_coordinates[3]
-            elif spatial.get('type') == 'MultiPoint':
+            elif geometry.type == 'MultiPoint':
                 points = []
-                for coordinate_pair in spatial.get('coordinates', []):
+                for coordinate_pair in geometry.coordinates:
                     point = collections.OrderedDict()
                     point['Point_Longitude'] = str(coordinate_pair[0])
                     point['Point_Latitude'] = str(coordinate_pair[1])
                     points += [point]
                 dif_metadata_dict['Spatial_Coverage']['Geometry']['Point'] = points
-            elif spatial.get('type') == 'Polygon':
+            elif geometry.type == 'Polygon':
                 ### <xs:element name="Polygon" type="GPolygon"/>
                 points = []
-                for coordinate_pair in spatial.get('coordinates', [])[0]:
+                for coordinate_pair in geometry.get_exterior_ring():
                     point = collections.OrderedDict()
                     point['Point_Longitude'] = str(coordinate_pair[0])
                     point['Point_Latitude'] = str(coordinate_pair[1])
@@ -245,7 +234,7 @@ class GcmdDifConverter(BaseConverter):
                 if len(points) > 1:
                     points.pop()
 
-                if self._is_counter_clockwise(points):
+                if geometry.is_counter_clockwise():
                     log.debug(dataset_dict.get('name', '') + " ** Counterclockwise REVERSING!! **")
                     points.reverse()
                 else:
@@ -323,9 +312,8 @@ class GcmdDifConverter(BaseConverter):
         # TODO: find paper citation in the description and parse it to this element
 
         # TODO: test Multimedia_Sample element
-        thumbnail = config.get('package_converter.thumbnail', '')
-        if thumbnail:
-            thumbnail_url = helpers.url_for_static_or_external(thumbnail, qualified=True)
+        thumbnail_url = export_context.thumbnail_url
+        if thumbnail_url:
             dif_metadata_dict['Multimedia_Sample'] = collections.OrderedDict()
             dif_metadata_dict['Multimedia_Sample']['URL'] = thumbnail_url
 
@@ -393,10 +381,7 @@ class GcmdDifConverter(BaseConverter):
         gcmd_dif_dict = collections.OrderedDict()
         gcmd_dif_dict['DIF'] = dif_metadata_dict
 
-        # Convert to xml
-        converted_package = unparse(gcmd_dif_dict, pretty=True)
-
-        return converted_package
+        return gcmd_dif_dict
 
     # extract keywords from tags
     def _get_keywords(self, data_dict):
@@ -517,38 +502,3 @@ class GcmdDifConverter(BaseConverter):
         lang_code = code.lower()[:2]
         lookup_dict = {'en': 'English', 'de': 'German', 'it': 'Italian', 'fr': 'French'}  # , 'ro':'roh'}
         return lookup_dict.get(lang_code, 'English').title()
-
-    def _get_bounding_rectangle(self, coordinates):
-        flatten_coordinates = coordinates
-        while type(flatten_coordinates[0]) is list:
-            flatten_coordinates = [item for sublist in flatten_coordinates for item in sublist]
-        longitude_coords = flatten_coordinates[0:][::2]
-        latitude_coords = flatten_coordinates[1:][::2]
-        return ([min(longitude_coords), max(longitude_coords), min(latitude_coords), max(latitude_coords)])
-
-    def _is_counter_clockwise(self, points):
-
-        if len(points) < 3:
-            return False
-
-        try:
-            akku = 0
-
-            for i in range(len(points)):
-                p1 = points[i]
-                p2 = points[0]
-
-                if i + 1 < len(points):
-                    p2 = points[i + 1]
-
-                akku += (float(p2['Point_Longitude']) - float(p1['Point_Longitude'])) * (
-                        float(p2['Point_Latitude']) + float(p1['Point_Latitude']))
-
-            if akku >= 0:
-                return False
-            else:
-                return True
-        except:
-            log.error("Unexpected error converting to float (_is_counter_clockwise):", sys.exc_info()[0])
-
-        return False
@@ -1,19 +1,16 @@
 import ckanext
 
-import ckan.lib.helpers as helpers
-import ckan.plugins.toolkit as toolkit
-
 from ckanext.package_converter.model.metadata_format import MetadataFormats
 from ckanext.package_converter.model.converter import BaseConverter
-from ckanext.package_converter.model.record import Record, JSONRecord, XMLRecord
+from ckanext.package_converter.model.record import JSONRecord, XMLRecord
+from ckanext.package_converter.model.geometry import Geometry
 
 import collections
-from xmltodict import unparse
-import json
 
 from dateutil.parser import parse
 import string
 import copy
+import warnings
 
 from logging import getLogger
 
@@ -30,9 +27,9 @@ class Iso19139Converter(BaseConverter):
 
     def convert(self, record):
         if self.can_convert(record):
-            dataset_dict = record.get_json_dict()
-            converted_content = self._iso_convert_dataset(dataset_dict)
-            converted_record = XMLRecord.from_record(Record(self.output_format, converted_content))
+            dataset_dict = record.get_decoded_dict()
+            iso_dict = self._iso_convert_dataset(dataset_dict, record.get_export_context())
+            converted_record = XMLRecord.from_dict(self.output_format, iso_dict)
             # log.debug(" **** Validating record..." + str(converted_record.validate()) + ' ****')
             return converted_record
         else:
@@ -45,7 +42,7 @@ class Iso19139Converter(BaseConverter):
     def __unicode__(self):
         return super(Iso19139Converter, self).__unicode__() + u'ISO19139 Converter '
 
-    def _iso_convert_dataset(self, dataset_dict):
+    def _iso_convert_dataset(self, dataset_dict, export_context):
 
         extras_dict = self._extras_as_dict(dataset_dict.get('extras', {}))
 
@@ -90,7 +87,7 @@ class Iso19139Converter(BaseConverter):
             '@codeListValue': "dataset"}}
 
         # Point of Contact (M)
-        maintainer = json.loads(dataset_dict.get('maintainer', '{}'))
+        maintainer = dataset_dict.get_decoded('maintainer', {})
 
         maintainer_name = ""
         if maintainer.get('given_name'):
@@ -227,11 +224,7 @@ class Iso19139Converter(BaseConverter):
             md_data_id['gmd:topicCategory'] = {'gmd:MD_TopicCategoryCode': self._cap_code(category)}
 
         # temporal extent
-        dates = []
-        try:
-            dates = json.loads(dataset_dict.get('date', '[]'))
-        except:
-            dates = []
+        dates = dataset_dict.get_decoded('date', [])
         gml_id_index = 0
         for date in dates:
             gml_id_index += 1
@@ -255,25 +248,23 @@ class Iso19139Converter(BaseConverter):
             md_data_id['gmd:extent']['gmd:EX_Extent']['gmd:temporalElement'] = {'gmd:EX_TemporalExtent': time_extent}
 
         # geographic extent
-        try:
-            spatial = json.loads(dataset_dict.get('spatial', '{}'))
-        except:
-            spatial = {}
-        if spatial:
+        # parsed once per record, shared with the other converters
+        geometry = dataset_dict.get_parsed('spatial', Geometry)
+        if geometry:
             geographic_element = collections.OrderedDict()
-            if spatial.get('type') == 'Point':
+            if geometry.type == 'Point':
                 gml_id_index += 1
                 point_id = 'P' + "%03d" % (gml_id_index,)
                 coordinates = []
-                for coordinate in spatial.get('coordinates', []):
+                for coordinate in geometry.coordinates:
                     coordinates += [str(coordinate)]
                 point_element = {'@gml:id': point_id, 'gml:pos': ' '.join(coordinates)}
                 geographic_element = {'gmd:EX_BoundingPolygon': {'gmd:polygon': {'gml:Point': point_element}}}
-            elif spatial.get('type') == 'MultiPoint':
+            elif geometry.type == 'MultiPoint':
                 gml_id_index += 1
                 multi_point_id = 'MP' + "%03d" % (gml_id_index,)
                 multi_point_element = {'@gml:id': multi_point_id, 'gml:pointMember': []}
-                for coordinate_pair in spatial.get('coordinates', []):
+                for coordinate_pair in geometry.coordinates:
                     gml_id_index += 1
                     point_id = 'P' + "%03d" % (gml_id_index,)
                     coordinates = ' '.join([str(coordinate_pair[0]), str(coordinate_pair[1])])
@@ -282,8 +273,8 @@ class Iso19139Converter(BaseConverter):
                 geographic_element = {
                     'gmd:EX_BoundingPolygon': {'gmd:polygon': {'gml:MultiPoint': multi_point_element}}}
             else:
-                coordinates = spatial.get('coordinates', [])[0]
-                if self.is_a_box(coordinates):
+                coordinates = geometry.get_exterior_ring()
+                if geometry.is_a_box():
                     bounding_box = collections.OrderedDict()
                     bounding_box['gmd:westBoundLongitude'] = {
                         'gco:Decimal': str(min(coordinates[0][0], coordinates[2][0]))}
@@ -336,20 +327,17 @@ class Iso19139Converter(BaseConverter):
         online_resources = []
 
         # dataset url as information
-        protocol, host = helpers.get_site_protocol_and_host()
-        package_url = protocol + '://' + host + toolkit.url_for(controller='dataset', action='read',
-                                                                id=dataset_dict.get('name', ''))
+        package_url = export_context.get_package_url(dataset_dict.get('name', ''))
         online_resource_dataset = self.get_online_resource(package_url, 'dataset metadata', 'information')
         online_resources += [online_resource_dataset]
 
         # loop through resources
         for resource in dataset_dict.get('resources', []):
             resource_name = resource.get('name', resource.get('id', 'DATASET RESOURCE'))
-            resource_url = resource.get('url', toolkit.url_for(controller='resource', action='read',
-                                                               id=dataset_dict.get('id', ''),
-                                                               resource_id=resource.get('id', '')))
+            resource_url = resource.get('url', export_context.url_for('resource', id=dataset_dict.get('id', ''),
+                                                                      resource_id=resource.get('id', '')))
             # check if restricted
-            if not helpers.is_url(resource_url):
+            if not export_context.is_url(resource_url):
                 log.debug('resource is restricted: ' + resource_name)
                 resource_url = package_url + '/resource/' + resource.get('id', '')
 
@@ -365,10 +353,7 @@ class Iso19139Converter(BaseConverter):
         iso_dict = collections.OrderedDict()
         iso_dict['gmd:MD_Metadata'] = md_metadata_dict
 
-        # Convert to xml
-        converted_package = unparse(iso_dict, pretty=True)
-
-        return converted_package
+        return iso_dict
 
     def _get_or_missing(self, data_dict, tag, ignore_case=False):
         if ignore_case:
@@ -402,16 +387,12 @@ class Iso19139Converter(BaseConverter):
     # Take date of type Available or the publication year
     def _get_publication_date(self, data_dict):
         publication_date = ''
-        dates = []
-        try:
-            dates = json.loads(data_dict.get('date', '[]'))
-        except:
-            dates = []
+        dates = data_dict.get_decoded('date', [])
         for date in dates:
             if date.get('date_type') == 'available':
                 publication_date = parse(date.get('date')).strftime("%Y-%m-%d")
         if not publication_date:
-            publication = json.loads(data_dict.get('publication', '{}'))
+            publication = data_dict.get_decoded('publication', {})
             publication_date = parse(publication["publication_year"] + '-12-31').strftime("%Y-%m-%d")
         return publication_date
 
@@ -436,14 +417,9 @@ class Iso19139Converter(BaseConverter):
 
     # checks spatially if the polygon is a box
     def is_a_box(self, coordinates):
-        if len(coordinates) == 5:
-            if coordinates[0] == coordinates[4]:
-                if ((coordinates[1] == [coordinates[0][0], coordinates[2][1]]) and
-                        (coordinates[3] == [coordinates[2][0], coordinates[0][1]]) and
-                        (coordinates[0][0] != coordinates[2][0]) and
-                        (coordinates[0][1] != coordinates[2][1])):
-                    return True
-        return False
+        warnings.warn('Iso19139Converter.is_a_box is deprecated, use Geometry.is_a_box', DeprecationWarning,
+                      stacklevel=2)
+        return Geometry({'type': 'Polygon', 'coordinates': [coordinates]}).is_a_box()
 
     # extract keywords from tags
     def get_keywords(self, data_dict):
@@ -1,8 +1,5 @@
-import json
 from logging import getLogger
 
-import ckan.lib.helpers as helpers
-import ckan.plugins.toolkit as toolkit
 from ckanext.package_converter.model.converter import BaseConverter
 from ckanext.package_converter.model.metadata_format import MetadataFormats
 from ckanext.package_converter.model.record import Record
@@ -20,8 +17,8 @@ class ReadmeConverter(BaseConverter):
 
     def convert(self, record):
         if self.can_convert(record):
-            dataset_dict = record.get_json_dict()
-            converted_content = self._bibtex_convert_dataset(dataset_dict)
+            dataset_dict = record.get_decoded_dict()
+            converted_content = self._bibtex_convert_dataset(dataset_dict, record.get_export_context())
             converted_record = Record(self.output_format, converted_content)
             return converted_record
         else:
@@ -34,7 +31,7 @@ class ReadmeConverter(BaseConverter):
     def __unicode__(self):
         return super(ReadmeConverter, self).__unicode__() + u'Readme Converter '
 
-    def _bibtex_convert_dataset(self, dataset_dict):
+    def _bibtex_convert_dataset(self, dataset_dict, export_context):
 
         converted_package = u'\n\n'
 
@@ -47,9 +44,7 @@ class ReadmeConverter(BaseConverter):
             converted_package += u' - DOI: http://dx.doi.org/{0}\n'.format(doi)
 
         # url
-        protocol, host = helpers.get_site_protocol_and_host()
-        url = protocol + '://' + host + toolkit.url_for(controller='dataset', action='read',
-                                                        id=dataset_dict.get('name', ''))
+        url = export_context.get_package_url(dataset_dict.get('name', ''))
         converted_package += u' - URL: ' + url + '\n\n'
 
         # name  
@@ -63,7 +58,7 @@ class ReadmeConverter(BaseConverter):
         converted_package += tag + '\n' + self.get_underline(tag, '-') + '\n' + title + '\n\n'
 
         # year (add to name) and journal
-        publication = json.loads(dataset_dict.get('publication', '{}'))
+        publication = dataset_dict.get_decoded('publication', {})
         publication_year = publication["publication_year"]
         publisher = publication["publisher"]
 
@@ -74,7 +69,7 @@ class ReadmeConverter(BaseConverter):
         # author
         tag = u" AUTHORS "
         converted_package += tag + '\n' + self.get_underline(tag, '-') + '\n'
-        authors = json.loads(dataset_dict.get('author', '[]'))
+        authors = dataset_dict.get_decoded('author', [])
         for author in authors:
             author_name = ""
             if author.get('given_name'):
@@ -99,7 +94,7 @@ class ReadmeConverter(BaseConverter):
         # dates
         tag = u" DATES "
         converted_package += tag + '\n' + self.get_underline(tag, '-') + '\n'
-        dates = json.loads(dataset_dict.get('date', '[]'))
+        dates = dataset_dict.get_decoded('date', [])
         for date in dates:
             date_text = date['date']
             date_type = date['date_type'].title()
@@ -107,7 +102,7 @@ class ReadmeConverter(BaseConverter):
         converted_package += u'\n'
 
         # funding info
-        funders = json.loads(dataset_dict.get('funding', '[]'))
+        funders = dataset_dict.get_decoded('funding', [])
 
         if funders:
             tag = u" ACKNOWLEDGEMENTS "
@@ -144,7 +139,7 @@ class ReadmeConverter(BaseConverter):
         # maintainer
         tag = u" CONTACT PERSON "
         converted_package += tag + '\n' + self.get_underline(tag, '-') + '\n'
-        maintainer = json.loads(dataset_dict.get('maintainer', ''))
+        maintainer = dataset_dict.get_decoded('maintainer', {})
         if maintainer:
             maintainer_name = ""
             if maintainer.get('given_name'):
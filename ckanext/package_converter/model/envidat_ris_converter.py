@@ -1,8 +1,5 @@
-import json
 from logging import getLogger
 
-import ckan.lib.helpers as helpers
-import ckan.plugins.toolkit as toolkit
 from ckanext.package_converter.model.converter import BaseConverter
 from ckanext.package_converter.model.metadata_format import MetadataFormats
 from ckanext.package_converter.model.record import Record
@@ -20,8 +17,8 @@ class RisConverter(BaseConverter):
 
     def convert(self, record):
         if self.can_convert(record):
-            dataset_dict = record.get_json_dict()
-            converted_content = self._ris_convert_dataset(dataset_dict)
+            dataset_dict = record.get_decoded_dict()
+            converted_content = self._ris_convert_dataset(dataset_dict, record.get_export_context())
             converted_record = Record(self.output_format, converted_content)
             return converted_record
         else:
@@ -34,7 +31,7 @@ class RisConverter(BaseConverter):
     def __unicode__(self):
         return super(RisConverter, self).__unicode__() + u'RIS Converter '
 
-    def _ris_convert_dataset(self, dataset_dict):
+    def _ris_convert_dataset(self, dataset_dict, export_context):
 
         ris_list = []
 
@@ -46,7 +43,7 @@ class RisConverter(BaseConverter):
         ris_list += [u"T1  - " + title]
 
         #   AU  - Authors
-        authors = json.loads(dataset_dict.get('author', '[]'))
+        authors = dataset_dict.get_decoded('author', [])
         author_names = []
         for author in authors:
             author_name = ""
@@ -61,9 +58,7 @@ class RisConverter(BaseConverter):
             ris_list += [u"DO  - " + doi]
 
             #   UR  - dataset url as information
-        protocol, host = helpers.get_site_protocol_and_host()
-        url = protocol + '://' + host + toolkit.url_for(controller='dataset', action='read',
-                                                        id=dataset_dict.get('name', ''))
+        url = export_context.get_package_url(dataset_dict.get('name', ''))
         ris_list += [u"UR  - " + url]
 
         #   KW  - keywords (type default to theme)
@@ -72,7 +67,7 @@ class RisConverter(BaseConverter):
             ris_list += [u"KW  - " + keyword]
 
         #   PY  - publication year
-        publication = json.loads(dataset_dict.get('publication', '{}'))
+        publication = dataset_dict.get_decoded('publication', {})
         publication_year = publication["publication_year"]
         ris_list += [u"PY  - " + publication_year]
 
@@ -1,9 +1,6 @@
 import collections
-import json
 from logging import getLogger
 
-import ckan.lib.helpers as helpers
-import ckan.plugins.toolkit as toolkit
 from ckanext.package_converter.model.converter import BaseConverter
 from ckanext.package_converter.model.metadata_format import MetadataFormats
 from ckanext.package_converter.model.record import JSONRecord
@@ -21,8 +18,8 @@ class SchemaOrgDadatasetConverter(BaseConverter):
 
     def convert(self, record):
         if self.can_convert(record):
-            dataset_dict = record.get_json_dict()
-            converted_dict = self._schemaorg_convert_dataset(dataset_dict)
+            dataset_dict = record.get_decoded_dict()
+            converted_dict = self._schemaorg_convert_dataset(dataset_dict, record.get_export_context())
             converted_record = JSONRecord(self.output_format, converted_dict)
             return converted_record
         else:
@@ -35,7 +32,7 @@ class SchemaOrgDadatasetConverter(BaseConverter):
     def __unicode__(self):
         return super(SchemaOrgDadatasetConverter, self).__unicode__() + u'Schema.org Dataset Converter '
 
-    def _schemaorg_convert_dataset(self, dataset_dict):
+    def _schemaorg_convert_dataset(self, dataset_dict, export_context):
 
         converted_dict = collections.OrderedDict()
 
@@ -43,9 +40,7 @@ class SchemaOrgDadatasetConverter(BaseConverter):
         converted_dict["@type"] = "Dataset"
 
         # url id
-        protocol, host = helpers.get_site_protocol_and_host()
-        url_id = protocol + '://' + host + toolkit.url_for(controller='dataset', action='read',
-                                                           id=dataset_dict.get('id', ''))
+        url_id = export_context.get_package_url(dataset_dict.get('id', ''))
         converted_dict["@id"] = url_id
 
         # identifier (DOI)
@@ -57,9 +52,7 @@ class SchemaOrgDadatasetConverter(BaseConverter):
             converted_dict["identifier"]["value"] = 'https://doi.org/{0}'.format(doi)
 
         # url name
-        protocol, host = helpers.get_site_protocol_and_host()
-        url_name = protocol + '://' + host + toolkit.url_for(controller='dataset', action='read',
-                                                             id=dataset_dict.get('name', ''))
+        url_name = export_context.get_package_url(dataset_dict.get('name', ''))
         converted_dict["@url"] = url_name
 
         # title
@@ -69,7 +62,7 @@ class SchemaOrgDadatasetConverter(BaseConverter):
         # author
         converted_dict["author"] = []
 
-        authors = json.loads(dataset_dict.get('author', '[]'))
+        authors = dataset_dict.get_decoded('author', [])
         for author in authors:
             author_dict = collections.OrderedDict()
             if len(author.get("given_name", '').strip()) > 0:
@@ -102,7 +95,7 @@ class SchemaOrgDadatasetConverter(BaseConverter):
         converted_dict["inLanguage"] = dataset_dict.get('language', 'en')
 
         # publication date
-        publication = json.loads(dataset_dict.get('publication', '{}'))
+        publication = dataset_dict.get_decoded('publication', {})
         if publication:
             converted_dict["datePublished"] = publication.get("publication_year", "")
             converted_dict["publisher"] = {"name": publication.get("publisher", "EnviDat"), "@type": "Organization"}
@@ -0,0 +1,86 @@
+from six.moves.urllib.parse import urlparse
+
+from logging import getLogger
+
+log = getLogger(__name__)
+
+# url paths of the CKAN pages linked from the exports, by controller
+DEFAULT_URL_PATHS = {
+    'dataset': '/dataset/{id}',
+    'resource': '/dataset/{id}/resource/{resource_id}',
+    'dataset_resource': '/dataset/{id}/resource/{resource_id}',
+}
+
+DEFAULT_VALID_URL_SCHEMES = ('http', 'https', 'ftp')
+
+
+class ExportContext(object):
+    """Site URLs and URL builders used by the converters, resolved once per request or job.
+
+    Converters take them from the record they convert instead of the CKAN request globals, so a conversion runs
+    the same way in a request, a background job, a worker process or a benchmark. It only holds plain values
+    and can be pickled, the package names are loaded on first use by package_names_loader.
+    """
+
+    def __init__(self, site_url, site_root=None, url_paths=None, thumbnail_url='', related_url_prefix=None,
+                 valid_url_schemes=DEFAULT_VALID_URL_SCHEMES, package_names_loader=None):
+        self.site_url = site_url
+        if site_root is None:
+            parsed_url = urlparse(site_url)
+            site_root = u'{0}://{1}'.format(parsed_url.scheme, parsed_url.netloc)
+        # protocol and host only, no root path
+        self.site_root = site_root
+        self.url_paths = dict(DEFAULT_URL_PATHS)
+        self.url_paths.update(url_paths or {})
+        self.thumbnail_url = thumbnail_url
+        if related_url_prefix is None:
+            related_url_prefix = site_url + '/dataset'
+        self.related_url_prefix = related_url_prefix
+        self.valid_url_schemes = tuple(valid_url_schemes)
+        self.package_names_loader = package_names_loader
+        self.package_names = None
+
+    def url_for(self, controller, **kwargs):
+        """Return the path of the read page of a CKAN controller, like url_for(controller=..., action='read')."""
+        return self.url_paths[controller].format(**kwargs)
+
+    def get_package_url(self, id):
+        return self.site_root + self.url_for('dataset', id=id)
+
+    def get_resource_url(self, id, resource_id):
+        return self.site_root + self.url_for('resource', id=id, resource_id=resource_id)
+
+    def is_url(self, url):
+        try:
+            return urlparse(url).scheme in self.valid_url_schemes
+        except (AttributeError, TypeError, ValueError):
+            return False
+
+    def get_key(self):
+        """Return the URLs as a tuple, equal for contexts producing the same exports."""
+        return (self.site_url, self.site_root, tuple(sorted(self.url_paths.items())), self.thumbnail_url,
+                self.related_url_prefix, self.valid_url_schemes)
+
+    def get_package_names(self):
+        if self.package_names is None:
+            self.package_names = list(self.package_names_loader()) if self.package_names_loader else []
+        return self.package_names
+
+    def __repr__(self):
+        return 'ExportContext({0})'.format(self.site_url)
+
+
+# called for records converted without an export context
+_export_context_factory = None
+
+
+def set_export_context_factory(factory):
+    """Set the function returning the export context of records created without one, None to unset it."""
+    global _export_context_factory
+    _export_context_factory = factory
+
+
+def get_default_export_context():
+    if _export_context_factory is None:
+        raise ValueError('No export context given for the conversion and no export context factory set')
+    return _export_context_factory()
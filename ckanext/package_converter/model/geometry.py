@@ -0,0 +1,127 @@
+import functools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from logging import getLogger
+
+log = getLogger(__name__)
+
+# below, building the array costs more than it saves
+MIN_ARRAY_VERTICES = 500
+
+
+class Geometry(object):
+    """GeoJSON geometry of a dataset, its coordinates parsed once into a NumPy array for the spatial summaries.
+
+    The summaries return the original coordinate values, so they are written as given (8 and not 8.0).
+    For small geometries, without NumPy, or for coordinates it cannot hold in an array (rings of different
+    lengths), they are computed from the nested lists.
+    """
+
+    def __init__(self, geometry_dict):
+        self.type = geometry_dict.get('type')
+        self.coordinates = geometry_dict.get('coordinates', [])
+        self.values = None
+        self.bounding_box = None
+
+    def _get_values(self):
+        # all the coordinate values in a single array, keeping the nesting of the coordinates as its shape
+        if self.values is None:
+            self.values = False
+            if numpy is not None and _count_vertices(self.coordinates) >= MIN_ARRAY_VERTICES:
+                try:
+                    values = numpy.array(self.coordinates)
+                except (TypeError, ValueError):
+                    values = None
+                # integers and floats only, strings would not compare as in the lists
+                if values is not None and values.dtype.kind in 'if':
+                    self.values = values
+                else:
+                    log.debug('Coordinates of the {0} are not a numeric array'.format(self.type))
+        return self.values
+
+    def get_bounding_box(self):
+        """Return [west, east, south, north], the coordinates being flattened and read as longitude, latitude."""
+        if self.bounding_box is None:
+            values = self._get_values()
+            if values is False or not values.size:
+                self.bounding_box = self._get_flat_bounding_box()
+            else:
+                flat_values = values.reshape(-1)
+                indexes = []
+                for axis_values in [flat_values[0::2], flat_values[1::2]]:
+                    indexes += [int(numpy.argmin(axis_values)), int(numpy.argmax(axis_values))]
+                self.bounding_box = [self._get_original_value(values.shape, index * 2 + offset)
+                                     for index, offset in zip(indexes, [0, 0, 1, 1])]
+        return self.bounding_box
+
+    def _get_original_value(self, shape, flat_index):
+        return functools.reduce(lambda sequence, index: sequence[index],
+                                numpy.unravel_index(flat_index, shape), self.coordinates)
+
+    def _get_flat_bounding_box(self):
+        flatten_coordinates = self.coordinates
+        while type(flatten_coordinates[0]) is list:
+            flatten_coordinates = [item for sublist in flatten_coordinates for item in sublist]
+        longitude_coords = flatten_coordinates[0:][::2]
+        latitude_coords = flatten_coordinates[1:][::2]
+        return [min(longitude_coords), max(longitude_coords), min(latitude_coords), max(latitude_coords)]
+
+    def get_center(self):
+        """Return the center of the bounding box as (longitude, latitude)."""
+        west, east, south, north = self.get_bounding_box()
+        return (east + west) / 2.0, (north + south) / 2.0
+
+    def get_exterior_ring(self):
+        # vertices of a polygon, the first one repeated at the end
+        return self.coordinates[0]
+
+    def is_counter_clockwise(self):
+        """Return True if the exterior ring of the polygon turns counterclockwise, False if not or degenerate."""
+        ring = self.get_exterior_ring()
+        num_vertices = len(ring) - 1 if len(ring) > 1 else len(ring)
+        if num_vertices < 3:
+            return False
+        try:
+            values = self._get_values()
+            if values is False or values.ndim != 3:
+                return _get_signed_area([(float(vertex[0]), float(vertex[1])) for vertex in ring[:num_vertices]]) < 0
+            vertices = values[0, :num_vertices].astype(float)
+            longitudes = vertices[:, 0]
+            latitudes = vertices[:, 1]
+            # shoelace sum over the edges, closing the ring
+            return float(numpy.sum((numpy.roll(longitudes, -1) - longitudes) *
+                                   (numpy.roll(latitudes, -1) + latitudes))) < 0
+        except (IndexError, TypeError, ValueError) as e:
+            log.error('Cannot compute the orientation of the {0}: {1}'.format(self.type, e))
+        return False
+
+    def is_a_box(self):
+        """Return True if the polygon is an axis-aligned rectangle given by its 4 corners and the closing vertex."""
+        ring = self.get_exterior_ring()
+        return (len(ring) == 5 and ring[0] == ring[4] and
+                ring[1] == [ring[0][0], ring[2][1]] and ring[3] == [ring[2][0], ring[0][1]] and
+                ring[0][0] != ring[2][0] and ring[0][1] != ring[2][1])
+
+    def __repr__(self):
+        return 'Geometry({0})'.format(self.type)
+
+
+def _count_vertices(coordinates):
+    if not coordinates or type(coordinates[0]) is not list:
+        return 1
+    if type(coordinates[0][0]) is not list:
+        return len(coordinates)
+    return sum([_count_vertices(part) for part in coordinates])
+
+
+def _get_signed_area(vertices):
+    # twice the area, negative for counterclockwise rings
+    area = 0
+    for index, (longitude, latitude) in enumerate(vertices):
+        next_longitude, next_latitude = vertices[(index + 1) % len(vertices)]
+        area += (next_longitude - longitude) * (next_latitude + latitude)
+    return area
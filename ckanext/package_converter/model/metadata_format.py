@@ -1,3 +1,5 @@
+import threading
+
 from flufl.enum import Enum
 
 
@@ -107,49 +109,129 @@ class XMLMetadataFormat(MetadataFormat):
             xsd=self.xsd_url, namespace=self.namespace)
 
 
+def get_builtin_formats():
+    """Return the formats shipped with the extension, registered when the MetadataFormats registry is created."""
+    return [
+        MetadataFormat('dcat', '20140116', format_type=FormatType.RDF,
+                       description='DCAT is an RDF vocabulary designed to facilitate interoperability ' +
+                                   ' between data catalogs published on the Web ' +
+                                   '(https://www.w3.org/TR/2014/REC-vocab-dcat-20140116)'),
+        MetadataFormat('dcat-ap-ch', '1.0', format_type=FormatType.RDF,
+                       description='DCAT-AP-CH is an RDF Swiss data standard based on the international DCAT-AP '
+                                   'standard '
+                                   '(https://handbook.opendata.swiss/content/glossar/bibliothek/dcat-ap-ch.html)'),
+        MetadataFormat('ckan', '', format_type=FormatType.JSON, description='CKAN base format for package'),
+        MetadataFormat('ckan_resource', '', format_type=FormatType.JSON, description='CKAN base format for resources'),
+        XMLMetadataFormat('datacite', '4.4', 'http://schema.datacite.org/meta/kernel-4.4/metadata.xsd',
+                          namespace="http://datacite.org/schema/kernel-4",
+                          description='DataCite Metadata Format 4.4'),
+        XMLMetadataFormat('oai_dc', '2.0', 'http://www.openarchives.org/OAI/2.0/oai_dc.xsd',
+                          namespace='http://www.openarchives.org/OAI/2.0/oai_dc/',
+                          description='XML Schema adjusted for usage in the OAI-PMH that imports the Dublin Core '
+                                      'elements from the DCMI schema.'),
+        XMLMetadataFormat('oai_pmh', '2.0', 'http://www.openarchives.org/OAI/2.0/OAI-PMH.xsd',
+                          namespace='http://www.openarchives.org/OAI/2.0/',
+                          description='XML Schema which can be used to validate replies to all OAI-PMH v2.0 requests'),
+        XMLMetadataFormat('iso19139', '1.0', 'http://www.isotc211.org/2005/gmd/gmd.xsd',
+                          namespace='http://www.isotc211.org/2005/gmd',
+                          description='ISO 19115:2003/19139 XML Metadata Format'),
+        XMLMetadataFormat('gcmd_dif', '10.2', 'http://gcmd.gsfc.nasa.gov/Aboutus/xml/dif/dif_v10.2.xsd',
+                          namespace='http://gcmd.gsfc.nasa.gov/Aboutus/xml/dif/',
+                          description='Global Change Master Directory Directory Interchange Format (GCMD DIF)'),
+        MetadataFormat('bibtex', '', format_type=FormatType.TEXT, file_extension='bib',
+                       description='Format used to describe and process lists of references'),
+        MetadataFormat('plain-text', '', format_type=FormatType.TEXT, file_extension='txt',
+                       description='Format used to provide plain human readable information'),
+        MetadataFormat('ris', '', format_type=FormatType.TEXT, file_extension='ris',
+                       description='Tagged format for expressing bibliographic citations'),
+        MetadataFormat('readme', '', format_type=FormatType.TEXT, file_extension='txt',
+                       description='Plain text format'),
+        MetadataFormat('csv', '', format_type=FormatType.CSV, file_extension='csv',
+                       description='Delimited text file format to store tabular data (comma-separated)'),
+        MetadataFormat('schemaorg', '', format_type=FormatType.JSON, file_extension='jsonld',
+                       description='Schema.org structured information for datasets based upon W3C DCAT work'),
+    ]
+
+
+class _MetadataFormatsSnapshot(object):
+    """Formats registered at some point, never modified once published by MetadataFormats.
+
+    The lookup index is built on first use, for this snapshot only.
+    """
+
+    def __init__(self, formats_dict):
+        # format name to tuple of formats, latest added first
+        self.formats_dict = formats_dict
+        self.index = None
+
+    def get_index(self):
+        index = self.index
+        if index is None:
+            by_name_version = {}
+            by_extension = {}
+            by_mimetype = {}
+            for format_items in self.formats_dict.values():
+                for metadata_format in format_items:
+                    by_name_version.setdefault((metadata_format.get_format_name(), metadata_format.get_version()),
+                                               metadata_format)
+                    extension = metadata_format.get_file_extension().lower()
+                    by_extension[extension] = by_extension.get(extension, ()) + (metadata_format,)
+                    mimetype = metadata_format.get_mimetype().lower()
+                    by_mimetype[mimetype] = by_mimetype.get(mimetype, ()) + (metadata_format,)
+            index = {'name_version': by_name_version, 'extension': by_extension, 'mimetype': by_mimetype}
+            self.index = index
+        return index
+
+
 class MetadataFormats(object):
     # Singleton
-    class __MetadataFormats:
+    class __MetadataFormats(object):
         def __init__(self):
-            self.formats_dict = {}
+            # readers use the current snapshot without locking, writers publish a new one (copy on write)
+            self.snapshot = _MetadataFormatsSnapshot({})
+            self.write_lock = threading.Lock()
+            for metadata_format in get_builtin_formats():
+                self.add_metadata_format(metadata_format)
 
         def add_metadata_format(self, metadata_format, replace=False):
             # TODO: Check duplicates 
             key = metadata_format.get_format_name()
-            if key not in self.formats_dict.keys():
-                self.formats_dict[key] = []
-            if replace:
-                self.formats_dict[key] = [metadata_format]
-            else:
-                self.formats_dict[key] = [metadata_format] + self.formats_dict[key]
+            with self.write_lock:
+                formats_dict = dict(self.snapshot.formats_dict)
+                if replace:
+                    formats_dict[key] = (metadata_format,)
+                else:
+                    formats_dict[key] = (metadata_format,) + formats_dict.get(key, ())
+                self.snapshot = _MetadataFormatsSnapshot(formats_dict)
+
+        def _get_index(self):
+            return self.snapshot.get_index()
 
         def get_num_formats(self):
-            num = 0
-            for key in self.formats_dict.keys():
-                for metadata_format in self.formats_dict[key]:
-                    num += 1
-            return num
+            return sum([len(format_items) for format_items in self.snapshot.formats_dict.values()])
 
         def get_metadata_formats_dict(self):
-            return self.formats_dict
+            return dict([(format_name, list(format_items))
+                         for format_name, format_items in self.snapshot.formats_dict.items()])
 
         def get_all_metadata_formats(self):
-            all_formats = []
-            for format_name in self.formats_dict:
-                for format_item in self.formats_dict[format_name]:
-                    all_formats += [format_item]
-            return all_formats
+            return [format_item for format_items in self.snapshot.formats_dict.values() for format_item in format_items]
 
         def get_metadata_formats(self, format_name, version=''):
-            formats_matching_name = self.formats_dict.get(format_name, [])
+            snapshot = self.snapshot
             if not version:
-                return formats_matching_name
-            else:
-                for metadata_format in self.formats_dict.get(format_name, []):
-                    if metadata_format.get_version() == version:
-                        return [metadata_format]
+                return list(snapshot.formats_dict.get(format_name, ()))
+            metadata_format = snapshot.get_index()['name_version'].get((format_name, version))
+            if metadata_format:
+                return [metadata_format]
             return []
 
+        def get_metadata_formats_by_extension(self, file_extension):
+            return list(self._get_index()['extension'].get(file_extension.lower(), ()))
+
+        def get_metadata_formats_by_mimetype(self, mimetype):
+            return list(self._get_index()['mimetype'].get(mimetype.lower(), ()))
+
         def __repr__(self):
             return str(self)
 
@@ -157,8 +239,8 @@ class MetadataFormats(object):
             return str(self).encode('utf-8')
 
         def __unicode__(self):
-            return u'MetadataFormats ({num_formats}): {formats_dict}'.format(num_formats=self.get_num_formats(),
-                                                                             formats_dict=self.formats_dict)
+            return u'MetadataFormats ({num_formats}): {formats_dict}'.format(
+                num_formats=self.get_num_formats(), formats_dict=self.get_metadata_formats_dict())
 
     instance = None
 
@@ -1,13 +1,18 @@
+import os
 import sys
+import threading
 
 from lxml import etree
 from lxml.etree import fromstring
-from xmltodict import unparse, parse
-import requests
+from xmltodict import parse
 
 import json
 import six
 
+from ckanext.package_converter.model.export_context import get_default_export_context
+from ckanext.package_converter.model.xml_writer import unparse, dict_to_tree
+from ckanext.package_converter.model.xsd_catalog import XSDCatalog
+
 from logging import getLogger
 
 import logging
@@ -19,13 +24,20 @@ log = getLogger(__name__)
 
 class Record(object):
 
-    def __init__(self, metadata_format, content):
+    def __init__(self, metadata_format, content, export_context=None):
         self.metadata_format = metadata_format
         self.content = content
+        self.export_context = export_context
 
     def get_metadata_format(self):
         return self.metadata_format
 
+    def get_export_context(self):
+        # the default context is resolved once per record, by the factory set by the plugin
+        if self.export_context is None:
+            self.export_context = get_default_export_context()
+        return self.export_context
+
     def get_content(self):
         return self.content
 
@@ -37,35 +49,98 @@ class Record(object):
 
     def __unicode__(self):
         return u'Record ({metadata_format}): {content}'.format(metadata_format=self.metadata_format,
-                                                               content=self.content)
+                                                               content=self.get_content())
 
 
 class XMLRecord(Record):
+    """Record of an XML document, parsed to a dict or a DOM only when asked and at most once.
 
-    def __init__(self, metadata_format, content):
-        Record.__init__(self, metadata_format, content)
-        self.xml_dict = parse(content)
+    A record built from a dict is written as text or as a DOM only when asked, without parsing either.
+    """
+
+    def __init__(self, metadata_format, content, export_context=None):
+        Record.__init__(self, metadata_format, content, export_context=export_context)
+        self.xml_dict = None
+        self.xml_doms = {}
+        # dict in the xmltodict layout the record was built from, with its unparse options
+        self.source_dict = None
+        self.short_empty_elements = False
 
     @classmethod
     def from_record(cls, record):
-        return cls(record.get_metadata_format(), record.get_content())
+        return cls(record.get_metadata_format(), record.get_content(), export_context=record.export_context)
+
+    @classmethod
+    def from_dict(cls, metadata_format, xml_dict, short_empty_elements=False, export_context=None):
+        # the content is unparsed only if asked, the next converter of a chain gets the DOM written from the dict
+        xml_record = cls(metadata_format, None, export_context=export_context)
+        xml_record.source_dict = xml_dict
+        xml_record.short_empty_elements = short_empty_elements
+        return xml_record
 
     @classmethod
-    def from_dict(cls, metadata_format, xml_dict):
-        return cls(metadata_format, unparse(xml_dict, pretty=True))
+    def from_dom(cls, metadata_format, xml_dom, encoding='utf-8'):
+        # the content is serialized only if asked, records passed along a conversion chain stay as DOM
+        xml_record = cls(metadata_format, None)
+        xml_record.xml_doms[encoding] = xml_dom
+        return xml_record
+
+    def get_content(self):
+        if self.content is None:
+            if self.source_dict is not None:
+                self.content = unparse(self.source_dict, pretty=True, short_empty_elements=self.short_empty_elements)
+            elif self.xml_doms:
+                self.content = etree.tostring(list(self.xml_doms.values())[0], pretty_print=True)
+        return self.content
 
     def get_xml_dict(self):
+        if self.xml_dict is None:
+            self.xml_dict = parse(self.get_content())
         return self.xml_dict
 
     def _get_dom(self, encoding):
-        # encode xml content
-        parser = etree.XMLParser(ns_clean=True, recover=True, encoding=encoding)
-        xml_dom = fromstring(self.content.encode(encoding), parser=parser)
+        xml_dom = self.xml_doms.get(encoding)
+        if xml_dom is None and self.source_dict is not None and self.content is None:
+            try:
+                xml_dom = dict_to_tree(self.source_dict, pretty=True)
+                self.xml_doms[encoding] = xml_dom
+            except ValueError as e:
+                # text lxml does not accept, such as control characters, is left to the recovering parser
+                log.debug('Cannot write the DOM of the dict, parsing its content: {0}'.format(e))
+        if xml_dom is None:
+            content = self.get_content()
+            # encode xml content
+            if isinstance(content, six.text_type):
+                content = content.encode(encoding)
+            parser = etree.XMLParser(ns_clean=True, recover=True, encoding=encoding)
+            xml_dom = fromstring(content, parser=parser)
+            self.xml_doms[encoding] = xml_dom
         return xml_dom
 
     def validate(self, custom_xsd='', custom_replace=[], encoding='utf-8'):
         xml_dom = self._get_dom(encoding)
 
+        if custom_xsd or custom_replace:
+            schema = self._get_custom_schema(custom_xsd, custom_replace, encoding)
+        else:
+            # compiled once per format from the local schema catalog
+            log.debug("Validating against {0}".format(self.metadata_format.xsd_url))
+            schema = XSDCatalog().get_schema(self.metadata_format)
+
+        if schema.validate(xml_dom):
+            return True
+        else:
+            log.info('Validation FAILED')
+        try:
+            validation = schema.assertValid(xml_dom)
+            log.debug(validation)
+        except etree.DocumentInvalid as e:
+            log.warning('Document Invalid: {0}'.format(e))
+        except:
+            log.error('Exception: {0}'.format(sys.exc_info()[0]))
+        return False
+
+    def _get_custom_schema(self, custom_xsd='', custom_replace=[], encoding='utf-8'):
         if custom_xsd:
             xsd_content = custom_xsd
         else:
@@ -78,61 +153,149 @@ class XMLRecord(Record):
                 xsd_url_str = self.metadata_format.xsd_url.encode(encoding)
                 log.debug("Encoded url {0}: '{1}'".format(encoding, xsd_url_str))
 
-            # request XSD content
+            # request XSD content, requests is only imported for a validation without a local copy
+            import requests
             res = requests.get(xsd_url_str)
             xsd_content = res.content
 
             # fix issues with included xsd's
-            if custom_replace:
-                for replace_pair in custom_replace:
-                    xsd_content = xsd_content.replace(replace_pair[0], replace_pair[1])
-            else:
-                xsd_content = xsd_content.replace(b'schemaLocation="include/',
-                                                  b'schemaLocation="'
-                                                  + xsd_url_str_orig.rsplit("/", 1)[0].encode(encoding)
-                                                  + b'/include/').replace(
-                    b'xs:include schemaLocation="..',
-                    b'xs:include schemaLocation="' + xsd_url_str_orig.rsplit("/", 2)[0].encode(encoding))
+            for replace_pair in custom_replace:
+                xsd_content = xsd_content.replace(replace_pair[0], replace_pair[1])
 
         doc_xsd = etree.XML(xsd_content)
-        schema = etree.XMLSchema(doc_xsd)
-
-        if schema.validate(xml_dom):
-            return True
-        else:
-            log.info('Validation FAILED')
-        try:
-            validation = schema.assertValid(xml_dom)
-            log.debug(validation)
-        except etree.DocumentInvalid as e:
-            log.warning('Document Invalid: {0}'.format(e))
-        except:
-            log.error('Exception: {0}'.format(sys.exc_info()[0]))
-        return False
+        return etree.XMLSchema(doc_xsd)
 
     def xsl_transform(self, xsl_path, encoding='utf-8'):
-        xml_dom = self._get_dom(encoding)
-        xsl_dom = etree.parse(xsl_path)
-        transform = etree.XSLT(xsl_dom)
-        new_dom = transform(xml_dom)
-        return etree.tostring(new_dom, pretty_print=True)
+        return etree.tostring(self.xsl_transform_dom(xsl_path, encoding), pretty_print=True)
+
+    def xsl_transform_dom(self, xsl_path, encoding='utf-8'):
+        transform = get_compiled_xslt(xsl_path)
+        return transform(self._get_dom(encoding))
 
     def __unicode__(self):
-        return super(XMLRecord, self).__unicode__() + u' XML, {xml_dict}'.format(xml_dict=self.xml_dict)
+        return super(XMLRecord, self).__unicode__() + u' XML, {xml_dict}'.format(xml_dict=self.get_xml_dict())
+
+
+# compiled stylesheets by path, as (modification time, XSLT)
+_compiled_xslts = {}
+_compiled_xslts_lock = threading.Lock()
+
+
+def get_compiled_xslt(xsl_path):
+    """Return the compiled XSLT of a stylesheet file, compiled again only when the file is modified."""
+    xsl_path = os.path.abspath(xsl_path)
+    modification_time = os.path.getmtime(xsl_path)
+    compiled_xslt = _compiled_xslts.get(xsl_path)
+    if compiled_xslt and compiled_xslt[0] == modification_time:
+        return compiled_xslt[1]
+    with _compiled_xslts_lock:
+        compiled_xslt = _compiled_xslts.get(xsl_path)
+        if not compiled_xslt or compiled_xslt[0] != modification_time:
+            log.debug('Compiling XSLT {0}'.format(xsl_path))
+            compiled_xslt = (modification_time, etree.XSLT(etree.parse(xsl_path)))
+            _compiled_xslts[xsl_path] = compiled_xslt
+    return compiled_xslt[1]
 
 
 class JSONRecord(Record):
+    """Record of a JSON dict, serialized on the first call to get_content().
+
+    The content is indented unless compact is set, then it has no whitespace between items.
+    """
 
-    def __init__(self, metadata_format, json_dict):
-        Record.__init__(self, metadata_format, json.dumps(json_dict, indent=4, ensure_ascii=False))
+    def __init__(self, metadata_format, json_dict, compact=False, export_context=None):
+        Record.__init__(self, metadata_format, None, export_context=export_context)
         self.json_dict = json_dict
+        self.decoded_dict = None
+        self.compact = compact
+
+    def get_content(self):
+        if self.content is None:
+            if self.compact:
+                self.content = json.dumps(self.json_dict, separators=(',', ':'), ensure_ascii=False)
+            else:
+                self.content = json.dumps(self.json_dict, indent=4, ensure_ascii=False)
+        return self.content
 
     def get_json_dict(self):
         return self.json_dict
 
+    def get_decoded_dict(self):
+        # built once per record, so every converter applied to it shares the decoded fields
+        if self.decoded_dict is None:
+            self.decoded_dict = DecodedDict(self.json_dict)
+        return self.decoded_dict
+
     @classmethod
     def from_record(cls, record):
-        return cls(record.get_metadata_format(), json.loads(record.get_content()))
+        json_record = cls(record.get_metadata_format(), json.loads(record.get_content()),
+                          export_context=record.export_context)
+        # keep the original text
+        json_record.content = record.get_content()
+        return json_record
 
     def __unicode__(self):
         return super(JSONRecord, self).__unicode__() + u' JSON {json_dict}'.format(json_dict=self.json_dict)
+
+
+# marks values that are not JSON encoded strings
+_NOT_DECODED = object()
+
+
+def _decode_json_value(value):
+    if isinstance(value, (list, dict)):
+        return value
+    if not value or not isinstance(value, six.string_types):
+        return _NOT_DECODED
+    try:
+        return json.loads(value)
+    except ValueError:
+        return _NOT_DECODED
+
+
+def get_decoded_value(data_dict, key, default=None):
+    """Return the JSON decoded value of a field (repeating, composite, spatial...) of a CKAN dict.
+
+    Lists and dicts are returned as they are, values that are not JSON strings return the default.
+    Decoded values are memoized when data_dict is a DecodedDict.
+    """
+    if isinstance(data_dict, DecodedDict):
+        return data_dict.get_decoded(key, default)
+    decoded_value = _decode_json_value(data_dict.get(key))
+    if decoded_value is _NOT_DECODED:
+        return default
+    return decoded_value
+
+
+class DecodedDict(dict):
+    """Copy of a CKAN package or resource dict that decodes its JSON string fields lazily, at most once.
+
+    Decoded values are shared by all the converters reading the dict and must not be modified.
+    """
+
+    def __init__(self, json_dict):
+        dict.__init__(self, json_dict)
+        self.decoded_fields = {}
+        self.parsed_fields = {}
+
+    def get_decoded(self, key, default=None):
+        try:
+            decoded_value = self.decoded_fields[key]
+        except KeyError:
+            decoded_value = _decode_json_value(self.get(key))
+            self.decoded_fields[key] = decoded_value
+        if decoded_value is _NOT_DECODED:
+            return default
+        return decoded_value
+
+    def get_parsed(self, key, parse, default=None):
+        """Return parse(decoded value) of a field, built at most once per field and parse function,
+        default if the field is empty.
+        """
+        try:
+            return self.parsed_fields[(key, parse)]
+        except KeyError:
+            decoded_value = self.get_decoded(key)
+            parsed_value = parse(decoded_value) if decoded_value else default
+            self.parsed_fields[(key, parse)] = parsed_value
+            return parsed_value
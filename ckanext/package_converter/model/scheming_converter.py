@@ -2,17 +2,16 @@ import ckanext
 
 from ckanext.package_converter.model.metadata_format import MetadataFormats
 from ckanext.package_converter.model.converter import BaseConverter
-from ckanext.package_converter.model.record import Record, JSONRecord, XMLRecord
+from ckanext.package_converter.model.record import JSONRecord, XMLRecord, get_decoded_value
 
 from ckanext.scheming import helpers
 import ckan.model as model
-import ckan.plugins.toolkit as toolkit
 
 import collections
-from ckan.common import config
-from xmltodict import unparse
 import sys
 import json
+import hashlib
+import six
 
 from logging import getLogger
 
@@ -23,6 +22,10 @@ FIELD_NAME = 'field_name'
 
 class SchemingConverter(BaseConverter):
 
+    # schema maps shared by all scheming converters, keyed by (format name, schema fingerprint)
+    _schema_maps = {}
+    _schema_fingerprint = (None, '')
+
     def __init__(self, output_format):
         BaseConverter.__init__(self, output_format)
 
@@ -31,6 +34,30 @@ class SchemingConverter(BaseConverter):
                                                                                                  JSONRecord))
 
     def _get_schema_map(self, format_name):
+        # the map only depends on the format and the loaded schema, rebuild it only if one of them changes
+        schema = helpers.scheming_get_schema('dataset', 'dataset')
+        schema_key = (format_name, self._get_schema_fingerprint(schema))
+        schema_map = SchemingConverter._schema_maps.get(schema_key)
+        if schema_map is None:
+            schema_map = self._build_schema_map(schema, format_name)
+            if any(key[1] != schema_key[1] for key in SchemingConverter._schema_maps):
+                log.debug('Scheming schema changed, discarding cached schema maps')
+                SchemingConverter._schema_maps = {}
+            SchemingConverter._schema_maps[schema_key] = schema_map
+        return schema_map
+
+    @classmethod
+    def _get_schema_fingerprint(cls, schema):
+        # scheming returns the same schema object until it is reloaded, hash it only when it is a new one
+        cached_schema, fingerprint = SchemingConverter._schema_fingerprint
+        if schema is not cached_schema:
+            schema_json = json.dumps(schema, sort_keys=True, default=str)
+            fingerprint = hashlib.md5(schema_json.encode('utf-8')).hexdigest()
+            SchemingConverter._schema_fingerprint = (schema, fingerprint)
+        return fingerprint
+
+    @classmethod
+    def _build_schema_map(cls, schema, format_name):
 
         def _map_fields(schema, format_name):
             map_dict = {}
@@ -58,7 +85,6 @@ class SchemingConverter(BaseConverter):
                             map_dict[format_subfield] = {FIELD_NAME: field[FIELD_NAME] + '.' + subfield[FIELD_NAME]}
             return map_dict
 
-        schema = helpers.scheming_get_schema('dataset', 'dataset')
         schema_map = {'format_name': format_name,
                       'metadata': _map_fields(schema['dataset_fields'], format_name),
                       'metadata_resource': _map_fields(schema['resource_fields'], format_name)}
@@ -71,22 +97,17 @@ class SchemingConverter(BaseConverter):
         value = dataset_dict.get(ckan_tag, '')
 
         # repeating (get first)
-        if value:
-            try:
-                repeating_field = json.loads(value)
-                if type(repeating_field) is list:
-                    value = repeating_field[0]
-            except Exception as e:
-                log.debug("_get_single_mapped_value: Value cannot be parsed as repeating {0}".format(e))
+        if value and isinstance(value, six.string_types):
+            repeating_field = get_decoded_value(dataset_dict, ckan_tag)
+            if type(repeating_field) is list and repeating_field:
+                value = repeating_field[0]
 
         # composite (if repeating, get first)
         if not value and (len(ckan_tag.split('.')) > 1):
             field = ckan_tag.split('.', 1)[0]
             subfield = ckan_tag.split('.', 1)[1]
             try:
-                json_field = dataset_dict[field]
-                if type(json_field) not in [list, dict]:
-                    json_field = json.loads(json_field)
+                json_field = get_decoded_value(dataset_dict, field)
                 if type(json_field) is list:
                     json_field = json_field[0]
                 value = json_field[subfield]
@@ -126,9 +147,7 @@ class SchemingConverter(BaseConverter):
 
         if dataset_dict.get(ckan_tag, ''):
             try:
-                json_field = dataset_dict[ckan_tag]
-                if type(json_field) not in [list, dict]:
-                    json_field = json.loads(json_field)
+                json_field = get_decoded_value(dataset_dict, ckan_tag)
                 if type(json_field) is not list:
                     json_field = [json_field]
                 for ckan_element in json_field:
@@ -163,11 +182,11 @@ class Datacite43SchemingConverter(SchemingConverter):
 
     def convert(self, record):
         if self.can_convert(record):
-            dataset_dict = record.get_json_dict()
+            dataset_dict = record.get_decoded_dict()
             # log.debug('dataset_dict = ' + repr(dataset_dict))
-            converted_content = self._datacite_converter_schema(dataset_dict)
-            converted_record = Record(self.output_format, converted_content)
-            converted_xml_record = XMLRecord.from_record(converted_record)
+            datacite_dict = self._datacite_dict_schema(dataset_dict, record.get_export_context())
+            # unparsed only if asked, an XSL converter next in the chain transforms the DOM written from the dict
+            converted_xml_record = XMLRecord.from_dict(self.output_format, datacite_dict)
             # log.debug("Validating record..." + str(converted_xml_record.validate()))
             return converted_xml_record
         else:
@@ -213,7 +232,7 @@ class Datacite43SchemingConverter(SchemingConverter):
 
         return (match_cv)
 
-    def _datacite_converter_schema(self, dataset_dict):
+    def _datacite_dict_schema(self, dataset_dict, export_context):
         schema_map = self._get_schema_map(self.output_format.get_format_name().split('_')[0])
         metadata_map = schema_map['metadata']
         metadata_resource_map = schema_map['metadata_resource']
@@ -409,8 +428,8 @@ class Datacite43SchemingConverter(SchemingConverter):
                 '@' + datacite_resource_type_general_tag: datacite_resource_type_general}
 
         # Alternate Identifier (CKAN URL)
-        ckan_package_url = config.get('ckan.site_url', '') + '/dataset/' + dataset_dict.get('name')
-        ckan_package_url_id = config.get('ckan.site_url', '') + '/dataset/' + dataset_dict.get('id')
+        ckan_package_url = export_context.site_url + '/dataset/' + dataset_dict.get('name')
+        ckan_package_url_id = export_context.site_url + '/dataset/' + dataset_dict.get('id')
 
         datacite_dict['resource']['alternateIdentifiers'] = {
             'alternateIdentifier': [{'#text': ckan_package_url, '@alternateIdentifierType': 'URL'},
@@ -436,16 +455,12 @@ class Datacite43SchemingConverter(SchemingConverter):
                     package_list = []
                     related_url = None
                     try:
-                        package_list = toolkit.get_action('package_list')(
-                            context={'ignore_auth': False},
-                            data_dict={})
+                        package_list = export_context.get_package_names()
                     except:
                         log.error('envidat_get_related_datasets: could not retrieve package list from API')
 
                     if line_contents in package_list:
-                        base_url = config.get('datacite_publication.url_prefix',
-                                              config.get('ckan.site_url', '') + '/dataset')
-                        related_url = base_url + '/' + line_contents
+                        related_url = export_context.related_url_prefix + '/' + line_contents
                     elif line_contents.startswith('https://') or line_contents.startswith('http://'):
                         related_url = line_contents
 
@@ -582,7 +597,9 @@ class Datacite43SchemingConverter(SchemingConverter):
         datacite_geolocations = []
         try:
             # Spatial extension
-            pkg_spatial = json.loads(dataset_dict['spatial'])
+            pkg_spatial = get_decoded_value(dataset_dict, 'spatial')
+            if pkg_spatial is None:
+                raise ValueError('spatial is not a GeoJSON string')
             log.debug("pkg_spatial=" + str(pkg_spatial))
             if pkg_spatial:
                 # Handle GeometryCollection
@@ -659,10 +676,7 @@ class Datacite43SchemingConverter(SchemingConverter):
         if datacite_funding_refs:
             datacite_dict['resource'][datacite_funding_refs_tag] = {datacite_funding_ref_tag: datacite_funding_refs}
 
-        # Convert to xml
-        converted_package = unparse(datacite_dict, pretty=True)
-
-        return converted_package
+        return datacite_dict
 
     def _flatten_list(self, input_list, reverse=False):
         output_list = []
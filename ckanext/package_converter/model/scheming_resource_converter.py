@@ -1,15 +1,19 @@
 import collections
+import copy
 import json
+import threading
 from logging import getLogger
 
-from ckan.lib.helpers import url_for
-from ckan.common import config
 from ckanext.package_converter.model.metadata_format import MetadataFormats
-from ckanext.package_converter.model.scheming_converter import Datacite43SchemingConverter
-from xmltodict import unparse, parse
+from ckanext.package_converter.model.record import DecodedDict
+from ckanext.package_converter.model.scheming_converter import Datacite43SchemingConverter, helpers
+from xmltodict import parse
+from ckanext.package_converter.model.xml_writer import unparse
 
 log = getLogger(__name__)
 
+PACKAGE_DATACITE_CACHE_SIZE = 100
+
 
 class Datacite43SchemingResourceConverter(Datacite43SchemingConverter):
 
@@ -17,8 +21,12 @@ class Datacite43SchemingResourceConverter(Datacite43SchemingConverter):
         Datacite43SchemingConverter.__init__(self)
         ckan_resource_base_format = MetadataFormats().get_metadata_formats('ckan_resource')[0]
         self.input_format = ckan_resource_base_format
+        # package DataCite dicts by package revision, site and schema, shared by the resources of a package,
+        # least recently used first
+        self.package_datacite_dicts = collections.OrderedDict()
+        self.package_datacite_lock = threading.Lock()
 
-    def _datacite_converter_schema(self, resource_dict):
+    def _datacite_dict_schema(self, resource_dict, export_context):
         try:
             schema_map = self._get_schema_map(self.output_format.get_format_name())
             metadata_resource_map = schema_map['metadata_resource']
@@ -58,12 +66,8 @@ class Datacite43SchemingResourceConverter(Datacite43SchemingConverter):
                 datacite_dict['resource'][datacite_titles_tag][datacite_title_tag] += [datacite_title]
 
             # Alternate Identifier (CKAN URL) Decide which is landing page, resource or package
-            ckan_resource_url = config.get('ckan.site_url', '') + url_for(controller='dataset_resource',
-                                                                          action='read',
-                                                                          id=resource_dict.get('package_id',
-                                                                                               ''),
-                                                                          resource_id=resource_dict.get('id',
-                                                                                                        ''))
+            ckan_resource_url = export_context.site_url + export_context.url_for(
+                'dataset_resource', id=resource_dict.get('package_id', ''), resource_id=resource_dict.get('id', ''))
             datacite_dict['resource']['alternateIdentifiers'] = {
                 'alternateIdentifier': [{'#text': ckan_resource_url, '@alternateIdentifierType': 'URL'}]}
 
@@ -131,17 +135,34 @@ class Datacite43SchemingResourceConverter(Datacite43SchemingConverter):
             # inherit from package
             package_dict = resource_dict.get('package_dict')
             if package_dict:
-                datacite_package_dict = parse(
-                    super(Datacite43SchemingResourceConverter, self)._datacite_converter_schema(package_dict))
-                datacite_dict['resource'] = self._inherit_from_package(datacite_dict['resource'],
-                                                                       datacite_package_dict['resource'])
+                datacite_dict['resource'] = self._inherit_from_package(
+                    datacite_dict['resource'], self._get_package_datacite_dict(package_dict, export_context))
 
-            # Convert to xml
-            converted_package = unparse(datacite_dict, pretty=True)
         except Exception as e:
             log.exception(e)
             return None
-        return converted_package
+        return datacite_dict
+
+    def _get_package_datacite_dict(self, package_dict, export_context):
+        # the package part is converted once per package revision, site URLs and scheming schema
+        cache_key = (package_dict.get('id'), package_dict.get('metadata_modified'), export_context.get_key(),
+                     self._get_schema_fingerprint(helpers.scheming_get_schema('dataset', 'dataset')))
+        with self.package_datacite_lock:
+            # moved to the end as most recently used, OrderedDict has no move_to_end on Python 2
+            datacite_package_dict = self.package_datacite_dicts.pop(cache_key, None)
+            if datacite_package_dict is not None:
+                self.package_datacite_dicts[cache_key] = datacite_package_dict
+        if datacite_package_dict is None:
+            datacite_package_dict = parse(unparse(
+                super(Datacite43SchemingResourceConverter, self)._datacite_dict_schema(
+                    DecodedDict(package_dict), export_context), pretty=True))['resource']
+            if all(cache_key[:2]):
+                with self.package_datacite_lock:
+                    self.package_datacite_dicts[cache_key] = datacite_package_dict
+                    while len(self.package_datacite_dicts) > PACKAGE_DATACITE_CACHE_SIZE:
+                        self.package_datacite_dicts.popitem(last=False)
+        # the merge replaces keys of the package dict, its values are only read
+        return copy.copy(datacite_package_dict)
 
     def _inherit_from_package(self, datacite_dict, datacite_package_dict):
         def merge_dict_lists(dict1, dict2):
@@ -0,0 +1,299 @@
+import bisect
+import collections
+import contextlib
+import math
+import re
+import socket
+import threading
+import time
+
+from logging import getLogger
+
+log = getLogger(__name__)
+
+DEFAULT_SAMPLE_SIZE = 1000
+DEFAULT_STATSD_PREFIX = 'package_converter'
+
+# upper bounds in seconds of the histogram buckets, as exported to Prometheus
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PERCENTILES = (50, 95, 99)
+
+
+class LatencyHistogram(object):
+    """Durations of one stage for one name, counted in buckets and kept as a window of recent samples.
+
+    The percentiles are computed from the recent samples, the buckets, sum and count cover all the durations.
+    """
+
+    def __init__(self, sample_size=DEFAULT_SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.samples = collections.deque(maxlen=sample_size)
+
+    def observe(self, seconds):
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def merge(self, histogram):
+        """Add the durations of another histogram, which may still be observing in its own thread."""
+        # copied first, the count is taken from the buckets to keep them consistent in the Prometheus export
+        bucket_counts = list(histogram.bucket_counts)
+        self.bucket_counts = [count + other_count for count, other_count in zip(self.bucket_counts, bucket_counts)]
+        self.count += sum(bucket_counts)
+        self.sum += histogram.sum
+        self.max = max(self.max, histogram.max)
+        self.samples.extend(list(histogram.samples))
+
+    def get_percentile(self, percentile, sorted_samples=None):
+        if sorted_samples is None:
+            sorted_samples = sorted(self.samples)
+        if not sorted_samples:
+            return None
+        # nearest rank
+        rank = int(math.ceil(percentile / 100.0 * len(sorted_samples)))
+        return sorted_samples[max(rank, 1) - 1]
+
+    def get_summary(self):
+        sorted_samples = sorted(self.samples)
+        summary = {'count': self.count, 'sum': self.sum, 'max': self.max,
+                   'mean': self.sum / self.count if self.count else None}
+        for percentile in PERCENTILES:
+            summary['p{0}'.format(percentile)] = self.get_percentile(percentile, sorted_samples)
+        return summary
+
+
+class StatsdExporter(object):
+    """Sends every duration and cache lookup to a StatsD server over UDP, errors are ignored."""
+
+    def __init__(self, host, port, prefix=DEFAULT_STATSD_PREFIX):
+        self.address = (host, int(port))
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    @staticmethod
+    def _get_bucket_name(name):
+        # conversion steps are named input->output
+        return re.sub(r'[^A-Za-z0-9_.-]+', '_', name.replace('->', '_to_'))
+
+    def _send(self, line):
+        try:
+            self.socket.sendto(line.encode('utf-8'), self.address)
+        except (IOError, OSError) as e:
+            log.debug('Cannot send stats to StatsD {0}: {1}'.format(self.address, e))
+
+    def observe(self, stage, name, seconds):
+        self._send(u'{0}.{1}.{2}:{3:.3f}|ms'.format(self.prefix, stage, self._get_bucket_name(name), seconds * 1000))
+
+    def count_cache_lookup(self, cache_name, name, hit):
+        self._send(u'{0}.cache.{1}.{2}.{3}:1|c'.format(self.prefix, cache_name, self._get_bucket_name(name),
+                                                       'hit' if hit else 'miss'))
+
+    def __repr__(self):
+        return 'StatsdExporter({0}:{1}, prefix={2})'.format(self.address[0], self.address[1], self.prefix)
+
+
+class ThreadStats(object):
+    """Latency histograms and cache lookups of one thread, only changed by that thread."""
+
+    def __init__(self, sample_size=DEFAULT_SAMPLE_SIZE, thread=None):
+        self.sample_size = sample_size
+        self.thread = thread
+        self.histograms = {}
+        self.cache_lookups = {}
+
+    def merge(self, thread_stats):
+        # a copy of a dict or list is atomic, the other thread may go on observing
+        for key, histogram in list(thread_stats.histograms.items()):
+            merged_histogram = self.histograms.get(key)
+            if merged_histogram is None:
+                merged_histogram = self.histograms[key] = LatencyHistogram(self.sample_size)
+            merged_histogram.merge(histogram)
+        for key, lookups in list(thread_stats.cache_lookups.items()):
+            hits, misses = list(lookups)
+            merged_lookups = self.cache_lookups.setdefault(key, [0, 0])
+            merged_lookups[0] += hits
+            merged_lookups[1] += misses
+
+    def clear(self):
+        self.histograms.clear()
+        self.cache_lookups.clear()
+
+
+class ConversionStats(object):
+    """In-process latency histograms by stage and name, and cache hits and misses by cache and name.
+
+    The stages timed are 'conversion' (by output format), 'converter' (each step of a conversion chain),
+    'package_show' (by dataset type), 'serialize' and 'cache_lookup' (by output format).
+
+    Each thread records in its own ThreadStats without locking, they are merged when the stats are read. The
+    stats of finished threads are merged once into the retired stats, keeping their recent samples.
+    """
+
+    def __init__(self, sample_size=DEFAULT_SAMPLE_SIZE, exporters=None):
+        self.sample_size = sample_size
+        self.exporters = list(exporters or [])
+        self.local = threading.local()
+        self.thread_stats = []
+        self.retired_stats = ThreadStats(sample_size)
+        # taken when a thread records for the first time and when the stats are read
+        self.lock = threading.Lock()
+
+    def _get_thread_stats(self):
+        thread_stats = getattr(self.local, 'stats', None)
+        if thread_stats is None:
+            thread_stats = self.local.stats = ThreadStats(self.sample_size, threading.current_thread())
+            with self.lock:
+                self._retire_finished_threads()
+                self.thread_stats.append(thread_stats)
+        return thread_stats
+
+    def _retire_finished_threads(self):
+        running_thread_stats = []
+        for thread_stats in self.thread_stats:
+            if thread_stats.thread.is_alive():
+                running_thread_stats.append(thread_stats)
+            else:
+                self.retired_stats.merge(thread_stats)
+        self.thread_stats = running_thread_stats
+
+    def observe(self, stage, name, seconds):
+        histograms = self._get_thread_stats().histograms
+        histogram = histograms.get((stage, name))
+        if histogram is None:
+            histogram = histograms[(stage, name)] = LatencyHistogram(self.sample_size)
+        histogram.observe(seconds)
+        for exporter in self.exporters:
+            exporter.observe(stage, name, seconds)
+
+    def count_cache_lookup(self, cache_name, name, hit):
+        lookups = self._get_thread_stats().cache_lookups.setdefault((cache_name, name), [0, 0])
+        lookups[0 if hit else 1] += 1
+        for exporter in self.exporters:
+            exporter.count_cache_lookup(cache_name, name, hit)
+
+    def reset(self):
+        with self.lock:
+            self.retired_stats = ThreadStats(self.sample_size)
+            for thread_stats in self.thread_stats:
+                thread_stats.clear()
+
+    def _get_merged_stats(self):
+        # the recent samples of all the threads are kept for the percentiles
+        merged_stats = ThreadStats(sample_size=None)
+        with self.lock:
+            self._retire_finished_threads()
+            for thread_stats in [self.retired_stats] + self.thread_stats:
+                merged_stats.merge(thread_stats)
+        return merged_stats
+
+    def get_stats(self):
+        """Return the latency summaries as {'latency': {stage: {name: summary}}} and the cache lookups as
+        {'cache': {cache name: {name: {'hits': .., 'misses': .., 'hit_ratio': ..}}}}, durations in seconds.
+        """
+        merged_stats = self._get_merged_stats()
+        histograms = [(key, histogram.get_summary()) for key, histogram in merged_stats.histograms.items()]
+        cache_lookups = [(key, tuple(lookups)) for key, lookups in merged_stats.cache_lookups.items()]
+        stats = {'latency': {}, 'cache': {}}
+        for (stage, name), summary in histograms:
+            stats['latency'].setdefault(stage, {})[name] = summary
+        for (cache_name, name), (hits, misses) in cache_lookups:
+            stats['cache'].setdefault(cache_name, {})[name] = {'hits': hits, 'misses': misses,
+                                                               'hit_ratio': float(hits) / (hits + misses)}
+        return stats
+
+    def format_prometheus(self):
+        """Return the histograms and cache lookups in the Prometheus text exposition format."""
+        lines = ['# HELP package_converter_latency_seconds Duration of the export stages.',
+                 '# TYPE package_converter_latency_seconds histogram']
+        merged_stats = self._get_merged_stats()
+        histograms = sorted([(key, histogram.bucket_counts, histogram.sum, histogram.count)
+                             for key, histogram in merged_stats.histograms.items()])
+        cache_lookups = sorted([(key, tuple(lookups)) for key, lookups in merged_stats.cache_lookups.items()])
+        for (stage, name), bucket_counts, latency_sum, latency_count in histograms:
+            labels = u'stage="{0}",name="{1}"'.format(_escape_label(stage), _escape_label(name))
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip(LATENCY_BUCKETS + ('+Inf',), bucket_counts):
+                cumulative_count += bucket_count
+                lines.append(u'package_converter_latency_seconds_bucket{{{0},le="{1}"}} {2}'.format(
+                    labels, upper_bound, cumulative_count))
+            lines.append(u'package_converter_latency_seconds_sum{{{0}}} {1!r}'.format(labels, latency_sum))
+            lines.append(u'package_converter_latency_seconds_count{{{0}}} {1}'.format(labels, latency_count))
+        lines += ['# HELP package_converter_cache_lookups_total Lookups of converted records in the caches.',
+                  '# TYPE package_converter_cache_lookups_total counter']
+        for (cache_name, name), lookups in cache_lookups:
+            for result, lookup_count in zip(['hit', 'miss'], lookups):
+                lines.append(u'package_converter_cache_lookups_total{{cache="{0}",name="{1}",result="{2}"}} {3}'
+                             .format(_escape_label(cache_name), _escape_label(name), result, lookup_count))
+        return u'\n'.join(lines) + u'\n'
+
+    def __repr__(self):
+        return 'ConversionStats(sample_size={0}, exporters={1})'.format(self.sample_size, self.exporters)
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# collected unless disabled in the configuration
+_conversion_stats = ConversionStats()
+
+
+def get_conversion_stats():
+    return _conversion_stats
+
+
+def set_conversion_stats(conversion_stats):
+    global _conversion_stats
+    _conversion_stats = conversion_stats
+
+
+@contextlib.contextmanager
+def timed(stage, name):
+    """Time the block as a duration of the stage for the name, nothing is timed if the stats are disabled."""
+    conversion_stats = _conversion_stats
+    if conversion_stats is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        conversion_stats.observe(stage, name, time.time() - start)
+
+
+def count_cache_lookup(cache_name, name, hit):
+    conversion_stats = _conversion_stats
+    if conversion_stats is not None:
+        conversion_stats.count_cache_lookup(cache_name, name, hit)
+
+
+def configure_conversion_stats(config):
+    """Create the conversion stats set in the configuration.
+
+    package_converter.stats = false disables them, package_converter.stats.samples sets the number of recent
+    durations the percentiles are computed from, and package_converter.stats.statsd = host:port also sends
+    them to StatsD, prefixed with package_converter.stats.statsd_prefix.
+    """
+    if str(config.get('package_converter.stats', 'true')).strip().lower() not in ['true', 'yes', 'on', '1']:
+        set_conversion_stats(None)
+        return None
+    exporters = []
+    statsd_address = config.get('package_converter.stats.statsd', '').strip()
+    if statsd_address:
+        host, _, port = statsd_address.rpartition(':')
+        if not host or not port.isdigit():
+            raise ValueError('package_converter.stats.statsd must be given as host:port')
+        exporters.append(StatsdExporter(host, port, config.get('package_converter.stats.statsd_prefix',
+                                                               DEFAULT_STATSD_PREFIX)))
+    conversion_stats = ConversionStats(int(config.get('package_converter.stats.samples', DEFAULT_SAMPLE_SIZE)),
+                                       exporters)
+    log.debug('Conversion stats: {0}'.format(conversion_stats))
+    set_conversion_stats(conversion_stats)
+    return conversion_stats
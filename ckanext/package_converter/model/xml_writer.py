@@ -0,0 +1,310 @@
+import collections
+
+import six
+from lxml import etree
+
+from logging import getLogger
+
+log = getLogger(__name__)
+
+XML_NAMESPACE = 'http://www.w3.org/XML/1998/namespace'
+
+_ATTRIBUTE_ENTITIES = {'\n': '&#10;', '\r': '&#13;', '\t': '&#9;'}
+
+
+def escape(text):
+    return text.replace('&', '&amp;').replace('>', '&gt;').replace('<', '&lt;')
+
+
+def quoteattr(value):
+    value = escape(value)
+    for character, entity in _ATTRIBUTE_ENTITIES.items():
+        if character in value:
+            value = value.replace(character, entity)
+    if '"' in value:
+        if "'" in value:
+            return '"' + value.replace('"', '&quot;') + '"'
+        return "'" + value + "'"
+    return '"' + value + '"'
+
+
+def to_text(value, encoding='utf-8'):
+    if isinstance(value, six.string_types):
+        return value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).decode(encoding, 'replace')
+    return six.text_type(value)
+
+
+class XMLWriter(object):
+    """Writes an XML document element by element.
+
+    Pretty printing follows xmltodict.unparse(pretty=True): one element per line, indented by depth, and the
+    text of elements with children written after them.
+    """
+
+    def __init__(self, pretty=False, indent='\t', newl='\n'):
+        self.pretty = pretty
+        self.indent = indent
+        self.newl = newl
+        # open elements as [name, has_children]
+        self.open_elements = []
+
+    def start(self, name, attributes=()):
+        depth = len(self.open_elements)
+        if depth:
+            parent = self.open_elements[-1]
+            if not parent[1]:
+                parent[1] = True
+                if self.pretty:
+                    self._write_whitespace(self.newl)
+            if self.pretty:
+                self._write_whitespace(depth * self.indent)
+        self.open_elements.append([name, False])
+        self._start(name, attributes)
+
+    def text(self, content):
+        if content:
+            self._text(content)
+
+    def end(self):
+        name, has_children = self.open_elements.pop()
+        depth = len(self.open_elements)
+        if self.pretty and has_children and depth:
+            self._write_whitespace(depth * self.indent)
+        self._end(name)
+        if self.pretty and depth:
+            self._write_whitespace(self.newl)
+
+    def element(self, name, text=None, attributes=()):
+        self.start(name, attributes)
+        if text is not None:
+            self.text(text)
+        self.end()
+
+    def _start(self, name, attributes):
+        raise NotImplementedError('This is an abstract class and cannot be used to write XML')
+
+    def _text(self, content):
+        raise NotImplementedError('This is an abstract class and cannot be used to write XML')
+
+    def _write_whitespace(self, content):
+        raise NotImplementedError('This is an abstract class and cannot be used to write XML')
+
+    def _end(self, name):
+        raise NotImplementedError('This is an abstract class and cannot be used to write XML')
+
+
+class StreamXMLWriter(XMLWriter):
+    """Writes the XML text to an output file or, by default, to a list of chunks joined by get_content().
+
+    With short_empty_elements, elements without content are closed as <element/>.
+    """
+
+    def __init__(self, output=None, pretty=False, indent='\t', newl='\n', short_empty_elements=False,
+                 encoding='utf-8'):
+        XMLWriter.__init__(self, pretty=pretty, indent=indent, newl=newl)
+        self.chunks = []
+        self.output = output
+        self._write = output.write if output is not None else self.chunks.append
+        self.short_empty_elements = short_empty_elements
+        self.encoding = encoding
+        self.pending_start = False
+
+    def start_document(self):
+        self._write('<?xml version="1.0" encoding="{encoding}"?>\n'.format(encoding=self.encoding))
+
+    def get_content(self):
+        return u''.join(self.chunks)
+
+    # start, end, text and element write directly, the generic event methods are too slow for large documents
+    def start(self, name, attributes=()):
+        write = self._write
+        if self.pending_start:
+            write('>')
+            self.pending_start = False
+        open_elements = self.open_elements
+        if open_elements:
+            parent = open_elements[-1]
+            if not parent[1]:
+                parent[1] = True
+                if self.pretty:
+                    write(self.newl)
+            if self.pretty:
+                write(self.indent * len(open_elements))
+        open_elements.append([name, False])
+        if attributes:
+            write('<' + name + ''.join([' ' + attribute_name + '=' + quoteattr(value)
+                                        for attribute_name, value in attributes]))
+        else:
+            write('<' + name)
+        if self.short_empty_elements:
+            self.pending_start = True
+        else:
+            write('>')
+
+    def text(self, content):
+        if content:
+            if self.pending_start:
+                self._write('>')
+                self.pending_start = False
+            self._write(escape(content))
+
+    def end(self):
+        name, has_children = self.open_elements.pop()
+        depth = len(self.open_elements)
+        write = self._write
+        if self.pretty and has_children and depth:
+            write(self.indent * depth)
+        if self.pending_start:
+            write('/>')
+            self.pending_start = False
+        else:
+            write('</' + name + '>')
+        if self.pretty and depth:
+            write(self.newl)
+
+    def element(self, name, text=None, attributes=()):
+        self.start(name, attributes)
+        if text:
+            self.pending_start = False
+            self._write(('>' if self.short_empty_elements else '') + escape(text) + '</' + name + '>')
+            self.open_elements.pop()
+            if self.pretty and self.open_elements:
+                self._write(self.newl)
+        else:
+            self.end()
+
+
+class TreeXMLWriter(XMLWriter):
+    """Builds an lxml tree, resolving the prefixes declared in xmlns attributes.
+
+    Text and whitespace are the same as in the StreamXMLWriter output, get_root() returns the root element.
+    """
+
+    def __init__(self, pretty=False, indent='\t', newl='\n'):
+        XMLWriter.__init__(self, pretty=pretty, indent=indent, newl=newl)
+        self.root = None
+        # elements and namespace scopes of the open elements
+        self.elements = []
+        self.namespaces = [{'xml': XML_NAMESPACE}]
+        self.last_closed = None
+
+    def get_root(self):
+        return self.root
+
+    def _qualify(self, name, namespaces, default_namespace=True):
+        if ':' in name:
+            prefix, local_name = name.split(':', 1)
+            uri = namespaces.get(prefix)
+            if uri is None:
+                log.warning('Undeclared namespace prefix {0}'.format(prefix))
+                return local_name
+            return '{' + uri + '}' + local_name
+        uri = namespaces.get(None) if default_namespace else None
+        if uri:
+            return '{' + uri + '}' + name
+        return name
+
+    def _start(self, name, attributes):
+        namespaces = self.namespaces[-1]
+        nsmap = {}
+        other_attributes = []
+        for attribute_name, value in attributes:
+            if attribute_name == 'xmlns':
+                nsmap[None] = value
+            elif attribute_name.startswith('xmlns:'):
+                nsmap[attribute_name[len('xmlns:'):]] = value
+            else:
+                other_attributes += [(attribute_name, value)]
+        if nsmap:
+            namespaces = dict(namespaces)
+            namespaces.update(nsmap)
+
+        tag = self._qualify(name, namespaces)
+        if self.elements:
+            element = etree.SubElement(self.elements[-1], tag, nsmap=nsmap or None)
+        else:
+            element = etree.Element(tag, nsmap=nsmap or None)
+            self.root = element
+        for attribute_name, value in other_attributes:
+            element.set(self._qualify(attribute_name, namespaces, default_namespace=False), value)
+
+        self.elements.append(element)
+        self.namespaces.append(namespaces)
+        self.last_closed = None
+
+    def _text(self, content):
+        if self.last_closed is not None:
+            self.last_closed.tail = (self.last_closed.tail or '') + content
+        elif self.elements:
+            element = self.elements[-1]
+            element.text = (element.text or '') + content
+
+    def _write_whitespace(self, content):
+        if content:
+            self._text(content)
+
+    def _end(self, name):
+        self.last_closed = self.elements.pop()
+        self.namespaces.pop()
+
+
+def write_dict(writer, xml_dict, attr_prefix='@', cdata_key='#text'):
+    """Write the elements of a dict in the xmltodict layout ('@' attributes, '#text' text, lists of siblings)."""
+    for name, value in xml_dict.items():
+        _write_value(writer, name, value, attr_prefix, cdata_key)
+    return writer
+
+
+def _write_value(writer, name, value, attr_prefix, cdata_key):
+    if not hasattr(value, '__iter__') or isinstance(value, (six.string_types, bytes, dict)):
+        value = [value]
+    for item in value:
+        if item is None:
+            item = {}
+        elif not isinstance(item, (dict, six.string_types)):
+            item = to_text(item)
+        if isinstance(item, six.string_types):
+            writer.element(name, item)
+            continue
+
+        text = None
+        attributes = collections.OrderedDict()
+        children = []
+        for key, child in item.items():
+            if key == cdata_key:
+                text = None if child is None else to_text(child)
+            elif key.startswith(attr_prefix):
+                if key == attr_prefix + 'xmlns' and isinstance(child, dict):
+                    for prefix, uri in child.items():
+                        attributes['xmlns:' + prefix if prefix else 'xmlns'] = '' if uri is None else to_text(uri)
+                else:
+                    attributes[key[len(attr_prefix):]] = '' if child is None else to_text(child)
+            elif not (isinstance(child, list) and not child):
+                children.append((key, child))
+
+        writer.start(name, list(attributes.items()))
+        for child_name, child in children:
+            _write_value(writer, child_name, child, attr_prefix, cdata_key)
+        if text is not None:
+            writer.text(text)
+        writer.end()
+
+
+def unparse(xml_dict, pretty=False, short_empty_elements=False, full_document=True, encoding='utf-8'):
+    """Return the XML document of a dict, as xmltodict.unparse does, without going through a SAX generator."""
+    if full_document and len(xml_dict) != 1:
+        raise ValueError('Document must have exactly one root.')
+    writer = StreamXMLWriter(pretty=pretty, short_empty_elements=short_empty_elements, encoding=encoding)
+    if full_document:
+        writer.start_document()
+    write_dict(writer, xml_dict)
+    return writer.get_content()
+
+
+def dict_to_tree(xml_dict, pretty=False):
+    """Return the lxml root element of a dict in the xmltodict layout."""
+    return write_dict(TreeXMLWriter(pretty=pretty), xml_dict).get_root()
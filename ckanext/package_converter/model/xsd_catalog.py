@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+
+from lxml import etree
+
+from logging import getLogger
+
+log = getLogger(__name__)
+
+XSD_DIRECTORY = os.path.join(os.path.dirname(__file__), '../public/package_converter_xsd')
+
+# seconds a failed download or compilation is not retried
+FAILURE_RETRY_INTERVAL = 300
+
+DOWNLOAD_TIMEOUT = 10
+
+# schemas shipped in public/package_converter_xsd, by their public location. Only GCMD DIF is small and
+# self-contained, DataCite, ISO 19139 and OAI-PMH import further schemas and are mirrored with
+# package_converter.xsd_catalog (see the README)
+DEFAULT_XSD_LOCATIONS = {
+    'http://gcmd.gsfc.nasa.gov/Aboutus/xml/dif/dif_v10.2.xsd': 'dif_v10.2.xsd',
+    'https://gcmd.gsfc.nasa.gov/Aboutus/xml/dif/dif_v10.2.xsd': 'dif_v10.2.xsd',
+    'http://gcmd.gsfc.nasa.gov/Aboutus/xml/dif/UmmCommon_1.2.xsd': 'UmmCommon_1.2.xsd',
+    'https://gcmd.gsfc.nasa.gov/Aboutus/xml/dif/UmmCommon_1.2.xsd': 'UmmCommon_1.2.xsd',
+}
+
+
+class CatalogResolver(etree.Resolver):
+    """Resolves schema locations and includes to local copies from the catalog, or downloads them if allowed."""
+
+    def __init__(self, catalog):
+        super(CatalogResolver, self).__init__()
+        self.catalog = catalog
+
+    def resolve(self, url, public_id, context):
+        local_path = self.catalog.get_local_path(url)
+        if local_path:
+            return self.resolve_filename(local_path, context)
+        if self.catalog.download and url.startswith(('http://', 'https://')):
+            return self.resolve_string(self.catalog.download_xsd(url), context, base_url=url)
+        return None
+
+
+class XSDCatalog(object):
+    # Singleton
+    class __XSDCatalog:
+        def __init__(self):
+            # exact locations and location prefixes (mirrored directories) to local paths
+            self.locations = {}
+            self.prefixes = []
+            self.download = False
+            # compiled schemas by (format name, version)
+            self.schemas = {}
+            # time of the last failure by (format name, version) or downloaded location, with its message
+            self.failures = {}
+            self.lock = threading.Lock()
+            for url, file_name in DEFAULT_XSD_LOCATIONS.items():
+                self.add_location(url, os.path.join(XSD_DIRECTORY, file_name))
+
+        def add_location(self, url, local_path):
+            """Map a schema location, or a location prefix ending with '/' to a local directory."""
+            with self.lock:
+                if url.endswith('/'):
+                    self.prefixes = [(url, local_path)] + [prefix for prefix in self.prefixes if prefix[0] != url]
+                else:
+                    self.locations[url] = os.path.abspath(local_path)
+                self.schemas = {}
+                self.failures = {}
+
+        def get_local_path(self, url):
+            local_path = self.locations.get(url)
+            if local_path:
+                return local_path
+            for prefix, directory in self.prefixes:
+                if url.startswith(prefix):
+                    local_path = os.path.abspath(os.path.join(directory, url[len(prefix):]))
+                    if os.path.isfile(local_path):
+                        return local_path
+            return None
+
+        def _check_failure(self, key):
+            failure = self.failures.get(key)
+            if failure and time.time() - failure[0] < FAILURE_RETRY_INTERVAL:
+                raise ValueError('{0} failed {1:.0f} seconds ago: {2}'.format(key, time.time() - failure[0],
+                                                                              failure[1]))
+
+        def download_xsd(self, url):
+            self._check_failure(url)
+            log.debug('Downloading XSD {0}'.format(url))
+            # only needed for missing local copies, not imported with the converters
+            import requests
+            try:
+                response = requests.get(url, timeout=DOWNLOAD_TIMEOUT)
+                response.raise_for_status()
+            except Exception as e:
+                self.failures[url] = (time.time(), str(e))
+                raise
+            return response.content
+
+        def get_parser(self):
+            parser = etree.XMLParser()
+            parser.resolvers.add(CatalogResolver(self))
+            return parser
+
+        def get_schema(self, metadata_format):
+            """Return the compiled XMLSchema of an XMLMetadataFormat, compiled once per format and version.
+
+            A failed compilation raises again without being retried for FAILURE_RETRY_INTERVAL seconds.
+            """
+            key = (metadata_format.get_format_name(), metadata_format.get_version())
+            schema = self.schemas.get(key)
+            if schema is None:
+                with self.lock:
+                    schema = self.schemas.get(key)
+                    if schema is None:
+                        self._check_failure(key)
+                        try:
+                            schema = self._compile_schema(metadata_format.get_xsd_url())
+                        except Exception as e:
+                            self.failures[key] = (time.time(), str(e))
+                            raise
+                        self.schemas[key] = schema
+            return schema
+
+        def _compile_schema(self, xsd_url):
+            local_path = self.get_local_path(xsd_url)
+            if local_path:
+                log.debug('Compiling XSD {0} from {1}'.format(xsd_url, local_path))
+                xsd_dom = etree.parse(local_path, parser=self.get_parser())
+            elif self.download:
+                xsd_dom = etree.fromstring(self.download_xsd(xsd_url), parser=self.get_parser(), base_url=xsd_url)
+            else:
+                raise ValueError('No local copy of XSD {0} and downloads are disabled'.format(xsd_url))
+            return etree.XMLSchema(xsd_dom)
+
+        def __repr__(self):
+            return str(self)
+
+        def __str__(self):
+            return str(self).encode('utf-8')
+
+        def __unicode__(self):
+            return u'XSDCatalog ({num_locations} locations, {num_prefixes} prefixes)'.format(
+                num_locations=len(self.locations), num_prefixes=len(self.prefixes))
+
+    instance = None
+
+    def __new__(cls):  # __new__ always a classmethod
+        if not XSDCatalog.instance:
+            XSDCatalog.instance = XSDCatalog.__XSDCatalog()
+        return XSDCatalog.instance
+
+
+def configure_xsd_catalog(config):
+    """Add the local schema copies set in the configuration.
+
+    package_converter.xsd_catalog is a list of location/path pairs, locations ending with '/' map whole
+    directories (for schemas with includes), package_converter.xsd_download = true allows downloading the
+    schemas missing in the catalog.
+    """
+    catalog_entries = config.get('package_converter.xsd_catalog', '').split()
+    if len(catalog_entries) % 2:
+        raise ValueError('package_converter.xsd_catalog must be a list of location and path pairs')
+    for url, local_path in zip(catalog_entries[0::2], catalog_entries[1::2]):
+        XSDCatalog().add_location(url, local_path)
+    XSDCatalog().download = str(config.get('package_converter.xsd_download', 'false')).strip().lower() in \
+        ['true', 'yes', 'on', '1']
+    return XSDCatalog()
@@ -0,0 +1,337 @@
+import base64
+import datetime
+import json
+
+import six
+from six.moves.urllib.parse import urlparse
+
+import ckan.plugins.toolkit as toolkit
+
+from ckanext.package_converter.logic import convert_dataset, get_export_context, get_view_key, _get_ckan_format_name
+from ckanext.package_converter.model.metadata_format import MetadataFormats, XMLMetadataFormat
+from ckanext.package_converter.model.converter import Converters
+from ckanext.package_converter.model.record import Record
+from ckanext.package_converter.model.xml_writer import escape, quoteattr
+
+from logging import getLogger
+
+log = getLogger(__name__)
+
+OAI_NAMESPACE = 'http://www.openarchives.org/OAI/2.0/'
+OAI_SCHEMA = 'http://www.openarchives.org/OAI/2.0/OAI-PMH.xsd'
+DEFAULT_PAGE_SIZE = 100
+
+# required and optional arguments of each verb, resumptionToken is exclusive
+VERB_ARGUMENTS = {
+    'Identify': ([], []),
+    'ListMetadataFormats': ([], ['identifier']),
+    'ListSets': ([], ['resumptionToken']),
+    'ListIdentifiers': (['metadataPrefix'], ['from', 'until', 'set', 'resumptionToken']),
+    'ListRecords': (['metadataPrefix'], ['from', 'until', 'set', 'resumptionToken']),
+    'GetRecord': (['identifier', 'metadataPrefix'], []),
+}
+
+DATESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+DATE_FORMAT = '%Y-%m-%d'
+
+
+class OAIError(Exception):
+    """OAI-PMH error, the code is one of the error codes of the protocol (badArgument, noRecordsMatch...)."""
+
+    def __init__(self, code, message=''):
+        super(OAIError, self).__init__(message)
+        self.code = code
+        self.message = message
+
+
+def get_oai_response(arguments, base_url, context):
+    """Return the OAI-PMH response to the request arguments as an iterator of text chunks.
+
+    The arguments are validated and the datasets searched before returning, so errors are answered
+    completely, while the records of the page are converted (or read from the export cache) as the
+    response is iterated.
+    """
+    response_date = datetime.datetime.utcnow()
+    verb = arguments.get('verb', [''])[0]
+    request_arguments = {}
+    try:
+        request_arguments = _check_arguments(verb, arguments)
+        if verb == 'Identify':
+            body = _identify(base_url, context)
+        elif verb == 'ListMetadataFormats':
+            body = _list_metadata_formats(request_arguments.get('identifier'), base_url, context)
+        elif verb == 'ListSets':
+            raise OAIError('noSetHierarchy', 'This repository does not support sets')
+        elif verb == 'GetRecord':
+            body = _get_record(request_arguments['identifier'], request_arguments['metadataPrefix'], base_url,
+                               context)
+        else:
+            body = _list_records(request_arguments, base_url, context, with_metadata=(verb == 'ListRecords'))
+    except OAIError as e:
+        # badVerb and badArgument responses do not echo the arguments
+        if e.code in ['badVerb', 'badArgument']:
+            verb = None
+            request_arguments = {}
+        body = iter([u'<error code={0}>{1}</error>\n'.format(quoteattr(e.code), escape(e.message))])
+    return _iter_envelope(response_date, base_url, verb, request_arguments, body)
+
+
+def _iter_envelope(response_date, base_url, verb, request_arguments, body):
+    yield u'<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield u'<OAI-PMH xmlns={0} xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" ' \
+          u'xsi:schemaLocation={1}>\n'.format(quoteattr(OAI_NAMESPACE), quoteattr(OAI_NAMESPACE + ' ' + OAI_SCHEMA))
+    yield u'<responseDate>{0}</responseDate>\n'.format(response_date.strftime(DATESTAMP_FORMAT))
+    attributes = u''
+    if verb:
+        attributes = u' verb={0}'.format(quoteattr(verb)) + u''.join(
+            [u' {0}={1}'.format(name, quoteattr(value)) for name, value in sorted(request_arguments.items())])
+    yield u'<request{0}>{1}</request>\n'.format(attributes, escape(base_url))
+    for chunk in body:
+        yield chunk
+    yield u'</OAI-PMH>\n'
+
+
+def _check_arguments(verb, arguments):
+    if verb not in VERB_ARGUMENTS:
+        raise OAIError('badVerb', 'Illegal OAI verb {0}'.format(verb))
+    if len(arguments.get('verb', [])) > 1:
+        raise OAIError('badVerb', 'Repeated verb')
+    required_arguments, optional_arguments = VERB_ARGUMENTS[verb]
+    request_arguments = {}
+    for name, values in arguments.items():
+        if name == 'verb':
+            continue
+        if name not in required_arguments + optional_arguments:
+            raise OAIError('badArgument', 'Illegal argument {0}'.format(name))
+        if len(values) > 1:
+            raise OAIError('badArgument', 'Repeated argument {0}'.format(name))
+        request_arguments[name] = values[0]
+    if 'resumptionToken' in request_arguments:
+        if len(request_arguments) > 1:
+            raise OAIError('badArgument', 'resumptionToken is an exclusive argument')
+        return request_arguments
+    for name in required_arguments:
+        if not request_arguments.get(name):
+            raise OAIError('badArgument', 'Missing argument {0}'.format(name))
+    return request_arguments
+
+
+def _identify(base_url, context):
+    config = toolkit.config
+    site_url = config.get('ckan.site_url', base_url)
+    admin_email = config.get('package_converter.oai.admin_email') or config.get('email_to') or \
+        config.get('smtp.mail_from') or 'admin@{0}'.format(_get_repository_domain(base_url))
+    earliest_datestamp = '1970-01-01T00:00:00Z'
+    search_result = _search(context, '*:*', 0, 1)
+    if search_result.get('results'):
+        earliest_datestamp = _get_datestamp(search_result['results'][0])
+    yield u'<Identify>\n'
+    for name, value in [('repositoryName', config.get('ckan.site_title', site_url)),
+                        ('baseURL', base_url),
+                        ('protocolVersion', '2.0'),
+                        ('adminEmail', admin_email),
+                        ('earliestDatestamp', earliest_datestamp),
+                        ('deletedRecord', 'no'),
+                        ('granularity', 'YYYY-MM-DDThh:mm:ssZ')]:
+        yield u'\t<{0}>{1}</{0}>\n'.format(name, escape(value))
+    yield u'</Identify>\n'
+
+
+def get_oai_metadata_formats(type='package'):
+    """Return the XML formats the datasets can be converted to, by metadata prefix."""
+    ckan_format = MetadataFormats().get_metadata_formats(_get_ckan_format_name(type))[0]
+    metadata_formats = {}
+    for output_format in Converters().get_reachable_formats(ckan_format):
+        format_name = output_format.get_format_name()
+        if format_name != 'oai_pmh' and format_name not in metadata_formats:
+            # the same format as the exports requested by name
+            metadata_format = MetadataFormats().get_metadata_formats(format_name)[0]
+            if isinstance(metadata_format, XMLMetadataFormat):
+                metadata_formats[format_name] = metadata_format
+    return metadata_formats
+
+
+def _list_metadata_formats(identifier, base_url, context):
+    if identifier:
+        _get_dataset(identifier, base_url, context)
+    metadata_formats = get_oai_metadata_formats()
+    if not metadata_formats:
+        raise OAIError('noMetadataFormats', 'No metadata formats available')
+    return _iter_metadata_formats(metadata_formats)
+
+
+def _iter_metadata_formats(metadata_formats):
+    yield u'<ListMetadataFormats>\n'
+    for metadata_prefix, metadata_format in sorted(metadata_formats.items()):
+        yield u'\t<metadataFormat>\n\t\t<metadataPrefix>{0}</metadataPrefix>\n\t\t<schema>{1}</schema>\n' \
+              u'\t\t<metadataNamespace>{2}</metadataNamespace>\n\t</metadataFormat>\n'.format(
+                escape(metadata_prefix), escape(metadata_format.get_xsd_url()),
+                escape(metadata_format.get_namespace()))
+    yield u'</ListMetadataFormats>\n'
+
+
+def _get_record(identifier, metadata_prefix, base_url, context):
+    output_format = _get_output_format(metadata_prefix)
+    dataset_dict = _get_dataset(identifier, base_url, context)
+    converted_record = convert_dataset(dataset_dict, output_format, view_key=get_view_key(context))
+    if not isinstance(converted_record, Record):
+        raise OAIError('cannotDisseminateFormat', 'Cannot convert {0} to {1}'.format(identifier, metadata_prefix))
+    return iter([u'<GetRecord>\n', _get_record_xml(dataset_dict, converted_record, base_url), u'</GetRecord>\n'])
+
+
+def _list_records(request_arguments, base_url, context, with_metadata=True):
+    if 'resumptionToken' in request_arguments:
+        metadata_prefix, from_date, until_date, cursor = _parse_resumption_token(request_arguments['resumptionToken'])
+    else:
+        metadata_prefix = request_arguments['metadataPrefix']
+        if request_arguments.get('set'):
+            raise OAIError('noSetHierarchy', 'This repository does not support sets')
+        from_date = _parse_date(request_arguments.get('from'), 'from')
+        until_date = _parse_date(request_arguments.get('until'), 'until', end_of_day=True)
+        if from_date and until_date:
+            if len(request_arguments['from']) != len(request_arguments['until']):
+                raise OAIError('badArgument', 'from and until have a different granularity')
+            if from_date > until_date:
+                raise OAIError('badArgument', 'from is later than until')
+        # the harvest is bounded by the time of its first request, so later updates do not shift the pages
+        until_date = until_date or datetime.datetime.utcnow().replace(microsecond=0)
+        cursor = 0
+    output_format = _get_output_format(metadata_prefix)
+
+    page_size = int(toolkit.config.get('package_converter.oai.page_size', DEFAULT_PAGE_SIZE))
+    query = u'metadata_modified:[{0} TO {1}]'.format(_get_solr_date(from_date) if from_date else '*',
+                                                     _get_solr_date(until_date, end_of_second=True))
+    search_result = _search(context, query, cursor, page_size)
+    datasets = search_result.get('results', [])
+    complete_list_size = search_result.get('count', 0)
+    if not datasets:
+        if cursor:
+            raise OAIError('badResumptionToken', 'The resumption token is past the end of the list')
+        raise OAIError('noRecordsMatch', 'No datasets match the arguments')
+
+    resumption_token = None
+    if cursor + len(datasets) < complete_list_size:
+        resumption_token = _get_resumption_token(metadata_prefix, from_date, until_date, cursor + len(datasets))
+    elif cursor:
+        # the last page of a list has an empty token
+        resumption_token = ''
+    return _iter_records(datasets, output_format, base_url, with_metadata, resumption_token, complete_list_size,
+                         cursor, get_view_key(context, 'package_search'))
+
+
+def _iter_records(datasets, output_format, base_url, with_metadata, resumption_token, complete_list_size, cursor,
+                  view_key):
+    verb = 'ListRecords' if with_metadata else 'ListIdentifiers'
+    yield u'<{0}>\n'.format(verb)
+    export_context = get_export_context() if with_metadata else None
+    for dataset_dict in datasets:
+        if not with_metadata:
+            yield _get_header_xml(dataset_dict, base_url)
+            continue
+        converted_record = convert_dataset(dataset_dict, output_format, export_context=export_context,
+                                           view_key=view_key)
+        if isinstance(converted_record, Record):
+            yield _get_record_xml(dataset_dict, converted_record, base_url)
+        else:
+            log.warning('OAI-PMH skipped {0}: {1}'.format(dataset_dict.get('id'), converted_record))
+    if resumption_token is not None:
+        yield u'\t<resumptionToken completeListSize="{0}" cursor="{1}">{2}</resumptionToken>\n'.format(
+            complete_list_size, cursor, escape(resumption_token))
+    yield u'</{0}>\n'.format(verb)
+
+
+def _get_header_xml(dataset_dict, base_url):
+    return u'\t<header>\n\t\t<identifier>{0}</identifier>\n\t\t<datestamp>{1}</datestamp>\n\t</header>\n'.format(
+        escape(get_oai_identifier(dataset_dict, base_url)), _get_datestamp(dataset_dict))
+
+
+def _get_record_xml(dataset_dict, converted_record, base_url):
+    converted_content = converted_record.get_content()
+    if isinstance(converted_content, bytes):
+        converted_content = converted_content.decode('utf-8')
+    # the record is embedded, without its XML declaration
+    converted_content = converted_content.strip()
+    if converted_content.startswith('<?xml'):
+        converted_content = converted_content[converted_content.index('?>') + 2:].lstrip()
+    return u'<record>\n{0}\t<metadata>\n{1}\n\t</metadata>\n</record>\n'.format(
+        _get_header_xml(dataset_dict, base_url), converted_content)
+
+
+def get_oai_identifier(dataset_dict, base_url):
+    return u'oai:{0}:{1}'.format(_get_repository_domain(base_url), dataset_dict.get('id'))
+
+
+def _get_repository_domain(base_url):
+    return urlparse(toolkit.config.get('ckan.site_url') or base_url).netloc.split(':')[0]
+
+
+def _get_dataset(identifier, base_url, context):
+    # OAI identifiers or dataset ids and names
+    prefix = u'oai:{0}:'.format(_get_repository_domain(base_url))
+    dataset_id = identifier[len(prefix):] if identifier.startswith(prefix) else identifier
+    try:
+        return toolkit.get_action('package_show')(dict(context), {'id': dataset_id})
+    except (toolkit.ObjectNotFound, toolkit.NotAuthorized):
+        raise OAIError('idDoesNotExist', 'Unknown identifier {0}'.format(identifier))
+
+
+def _get_output_format(metadata_prefix):
+    output_format = get_oai_metadata_formats().get(metadata_prefix)
+    if not output_format:
+        raise OAIError('cannotDisseminateFormat', 'Metadata format unknown {0}'.format(metadata_prefix))
+    return output_format
+
+
+def _search(context, query, start, rows):
+    # public datasets only, oldest first so the pages of a harvest are stable
+    search_dict = {'q': query, 'start': start, 'rows': rows, 'sort': 'metadata_modified asc, id asc',
+                   'include_private': False}
+    return toolkit.get_action('package_search')(dict(context), search_dict)
+
+
+def _get_datestamp(dataset_dict):
+    metadata_modified = dataset_dict.get('metadata_modified') or ''
+    return metadata_modified[:len('YYYY-MM-DDThh:mm:ss')] + 'Z'
+
+
+def _parse_date(value, name, end_of_day=False):
+    if not value:
+        return None
+    for date_format in [DATESTAMP_FORMAT, DATE_FORMAT]:
+        try:
+            date = datetime.datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+        if end_of_day and date_format == DATE_FORMAT:
+            date = date.replace(hour=23, minute=59, second=59)
+        return date
+    raise OAIError('badArgument', 'Illegal {0} date {1}'.format(name, value))
+
+
+def _get_solr_date(date, end_of_second=False):
+    # metadata_modified has microseconds, the datestamps of the second until are included
+    if end_of_second:
+        return date.strftime('%Y-%m-%dT%H:%M:%S.999Z')
+    return date.strftime(DATESTAMP_FORMAT)
+
+
+def _get_resumption_token(metadata_prefix, from_date, until_date, cursor):
+    token_dict = {'m': metadata_prefix, 'f': _get_solr_date(from_date) if from_date else '',
+                  'u': _get_solr_date(until_date), 'c': cursor}
+    token = base64.urlsafe_b64encode(json.dumps(token_dict, sort_keys=True).encode('utf-8'))
+    return token.decode('ascii').rstrip('=')
+
+
+def _parse_resumption_token(resumption_token):
+    try:
+        token = resumption_token.encode('ascii')
+        token_dict = json.loads(base64.urlsafe_b64decode(token + b'=' * (-len(token) % 4)).decode('utf-8'))
+        from_date = _parse_date(token_dict['f'], 'from')
+        until_date = _parse_date(token_dict['u'], 'until')
+        cursor = int(token_dict['c'])
+        metadata_prefix = token_dict['m']
+        if not isinstance(metadata_prefix, six.string_types) or cursor < 0:
+            raise ValueError('Illegal token values')
+    except (ValueError, KeyError, TypeError, OAIError, UnicodeError):
+        raise OAIError('badResumptionToken', 'Illegal resumption token {0}'.format(resumption_token))
+    return metadata_prefix, from_date, until_date, cursor
@@ -1,14 +1,15 @@
 import ckan.plugins as plugins
 import ckan.plugins.toolkit as toolkit
-import json
-import ckanext.package_converter.logic
+import ckanext.package_converter.auth
 
 from ckanext.package_converter.model.converter import Converters
+from ckanext.package_converter.model.stats import configure_conversion_stats
+from ckanext.package_converter.cache import configure_export_cache
+# the actions, blueprints, commands and store (with Flask, click and multiprocessing) are imported by the methods
+# using them when CKAN first calls them, not when the plugin is loaded
 
 from logging import getLogger
 
-import ckanext.package_converter.blueprints as blueprints
-
 log = getLogger(__name__)
 
 DEAFULT_BASE_CONVERTER = 'ckanext.package_converter.model.scheming_converter.Datacite43SchemingConverter'
@@ -18,9 +19,12 @@ DEAFULT_RESOURCE_BASE_CONVERTER = 'ckanext.package_converter.model.scheming_reso
 class Package_ConverterPlugin(plugins.SingletonPlugin):
     plugins.implements(plugins.IConfigurer)
     plugins.implements(plugins.IActions)
+    plugins.implements(plugins.IAuthFunctions)
     # plugins.implements(plugins.IRoutes, inherit=True)
     plugins.implements(plugins.ITemplateHelpers, inherit=True)
     plugins.implements(plugins.IBlueprint, inherit=True)
+    plugins.implements(plugins.IClick)
+    plugins.implements(plugins.IPackageController, inherit=True)
 
     # IConfigurer
     def update_config(self, config_):
@@ -35,6 +39,20 @@ class Package_ConverterPlugin(plugins.SingletonPlugin):
         for custom_converter in custom_converters:
             Converters().add_converter_by_name(custom_converter)
 
+        # Local copies of the XSD used to validate
+        from ckanext.package_converter.model.xsd_catalog import configure_xsd_catalog
+        configure_xsd_catalog(config_)
+
+        # Cache of converted packages
+        configure_export_cache(config_)
+
+        # Exports rendered when packages change
+        from ckanext.package_converter.store import configure_export_store
+        configure_export_store(config_)
+
+        # Latency of the conversions and cache hit ratios
+        configure_conversion_stats(config_)
+
     # # IRoutes
     # def before_map(self, map_):
     #     map_.connect(
@@ -53,11 +71,29 @@ class Package_ConverterPlugin(plugins.SingletonPlugin):
 
     # IActions
     def get_actions(self):
+        import ckanext.package_converter.logic
         return {
             'package_export':
                 ckanext.package_converter.logic.package_export,
             'resource_export':
                 ckanext.package_converter.logic.resource_export,
+            'package_export_bulk':
+                ckanext.package_converter.logic.package_export_bulk,
+            'package_resources_export':
+                ckanext.package_converter.logic.package_resources_export,
+            'package_converter_stats':
+                ckanext.package_converter.logic.package_converter_stats,
+            'package_converter_profile':
+                ckanext.package_converter.logic.package_converter_profile,
+        }
+
+    # IAuthFunctions
+    def get_auth_functions(self):
+        return {
+            'package_converter_stats':
+                ckanext.package_converter.auth.package_converter_stats,
+            'package_converter_profile':
+                ckanext.package_converter.auth.package_converter_profile,
         }
 
     def get_helpers(self):
@@ -71,18 +107,51 @@ class Package_ConverterPlugin(plugins.SingletonPlugin):
         return None
 
     def package_converter_schemaorg_json(self, package_id):
-        converted_package = {}
+        import ckanext.package_converter.logic
+        # the page package dict can be given instead of its id, to avoid reading it again
+        if isinstance(package_id, dict):
+            return ckanext.package_converter.logic.get_embedded_json(package_id, 'schemaorg')
         if package_id:
             try:
-                converted_package = toolkit.get_action(
-                    'package_export')(
-                    {'as_dict': True}, {'id': package_id, 'format': 'schemaorg'})
+                package_dict = toolkit.get_action('package_show')({}, {'id': package_id})
             except toolkit.ObjectNotFound:
                 toolkit.abort(404, 'Dataset not found')
-            return json.dumps(converted_package, indent=4, ensure_ascii=False)
+            return ckanext.package_converter.logic.get_embedded_json(package_dict, 'schemaorg')
         else:
             return ''
 
+    # IPackageController
+    def after_create(self, context, pkg_dict):
+        from ckanext.package_converter.store import get_export_store, enqueue_render_package
+        if get_export_store() and pkg_dict.get('id'):
+            enqueue_render_package(pkg_dict['id'])
+
+    def after_update(self, context, pkg_dict):
+        from ckanext.package_converter.store import get_export_store, enqueue_render_package
+        if get_export_store() and pkg_dict.get('id'):
+            enqueue_render_package(pkg_dict['id'])
+
+    def after_delete(self, context, pkg_dict):
+        from ckanext.package_converter.store import get_export_store, enqueue_delete_package
+        if get_export_store() and pkg_dict.get('id'):
+            enqueue_delete_package(pkg_dict['id'])
+
+    # IPackageController (CKAN 2.10)
+    def after_dataset_create(self, context, pkg_dict):
+        self.after_create(context, pkg_dict)
+
+    def after_dataset_update(self, context, pkg_dict):
+        self.after_update(context, pkg_dict)
+
+    def after_dataset_delete(self, context, pkg_dict):
+        self.after_delete(context, pkg_dict)
+
     # IBlueprint
     def get_blueprint(self):
+        import ckanext.package_converter.blueprints as blueprints
         return blueprints.get_blueprints(self.name, self.__module__)
+
+    # IClick
+    def get_commands(self):
+        import ckanext.package_converter.cli as cli
+        return cli.get_commands()
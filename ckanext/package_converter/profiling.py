@@ -0,0 +1,62 @@
+import cProfile
+import pstats
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2
+    tracemalloc = None
+
+from logging import getLogger
+
+log = getLogger(__name__)
+
+DEFAULT_PROFILE_LIMIT = 20
+PROFILE_SORT_KEYS = ['cumulative', 'tottime', 'calls']
+
+# one profiler can be active at a time
+_profile_lock = threading.Lock()
+
+
+def profile_call(function, limit=DEFAULT_PROFILE_LIMIT, sort='cumulative'):
+    """Call the function under cProfile, and tracemalloc if available, and return its result with the profile.
+
+    The profile holds the duration, the peak memory allocated during the call in bytes (None without
+    tracemalloc) and the top functions sorted by cumulative time, own time or number of calls.
+    """
+    if sort not in PROFILE_SORT_KEYS:
+        raise ValueError('Cannot sort a profile by {0}, only by {1}'.format(sort, ', '.join(PROFILE_SORT_KEYS)))
+    with _profile_lock:
+        was_tracing = tracemalloc is not None and tracemalloc.is_tracing()
+        if tracemalloc is not None:
+            if not was_tracing:
+                tracemalloc.start()
+            elif hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        profiler = cProfile.Profile()
+        start = time.time()
+        try:
+            result = profiler.runcall(function)
+        finally:
+            duration = time.time() - start
+            peak_memory = None
+            if tracemalloc is not None:
+                peak_memory = max(tracemalloc.get_traced_memory()[1] - start_memory, 0)
+                if not was_tracing:
+                    tracemalloc.stop()
+    return result, {'duration': duration, 'peak_memory': peak_memory,
+                    'functions': _get_top_functions(profiler, limit, sort)}
+
+
+def _get_top_functions(profiler, limit, sort):
+    # pstats keeps (primitive calls, calls, own time, cumulative time, callers) by (file, line, function)
+    sort_index = {'cumulative': 3, 'tottime': 2, 'calls': 1}[sort]
+    function_stats = sorted(pstats.Stats(profiler).stats.items(), key=lambda item: item[1][sort_index],
+                            reverse=True)
+    return [{'function': u'{0}:{1}({2})'.format(file_name, line, function_name), 'calls': calls,
+             'primitive_calls': primitive_calls, 'tottime': own_time, 'cumtime': cumulative_time}
+            for (file_name, line, function_name), (primitive_calls, calls, own_time, cumulative_time, callers)
+            in function_stats[:limit]]
@@ -0,0 +1,178 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+import ckan.plugins.toolkit as toolkit
+
+from ckanext.package_converter.cache import FileExportCache
+from ckanext.package_converter.logic import convert_dataset, get_dataset_record, get_export_context, get_view_key, \
+    _get_cache_key, _get_ckan_format_name
+from ckanext.package_converter.model.metadata_format import MetadataFormats
+from ckanext.package_converter.model.converter import Converters
+from ckanext.package_converter.model.record import Record
+from ckanext.package_converter.model.stats import count_cache_lookup
+
+from logging import getLogger
+
+log = getLogger(__name__)
+
+
+class ExportStore(FileExportCache):
+    """Persistent store of the exports rendered when a package changes.
+
+    Entries never expire, they are keyed by the package id followed by the export cache key (which holds the
+    package revision and the anonymous view the package was rendered with), and all the entries of a package,
+    including its resources, share a directory removed with delete_package().
+    """
+
+    def __init__(self, directory):
+        FileExportCache.__init__(self, directory, ttl=0)
+
+    def _get_package_directory(self, package_id):
+        return os.path.join(self.directory, package_id[:2], package_id)
+
+    def _get_path(self, key):
+        digest = hashlib.sha1(u'\n'.join(key[1:]).encode('utf-8')).hexdigest()
+        return os.path.join(self._get_package_directory(key[0]), digest)
+
+    def delete_package(self, package_id):
+        shutil.rmtree(self._get_package_directory(package_id), ignore_errors=True)
+
+
+_export_store = None
+_store_format_names = []
+
+
+def get_export_store():
+    return _export_store
+
+
+def set_export_store(export_store, format_names=None):
+    global _export_store, _store_format_names
+    _export_store = export_store
+    _store_format_names = [format_name.lower() for format_name in format_names or []]
+
+
+def configure_export_store(config):
+    """Create the export store if enabled in the configuration.
+
+    package_converter.store = true renders the exports of a package in a background job when it changes,
+    package_converter.store.formats restricts them to some formats (default all), and
+    package_converter.store.directory sets where they are written.
+    """
+    if not toolkit.asbool(config.get('package_converter.store', False)):
+        set_export_store(None)
+        return None
+    default_directory = os.path.join(config.get('ckan.storage_path') or config.get('cache_dir') or
+                                     tempfile.gettempdir(), 'package_converter_store')
+    export_store = ExportStore(config.get('package_converter.store.directory', default_directory))
+    log.debug('Export store: {0}'.format(export_store))
+    set_export_store(export_store, config.get('package_converter.store.formats', '').split())
+    return export_store
+
+
+def get_store_formats(type='package'):
+    """Return the formats rendered to the store, the configured ones reachable from the dataset type."""
+    ckan_format = MetadataFormats().get_metadata_formats(_get_ckan_format_name(type))[0]
+    format_names = set([output_format.get_format_name() for output_format in
+                        Converters().get_reachable_formats(ckan_format)])
+    if _store_format_names:
+        format_names = format_names.intersection(_store_format_names)
+    # the same format as the exports requested by name
+    return [MetadataFormats().get_metadata_formats(format_name)[0] for format_name in sorted(format_names)]
+
+
+def get_store_context():
+    """Return the context the store reads the packages with, the one of an anonymous user.
+
+    Stored exports are only served to the requests with the same view (see logic.get_view_key), plugins changing
+    the dataset dicts by user cannot leak to the anonymous ones.
+    """
+    return {'user': u''}
+
+
+def get_stored_export(dataset_dict, output_format_name, view_key, type='package'):
+    """Return the (content bytes, mimetype) stored for the current revision of a dataset, None if missing.
+
+    Only the requests reading the dataset as an anonymous user (view_key of get_store_context()) are served.
+    """
+    export_store = get_export_store()
+    if not export_store:
+        return None
+    matching_metadata_formats = MetadataFormats().get_metadata_formats(output_format_name.lower())
+    if not matching_metadata_formats:
+        return None
+    if view_key != get_view_key(get_store_context()):
+        return None
+    cache_key = _get_cache_key(dataset_dict, type, matching_metadata_formats[0], view_key)
+    package_id = _get_package_id(dataset_dict, type)
+    if not cache_key or not package_id:
+        return None
+    stored_export = export_store.get((package_id,) + cache_key)
+    count_cache_lookup('store', matching_metadata_formats[0].get_format_name(), bool(stored_export))
+    return stored_export
+
+
+def _get_package_id(dataset_dict, type='package'):
+    if type == 'resource':
+        return dataset_dict.get('package_id') or dataset_dict.get('package_dict', {}).get('id')
+    return dataset_dict.get('id')
+
+
+def enqueue_render_package(package_id):
+    toolkit.enqueue_job(render_package_exports, [package_id],
+                        title=u'package_converter render {0}'.format(package_id))
+
+
+def enqueue_delete_package(package_id):
+    toolkit.enqueue_job(delete_package_exports, [package_id],
+                        title=u'package_converter delete {0}'.format(package_id))
+
+
+def render_package_exports(package_id):
+    """Background job rendering a package and its resources to the store formats.
+
+    The package is read as an anonymous user, the entries of older revisions are removed and packages the
+    anonymous user cannot read are not stored. Failed conversions are left to the live conversion.
+    """
+    export_store = get_export_store()
+    if not export_store:
+        return
+    context = get_store_context()
+    try:
+        package_dict = toolkit.get_action('package_show')(context, {'id': package_id})
+    except (toolkit.ObjectNotFound, toolkit.NotAuthorized):
+        export_store.delete_package(package_id)
+        return
+    view_key = get_view_key(context)
+
+    export_store.delete_package(package_dict['id'])
+    datasets = [('package', package_dict)]
+    datasets += [('resource', dict(resource_dict, package_dict=package_dict))
+                 for resource_dict in package_dict.get('resources', [])]
+    num_stored = 0
+    export_context = get_export_context()
+    for type, dataset_dict in datasets:
+        dataset_record = get_dataset_record(dataset_dict, type, export_context=export_context)
+        for output_format in get_store_formats(type):
+            cache_key = _get_cache_key(dataset_dict, type, output_format, view_key)
+            if not cache_key:
+                continue
+            converted_record = convert_dataset(dataset_dict, output_format, type, dataset_record=dataset_record,
+                                               view_key=view_key)
+            if not isinstance(converted_record, Record) or not converted_record.get_content():
+                log.warning('Cannot store {0} {1} as {2}'.format(type, dataset_dict.get('id'),
+                                                                 output_format.get_format_name()))
+                continue
+            export_store.set((package_dict['id'],) + cache_key, converted_record.get_content(),
+                             output_format.get_mimetype())
+            num_stored += 1
+    log.debug('Stored {0} exports of package {1}'.format(num_stored, package_dict['id']))
+
+
+def delete_package_exports(package_id):
+    """Background job removing the stored exports of a package."""
+    export_store = get_export_store()
+    if export_store:
+        export_store.delete_package(package_id)
@@ -0,0 +1,52 @@
+import sys
+
+import pytest
+
+from ckanext.package_converter.tests.benchmarks import stubs
+
+try:
+    import pytest_benchmark
+except ImportError:
+    pytest_benchmark = None
+
+if pytest_benchmark is None:
+    collect_ignore = ['test_converters.py', 'test_resource_converter.py', 'test_startup.py']
+
+
+@pytest.fixture(scope='package', autouse=True)
+def ckan_modules():
+    """Register the stand-ins of CKAN while the benchmarks run, if it is not installed.
+
+    The modules of the extension imported with them are unloaded afterwards, the other tests of the session
+    import the real modules again, or fail to.
+    """
+    monkeypatch = pytest.MonkeyPatch()
+    module_names = set(sys.modules)
+    installed = stubs.install_modules(monkeypatch)
+    yield
+    monkeypatch.undo()
+    if installed:
+        stubs.remove_modules(set(sys.modules) - module_names)
+
+
+@pytest.fixture(scope='package')
+def converter_modules(ckan_modules):
+    """Import the converter modules with the CKAN objects they use replaced by stand-ins."""
+    import ckanext.package_converter.model
+    from ckanext.package_converter.model import converter, scheming_converter, scheming_resource_converter, \
+        envidat_iso_converter, envidat_dif_converter, envidat_dcat_ap_ch_converter, \
+        envidat_schemaorg_dataset_converter, envidat_bibtex_converter, envidat_ris_converter, \
+        envidat_readme_converter, envidat_csv_converter
+    modules = [scheming_converter, scheming_resource_converter, envidat_iso_converter, envidat_dif_converter,
+               envidat_dcat_ap_ch_converter, envidat_schemaorg_dataset_converter, envidat_bibtex_converter,
+               envidat_ris_converter, envidat_readme_converter, envidat_csv_converter]
+    monkeypatch = pytest.MonkeyPatch()
+    for module in modules:
+        stubs.patch_module(monkeypatch, module)
+
+    # the XSL chains start from DataCite, registered by the plugin configuration otherwise
+    datacite_converter = scheming_converter.Datacite43SchemingConverter()
+    converter.Converters().add_converter(datacite_converter)
+    yield dict([(module.__name__.rsplit('.', 1)[-1], module) for module in modules])
+    converter.Converters().remove_converter(datacite_converter)
+    monkeypatch.undo()
@@ -0,0 +1,88 @@
+"""Synthetic packages shaped like the EnviDat ones, from a minimal record to the heaviest we expect."""
+import json
+import math
+
+
+def make_author(index):
+    return {'given_name': 'Given{0}'.format(index), 'name': 'Family{0}'.format(index),
+            'affiliation': 'WSL & Partners <{0}>'.format(index), 'affiliation_02': 'ETH' if index % 5 == 0 else '',
+            'identifier': '0000-0002-{0:04d}-0000'.format(index) if index % 3 == 0 else '',
+            'identifier_scheme': 'orcid' if index % 3 == 0 else '', 'email': 'author{0}@wsl.ch'.format(index)}
+
+
+def make_resource(index, package_id):
+    return {'id': 'resource-{0:04d}'.format(index), 'package_id': package_id,
+            'name': 'Resource {0}'.format(index), 'description': 'Description of resource {0}\nover lines'.format(index),
+            'format': ['CSV', 'ZIP', 'PDF', ''][index % 4],
+            'mimetype': ['text/csv', 'application/zip', '', ''][index % 4], 'mimetype_inner': None,
+            'url': 'https://www.envidat.ch/dataset/benchmark/resource/resource-{0:04d}/download/file{0}.csv'.format(
+                index) if index % 2 else '',
+            'created': '2020-01-{0:02d}T10:00:00.000000'.format(index % 28 + 1),
+            'last_modified': '2021-02-03T04:05:06' if index % 2 else None,
+            'metadata_modified': '2021-02-03T04:05:06',
+            'size': 1024 * index if index % 3 == 0 else None,
+            'resource_size': json.dumps({'size_value': str(index), 'size_unit': 'mb'}) if index % 3 == 1 else '',
+            'restricted': json.dumps({'level': ['public', 'registered', 'same_organization'][index % 3],
+                                      'allowed_users': ''}) if index % 2 else '',
+            'doi': ''}
+
+
+def make_spatial(geometry_type, num_vertices):
+    if geometry_type == 'Point':
+        return {'type': 'Point', 'coordinates': [8.4, 47.36]}
+    if geometry_type == 'MultiPoint':
+        return {'type': 'MultiPoint',
+                'coordinates': [[6 + index * 0.001, 46 + index * 0.0005] for index in range(num_vertices)]}
+    # a closed ring around Davos
+    vertices = []
+    for index in range(num_vertices):
+        angle = 2 * math.pi * index / num_vertices
+        vertices.append([round(8 + math.cos(angle), 6), round(46.5 + 0.5 * math.sin(angle), 6)])
+    vertices.append(list(vertices[0]))
+    return {'type': 'Polygon', 'coordinates': [vertices]}
+
+
+def make_notes(num_paragraphs):
+    paragraph = ('## Section\r\n\r\nMeasurements of __snow depth__ and *temperature* with <b>html</b> & markdown, '
+                 'see [the station list](https://www.envidat.ch/stations).\n\n'
+                 '* first item\n* second item\n\n')
+    return (paragraph * num_paragraphs).strip()
+
+
+def make_package(name, num_authors=3, num_resources=3, geometry_type='Polygon', num_vertices=12, num_paragraphs=3,
+                 extras=True):
+    package_id = 'id-' + name
+    return {
+        'id': package_id, 'name': name, 'title': 'Benchmark package {0} & <friends>'.format(name), 'type': 'dataset',
+        'doi': '10.16904/envidat.{0}'.format(len(name)),
+        'notes': make_notes(num_paragraphs),
+        'author': json.dumps([make_author(index) for index in range(num_authors)]),
+        'maintainer': json.dumps({'given_name': 'Maria', 'name': 'Muster', 'email': 'maria@wsl.ch',
+                                  'affiliation': 'WSL', 'identifier': ''}),
+        'publication': json.dumps({'publication_year': '2021', 'publisher': 'EnviDat'}),
+        'date': json.dumps([{'date': '2019-01-01', 'date_type': 'collected', 'end_date': '2019-12-31'},
+                            {'date': '2020-05-05', 'date_type': 'available', 'end_date': ''}]),
+        'funding': json.dumps([{'institution': 'SNF', 'grant_number': '200021'},
+                               {'institution': 'WSL', 'grant_number': ''}]),
+        'language': 'en', 'version': '1.0', 'resource_type': 'dataset', 'resource_type_general': 'dataset',
+        'license_id': 'odc-odbl', 'license_title': 'Open Data Commons Open Database License (ODbL)',
+        'license_url': 'http://www.opendefinition.org/licenses/odc-odbl',
+        'location': 'Davos, Switzerland', 'spatial': json.dumps(make_spatial(geometry_type, num_vertices)),
+        'related_datasets': '* related-one\n* https://example.org/other', 'url': '',
+        'metadata_created': '2019-06-01T12:00:00.123456', 'metadata_modified': '2021-03-04T05:06:07.654321',
+        'private': False, 'num_resources': num_resources,
+        'organization': {'name': 'slf', 'title': 'SLF'},
+        'tags': [{'display_name': 'snow', 'name': 'snow'}, {'display_name': 'avalanche', 'name': 'avalanche'}],
+        'tag_string': 'snow,avalanche',
+        'extras': [{'key': 'status', 'value': 'on going'}, {'key': 'maintenance', 'value': 'as needed'}]
+        if extras else [],
+        'resources': [make_resource(index, package_id) for index in range(num_resources)]}
+
+
+# package factories and the benchmark rounds for each, the heavy one takes seconds per conversion
+PACKAGES = {
+    'minimal': (lambda: make_package('minimal', 1, 0, 'Point', num_paragraphs=1, extras=False), 20),
+    'typical': (lambda: make_package('typical', 5, 6, 'Polygon', 40), 10),
+    'multipoint': (lambda: make_package('multipoint', 8, 5, 'MultiPoint', 30), 10),
+    'heavy': (lambda: make_package('heavy', 500, 1000, 'Polygon', 10000, num_paragraphs=200), 3),
+}
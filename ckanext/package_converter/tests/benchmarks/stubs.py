@@ -0,0 +1,110 @@
+"""Stand-ins for the export context, CKAN model and scheming schema used by the converters.
+
+The benchmarks run without a CKAN installation (or application context): install_modules() registers these
+modules when CKAN cannot be imported, for the benchmarks only, and patch_module() replaces the CKAN modules
+bound in a converter module.
+"""
+import json
+import os
+import sys
+import types
+
+from ckanext.package_converter.model.export_context import ExportContext
+
+SITE_URL = 'https://www.envidat.ch'
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'envidat_schema.json')
+
+
+def get_package_names():
+    return ['related-one']
+
+
+def get_export_context():
+    return ExportContext(SITE_URL, package_names_loader=get_package_names)
+
+
+_schema = None
+
+
+def scheming_get_schema(entity_type, object_type):
+    global _schema
+    if _schema is None:
+        with open(SCHEMA_PATH) as schema_file:
+            _schema = json.load(schema_file)
+    return _schema
+
+
+class License(object):
+
+    def __init__(self, id, title, url):
+        self.id = id
+        self.title = title
+        self.url = url
+
+
+class Package(object):
+
+    @staticmethod
+    def get_license_register():
+        return {'odc-odbl': License('odc-odbl', 'Open Data Commons Open Database License (ODbL)',
+                                    'http://www.opendefinition.org/licenses/odc-odbl'),
+                'cc-by': License('cc-by', 'Creative Commons Attribution',
+                                 'http://www.opendefinition.org/licenses/cc-by')}
+
+
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+
+STUB_MODULES = dict([(module.__name__, module) for module in [
+    _module('ckan'),
+    _module('ckan.model', Package=Package, Session=None),
+    _module('ckanext.scheming'),
+    _module('ckanext.scheming.helpers', scheming_get_schema=scheming_get_schema),
+]])
+
+
+def install_modules(monkeypatch=None):
+    """Register the stand-ins of CKAN and ckanext-scheming if they are not installed, until the monkeypatch is
+    undone if one is given. Return True if any was registered.
+    """
+    installed = False
+    for package_name in ['ckan', 'ckanext.scheming']:
+        try:
+            __import__(package_name + '.helpers' if package_name == 'ckanext.scheming' else package_name)
+        except ImportError:
+            for module_name, module in STUB_MODULES.items():
+                if module_name == package_name or module_name.startswith(package_name + '.'):
+                    if monkeypatch:
+                        monkeypatch.setitem(sys.modules, module_name, module)
+                    else:
+                        sys.modules[module_name] = module
+                    installed = True
+    for module_name, module in STUB_MODULES.items():
+        parent_name, _, child_name = module_name.rpartition('.')
+        if parent_name and sys.modules.get(parent_name) is STUB_MODULES.get(parent_name):
+            setattr(sys.modules[parent_name], child_name, module)
+    return installed
+
+
+def remove_modules(module_names):
+    """Unload the modules of the extension imported with the stand-ins, they are imported again when needed."""
+    for module_name in module_names:
+        if module_name.startswith('ckanext.package_converter.') and module_name in sys.modules:
+            module = sys.modules.pop(module_name)
+            parent_name, _, child_name = module_name.rpartition('.')
+            parent_module = sys.modules.get(parent_name)
+            if parent_module is not None and getattr(parent_module, child_name, None) is module:
+                delattr(parent_module, child_name)
+
+
+def patch_module(monkeypatch, module):
+    """Replace the CKAN modules bound in a converter module by their stand-ins."""
+    for name, value in list(vars(module).items()):
+        if isinstance(value, types.ModuleType) and value.__name__ not in ['ckan', 'ckanext']:
+            stub = STUB_MODULES.get(value.__name__)
+            if stub is not None and stub is not value:
+                monkeypatch.setattr(module, name, stub)
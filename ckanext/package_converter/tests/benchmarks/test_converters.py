@@ -0,0 +1,133 @@
+"""Benchmarks of every converter and XSL chain on synthetic packages, run without CKAN.
+
+`make benchmark-baseline` saves a run on the current machine, `make benchmark` compares to it and fails if a
+conversion is slower by more than the allowed regression.
+"""
+import copy
+
+import pytest
+
+from ckanext.package_converter.tests.benchmarks.data import PACKAGES
+from ckanext.package_converter.tests.benchmarks.stubs import get_export_context
+
+# converter module and class, by benchmark name
+CONVERTERS = {
+    'datacite_4.4': ('scheming_converter', 'Datacite43SchemingConverter'),
+    'iso19139': ('envidat_iso_converter', 'Iso19139Converter'),
+    'gcmd_dif': ('envidat_dif_converter', 'GcmdDifConverter'),
+    'dcat-ap-ch': ('envidat_dcat_ap_ch_converter', 'DcatApChConverter'),
+    'schemaorg': ('envidat_schemaorg_dataset_converter', 'SchemaOrgDadatasetConverter'),
+    'bibtex': ('envidat_bibtex_converter', 'BibtexConverter'),
+    'ris': ('envidat_ris_converter', 'RisConverter'),
+    'readme': ('envidat_readme_converter', 'ReadmeConverter'),
+    'csv': ('envidat_csv_converter', 'CsvConverter'),
+}
+
+# converters building their XML from a dict, written by model/xml_writer.py
+XML_CONVERTERS = ['datacite_4.4', 'iso19139', 'gcmd_dif', 'dcat-ap-ch']
+
+# output formats reached from ckan through DataCite and an XSL transformation
+XSL_CHAINS = ['oai_dc', 'dcat']
+
+# resources of a package converted in one benchmark round
+NUM_RESOURCES = 20
+
+PACKAGE_NAMES = sorted(PACKAGES)
+
+# shared by all the conversions, as in a request or job
+EXPORT_CONTEXT = get_export_context()
+
+def _get_content(converted_record):
+    converted_content = converted_record.get_content()
+    assert converted_content
+    return converted_content
+
+
+def _run(benchmark, convert, make_record, rounds):
+    # a new record per round, so nothing decoded by the previous round is reused
+    result = benchmark.pedantic(convert, setup=lambda: ((make_record(),), {}), rounds=rounds, iterations=1)
+    return _get_content(result)
+
+
+@pytest.mark.parametrize('package_name', PACKAGE_NAMES)
+@pytest.mark.parametrize('converter_name', sorted(CONVERTERS))
+def test_convert(benchmark, converter_modules, package_name, converter_name):
+    from ckanext.package_converter.model.metadata_format import MetadataFormats
+    from ckanext.package_converter.model.record import JSONRecord
+    module_name, class_name = CONVERTERS[converter_name]
+    converter = getattr(converter_modules[module_name], class_name)()
+    make_package, rounds = PACKAGES[package_name]
+    package_dict = make_package()
+    ckan_format = MetadataFormats().get_metadata_formats('ckan')[0]
+    benchmark.group = converter_name
+    _run(benchmark, converter.convert,
+         lambda: JSONRecord(ckan_format, copy.deepcopy(package_dict), export_context=EXPORT_CONTEXT), rounds)
+
+
+@pytest.mark.parametrize('package_name', PACKAGE_NAMES)
+@pytest.mark.parametrize('converter_name', XML_CONVERTERS)
+def test_xml_output_as_xmltodict(converter_modules, package_name, converter_name):
+    # not a benchmark, the written XML must stay the same as xmltodict's and as the parsed DOM
+    import xmltodict
+    from lxml import etree
+    from ckanext.package_converter.model.metadata_format import MetadataFormats
+    from ckanext.package_converter.model.record import JSONRecord, XMLRecord
+    from ckanext.package_converter.model.xml_writer import dict_to_tree
+    module_name, class_name = CONVERTERS[converter_name]
+    converter = getattr(converter_modules[module_name], class_name)()
+    ckan_format = MetadataFormats().get_metadata_formats('ckan')[0]
+    converted_record = converter.convert(JSONRecord(ckan_format, PACKAGES[package_name][0](),
+                                                    export_context=EXPORT_CONTEXT))
+    converted_content = converted_record.get_content()
+    assert converted_content == xmltodict.unparse(converted_record.source_dict, pretty=True,
+                                                  short_empty_elements=converted_record.short_empty_elements)
+    parsed_dom = XMLRecord(converted_record.get_metadata_format(), converted_content)._get_dom('utf-8')
+    assert etree.tostring(dict_to_tree(converted_record.source_dict, pretty=True), method='c14n') == \
+        etree.tostring(parsed_dom, method='c14n')
+
+
+def test_deprecated_is_a_box(converter_modules):
+    # not a benchmark, kept for callers of the converter method, the converters use Geometry.is_a_box
+    converter = converter_modules['envidat_iso_converter'].Iso19139Converter()
+    with pytest.warns(DeprecationWarning):
+        assert converter.is_a_box([[7, 46], [7, 47], [8, 47], [8, 46], [7, 46]])
+    with pytest.warns(DeprecationWarning):
+        assert not converter.is_a_box([[7, 46], [7, 47], [8, 47], [7, 46]])
+
+
+@pytest.mark.parametrize('package_name', PACKAGE_NAMES)
+def test_convert_resources(benchmark, converter_modules, package_name):
+    from ckanext.package_converter.model.metadata_format import MetadataFormats
+    from ckanext.package_converter.model.record import JSONRecord
+    make_package, rounds = PACKAGES[package_name]
+    package_dict = make_package()
+    resource_dicts = [dict(resource_dict, package_dict=package_dict)
+                      for resource_dict in package_dict['resources'][:NUM_RESOURCES]]
+    if not resource_dicts:
+        pytest.skip('package without resources')
+    resource_format = MetadataFormats().get_metadata_formats('ckan_resource')[0]
+
+    def convert_resources(records):
+        # a new converter, so the package part is converted once per round
+        converter = converter_modules['scheming_resource_converter'].Datacite43SchemingResourceConverter()
+        return [converter.convert(record) for record in records][-1]
+
+    benchmark.group = 'datacite_4.4 resources'
+    _run(benchmark, convert_resources,
+         lambda: [JSONRecord(resource_format, resource_dict, export_context=EXPORT_CONTEXT)
+                 for resource_dict in resource_dicts], rounds)
+
+
+@pytest.mark.parametrize('package_name', PACKAGE_NAMES)
+@pytest.mark.parametrize('output_format_name', XSL_CHAINS)
+def test_xsl_chain(benchmark, converter_modules, package_name, output_format_name):
+    from ckanext.package_converter.model.converter import Converters
+    from ckanext.package_converter.model.metadata_format import MetadataFormats
+    from ckanext.package_converter.model.record import JSONRecord
+    make_package, rounds = PACKAGES[package_name]
+    package_dict = make_package()
+    ckan_format = MetadataFormats().get_metadata_formats('ckan')[0]
+    output_format = MetadataFormats().get_metadata_formats(output_format_name)[0]
+    benchmark.group = 'xsl ' + output_format_name
+    _run(benchmark, lambda record: Converters().get_conversion(record, output_format),
+         lambda: JSONRecord(ckan_format, copy.deepcopy(package_dict), export_context=EXPORT_CONTEXT), rounds)
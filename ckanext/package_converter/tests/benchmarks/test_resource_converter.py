@@ -0,0 +1,76 @@
+"""Tests of the package part shared by the DataCite records of the resources of a package."""
+import copy
+
+from ckanext.package_converter.model.export_context import ExportContext
+from ckanext.package_converter.model.metadata_format import MetadataFormats
+from ckanext.package_converter.model.record import JSONRecord
+from ckanext.package_converter.tests.benchmarks import stubs
+from ckanext.package_converter.tests.benchmarks.data import make_package
+
+
+def _convert(converter, package_dict, resource_dict, export_context=None):
+    resource_format = MetadataFormats().get_metadata_formats('ckan_resource')[0]
+    record = JSONRecord(resource_format, dict(resource_dict, package_dict=package_dict),
+                        export_context=export_context or stubs.get_export_context())
+    return converter.convert(record).get_xml_dict()['resource']
+
+
+def test_merge(converter_modules):
+    converter = converter_modules['scheming_resource_converter'].Datacite43SchemingResourceConverter()
+    package_dict = make_package('merge', num_resources=2)
+    datacite_dict = _convert(converter, package_dict, package_dict['resources'][1])
+    # replaced by the resource
+    assert datacite_dict['formats'] == {'format': 'ZIP'}
+    assert datacite_dict['alternateIdentifiers']['alternateIdentifier']['#text'].endswith(
+        '/dataset/id-merge/resource/resource-0001')
+    # merged, the resource name first
+    titles = [title['#text'] for title in datacite_dict['titles']['title']]
+    assert titles == ['Resource 1', package_dict['title']]
+    # inherited from the package
+    assert datacite_dict['publisher']['#text'] == 'EnviDat'
+    assert len(datacite_dict['creators']['creator']) == 3
+
+
+def test_cached_dict_not_changed(converter_modules):
+    converter = converter_modules['scheming_resource_converter'].Datacite43SchemingResourceConverter()
+    package_dict = make_package('unchanged', num_resources=4)
+    _convert(converter, package_dict, package_dict['resources'][0])
+    cached_dicts = copy.deepcopy(converter.package_datacite_dicts)
+    datacite_dicts = [_convert(converter, package_dict, resource_dict) for resource_dict in package_dict['resources']]
+    assert converter.package_datacite_dicts == cached_dicts
+    assert len(cached_dicts) == 1
+    # each resource gets its own identifiers
+    assert len(set([datacite_dict['alternateIdentifiers']['alternateIdentifier']['#text']
+                    for datacite_dict in datacite_dicts])) == 4
+
+
+def test_least_recently_used(converter_modules, monkeypatch):
+    module = converter_modules['scheming_resource_converter']
+    monkeypatch.setattr(module, 'PACKAGE_DATACITE_CACHE_SIZE', 2)
+    converter = module.Datacite43SchemingResourceConverter()
+    package_dicts = [make_package('lru{0}'.format(index), num_resources=1) for index in range(3)]
+    for package_dict in package_dicts[:2]:
+        _convert(converter, package_dict, package_dict['resources'][0])
+    # the first package is used again, the second one is evicted
+    _convert(converter, package_dicts[0], package_dicts[0]['resources'][0])
+    _convert(converter, package_dicts[2], package_dicts[2]['resources'][0])
+    assert [cache_key[0] for cache_key in converter.package_datacite_dicts] == ['id-lru0', 'id-lru2']
+
+
+def test_key_includes_context_and_schema(converter_modules, monkeypatch):
+    converter = converter_modules['scheming_resource_converter'].Datacite43SchemingResourceConverter()
+    package_dict = make_package('key', num_resources=1)
+    resource_dict = package_dict['resources'][0]
+    _convert(converter, package_dict, resource_dict)
+    other_site_dict = _convert(converter, package_dict, resource_dict,
+                               ExportContext('https://other.example.org', package_names_loader=stubs.get_package_names))
+    assert len(converter.package_datacite_dicts) == 2
+    assert other_site_dict['alternateIdentifiers']['alternateIdentifier']['#text'].startswith(
+        'https://other.example.org/')
+
+    schema = copy.deepcopy(stubs.scheming_get_schema('dataset', 'dataset'))
+    schema['dataset_fields'] = schema['dataset_fields'][:-1]
+    monkeypatch.setattr(converter_modules['scheming_converter'].helpers, 'scheming_get_schema',
+                        lambda entity_type, object_type: schema)
+    _convert(converter, package_dict, resource_dict)
+    assert len(converter.package_datacite_dicts) == 3
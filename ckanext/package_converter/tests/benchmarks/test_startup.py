@@ -0,0 +1,22 @@
+"""Benchmark of the converter registration done by the plugin configuration, in a new interpreter per round."""
+import subprocess
+import sys
+
+import pytest
+
+# registers every converter shipped with the extension, like IConfigurer.update_config
+STARTUP_SCRIPT = '''
+from ckanext.package_converter.tests.benchmarks import stubs
+stubs.install_modules()
+from ckanext.package_converter.model.converter import Converters, BUILTIN_CONVERTER_FORMATS
+import ckanext.package_converter.model
+for converter_name in sorted(BUILTIN_CONVERTER_FORMATS):
+    Converters().add_converter_by_name(converter_name, lazy={lazy})
+'''
+
+
+@pytest.mark.parametrize('lazy', [True, False], ids=['lazy', 'eager'])
+def test_register_converters(benchmark, lazy):
+    benchmark.group = 'startup'
+    benchmark.pedantic(subprocess.check_call, args=([sys.executable, '-c', STARTUP_SCRIPT.format(lazy=lazy)],),
+                       rounds=5, iterations=1)
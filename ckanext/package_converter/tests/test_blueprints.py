@@ -0,0 +1,104 @@
+"""Tests for blueprints.py."""
+import datetime
+import io
+import json
+import zipfile
+
+from flask import Flask
+
+from ckanext.package_converter.blueprints import _is_not_modified, _not_modified_response, _iter_ndjson, \
+    _iter_zip, _ZipStream
+from ckanext.package_converter.model.converter import Converter, Converters
+from ckanext.package_converter.model.metadata_format import MetadataFormats, MetadataFormat, FormatType
+from ckanext.package_converter.model.record import Record
+
+from nose.tools import assert_equal, assert_true, assert_false
+
+
+class TestConditionalExport(object):
+
+    def setup_method(self, method=None):
+        self.app = Flask(__name__)
+        self.etag = 'e1b6e9a4b5ff4ef9ab9e70b6c2cd7c5e'
+        self.last_modified = datetime.datetime(2021, 3, 2, 10, 11, 12, 123456)
+
+    def test_modified_without_validators(self):
+        with self.app.test_request_context('/dataset/package-id/export/datacite.xml'):
+            assert_false(_is_not_modified(self.etag, self.last_modified))
+            assert_false(_is_not_modified(None, None))
+
+    def test_not_modified_for_etag(self):
+        with self.app.test_request_context(headers={'If-None-Match': '"{0}"'.format(self.etag)}):
+            assert_true(_is_not_modified(self.etag, self.last_modified))
+            response = _not_modified_response(self.etag, self.last_modified)
+        assert_equal(response.status_code, 304)
+        assert_equal(response.headers.get('ETag'), '"{0}"'.format(self.etag))
+        assert_equal(response.headers.get('Last-Modified'), 'Tue, 02 Mar 2021 10:11:12 GMT')
+
+    def test_modified_for_other_etag(self):
+        with self.app.test_request_context(headers={'If-None-Match': '"other"'}):
+            assert_false(_is_not_modified(self.etag, self.last_modified))
+
+    def test_not_modified_since(self):
+        for if_modified_since in ['Tue, 02 Mar 2021 10:11:12 GMT', 'Wed, 03 Mar 2021 00:00:00 GMT']:
+            with self.app.test_request_context(headers={'If-Modified-Since': if_modified_since}):
+                assert_true(_is_not_modified(self.etag, self.last_modified))
+
+    def test_modified_since(self):
+        with self.app.test_request_context(headers={'If-Modified-Since': 'Tue, 02 Mar 2021 10:11:11 GMT'}):
+            assert_false(_is_not_modified(self.etag, self.last_modified))
+        # the converters were loaded later than the revision
+        with self.app.test_request_context(headers={'If-Modified-Since': 'Tue, 02 Mar 2021 10:11:12 GMT'}):
+            assert_false(_is_not_modified(self.etag, datetime.datetime(2022, 1, 1)))
+
+
+class _TitleConverter(Converter):
+
+    def convert(self, record):
+        dataset_dict = record.get_json_dict()
+        if not dataset_dict.get('title'):
+            raise ValueError('Dataset without title')
+        return Record(self.output_format, dataset_dict['title'])
+
+
+class TestCatalogExport(object):
+
+    def setup_method(self, method=None):
+        self.output_format = MetadataFormat('test_catalog', '1.0', file_extension='txt',
+                                            format_type=FormatType.TEXT)
+        MetadataFormats().add_metadata_format(self.output_format, replace=True)
+        self.converter = _TitleConverter(MetadataFormats().get_metadata_formats('ckan')[0], self.output_format)
+        Converters().add_converter(self.converter)
+        self.datasets = [{'id': 'id-{0}'.format(i), 'name': 'name-{0}'.format(i), 'title': u'Title \xe9 {0}'.format(i)}
+                         for i in range(3)]
+        # skipped, it cannot be converted
+        self.datasets.insert(1, {'id': 'id-untitled', 'name': 'untitled'})
+
+    def teardown_method(self, method=None):
+        Converters().remove_converter(self.converter)
+
+    def test_ndjson(self):
+        lines = list(_iter_ndjson(iter(self.datasets), self.output_format, 'package_search:'))
+        assert_equal(len(lines), 3)
+        assert_true(all(line.endswith(b'\n') for line in lines))
+        assert_equal(json.loads(lines[0].decode('utf-8')),
+                     {'id': 'id-0', 'name': 'name-0', 'format': 'test_catalog', 'content': u'Title \xe9 0'})
+
+    def test_zip_reopened(self):
+        chunks = list(_iter_zip(iter(self.datasets), self.output_format, 'package_search:'))
+        # one chunk per entry, then the central directory
+        assert_equal(len(chunks), 4)
+        zip_file = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        assert_equal(zip_file.testzip(), None)
+        assert_equal(zip_file.namelist(), ['name-0.txt', 'name-1.txt', 'name-2.txt'])
+        assert_equal(zip_file.read('name-2.txt').decode('utf-8'), u'Title \xe9 2')
+
+    def test_zip_stream_emptied(self):
+        zip_stream = _ZipStream()
+        zip_stream.write(b'abc')
+        zip_stream.write(b'de')
+        assert_equal(zip_stream.tell(), 5)
+        assert_equal(zip_stream.pop(), b'abcde')
+        assert_equal(zip_stream.pop(), b'')
+        # the position keeps counting the bytes already streamed
+        assert_equal(zip_stream.tell(), 5)
@@ -0,0 +1,58 @@
+"""Tests for cache.py."""
+import shutil
+import tempfile
+import time
+
+from ckanext.package_converter.cache import MemoryExportCache, FileExportCache, configure_export_cache, \
+    get_export_cache
+
+from nose.tools import assert_equal, assert_true
+
+
+class TestMemoryExportCache(object):
+
+    def test_get_set(self):
+        cache = MemoryExportCache(size=10, ttl=0)
+        cache.set(('id', 'package', 'datacite'), u'<resource>é</resource>', 'application/xml')
+        assert_equal(cache.get(('id', 'package', 'datacite')),
+                     (u'<resource>é</resource>'.encode('utf-8'), 'application/xml'))
+        assert_equal(cache.get(('other', 'package', 'datacite')), None)
+
+    def test_least_recently_used_evicted(self):
+        cache = MemoryExportCache(size=2, ttl=0)
+        cache.set(('a',), 'a', 'text/plain')
+        cache.set(('b',), 'b', 'text/plain')
+        cache.get(('a',))
+        cache.set(('c',), 'c', 'text/plain')
+        assert_true(cache.get(('a',)))
+        assert_equal(cache.get(('b',)), None)
+        assert_true(cache.get(('c',)))
+
+    def test_expired(self):
+        cache = MemoryExportCache(size=2, ttl=1)
+        cache.set(('a',), 'a', 'text/plain')
+        cache.entries[('a',)] = (time.time() - 2,) + cache.entries[('a',)][1:]
+        assert_equal(cache.get(('a',)), None)
+
+
+class TestFileExportCache(object):
+
+    def setup_method(self, method=None):
+        self.directory = tempfile.mkdtemp()
+
+    def teardown_method(self, method=None):
+        shutil.rmtree(self.directory)
+
+    def test_get_set(self):
+        cache = FileExportCache(self.directory, ttl=0)
+        cache.set(('id', 'package', 'bibtex'), u'@misc { dataset-2021', 'text/plain')
+        assert_equal(cache.get(('id', 'package', 'bibtex')), (b'@misc { dataset-2021', 'text/plain'))
+        cache.clear()
+        assert_equal(cache.get(('id', 'package', 'bibtex')), None)
+
+    def test_configure(self):
+        configure_export_cache({'package_converter.cache': 'file',
+                                'package_converter.cache.directory': self.directory})
+        assert_true(isinstance(get_export_cache(), FileExportCache))
+        configure_export_cache({'package_converter.cache': 'none'})
+        assert_equal(get_export_cache(), None)
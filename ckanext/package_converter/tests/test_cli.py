@@ -0,0 +1,100 @@
+"""Tests for cli.py."""
+import io
+import os
+import shutil
+import tempfile
+
+from ckanext.package_converter import cli
+from ckanext.package_converter.cache import MemoryExportCache, get_export_cache, set_export_cache
+from ckanext.package_converter.logic import _get_cache_key
+from ckanext.package_converter.model.converter import Converter, Converters
+from ckanext.package_converter.model.metadata_format import MetadataFormats, MetadataFormat, FormatType
+from ckanext.package_converter.model.record import Record
+from ckanext.package_converter.store import ExportStore, set_export_store
+
+import click
+
+from nose.tools import assert_equal, assert_raises, assert_true
+
+
+class _TitleConverter(Converter):
+
+    def convert(self, record):
+        return Record(self.output_format, record.get_json_dict()['title'])
+
+
+class TestRender(object):
+
+    def setup_method(self, method=None):
+        self.directory = tempfile.mkdtemp()
+        self.export_cache = get_export_cache()
+        self.output_format = MetadataFormat('test_cli', '1.0', file_extension='txt', format_type=FormatType.TEXT)
+        MetadataFormats().add_metadata_format(self.output_format, replace=True)
+        self.converter = _TitleConverter(MetadataFormats().get_metadata_formats('ckan')[0], self.output_format)
+        Converters().add_converter(self.converter)
+        self.dataset_dict = {u'id': u'package-id', u'name': u'package-name', u'title': u'Title',
+                             u'metadata_modified': u'2021-01-01T00:00:00'}
+
+    def teardown_method(self, method=None):
+        Converters().remove_converter(self.converter)
+        set_export_store(None)
+        set_export_cache(self.export_cache)
+        shutil.rmtree(self.directory)
+
+    def test_task_batches(self):
+        batches = list(cli._iter_task_batches(iter(range(5)), ['test_cli'], None, 2))
+        assert_equal([len(tasks) for tasks in batches], [2, 2, 1])
+        assert_equal(batches[2], [(4, ['test_cli'], None)])
+        assert_equal(list(cli._iter_task_batches(iter([]), ['test_cli'], None, 2)), [])
+
+    def test_write_record(self):
+        cli._write_record(self.directory, self.dataset_dict, Record(self.output_format, u'Titl\xe9'))
+        with io.open(os.path.join(self.directory, 'test_cli', 'package-name.txt'), 'rb') as output_file:
+            assert_equal(output_file.read(), u'Titl\xe9'.encode('utf-8'))
+
+    def test_render_to_directory(self):
+        assert_equal(cli._render_dataset((self.dataset_dict, ['test_cli'], self.directory)), (u'package-id', 1, []))
+        assert_true(os.path.isfile(os.path.join(self.directory, 'test_cli', 'package-name.txt')))
+
+    def test_render_to_store(self):
+        export_store = ExportStore(self.directory)
+        set_export_store(export_store)
+        assert_equal(cli._render_dataset((self.dataset_dict, ['test_cli'], None)), (u'package-id', 1, []))
+        cache_key = _get_cache_key(self.dataset_dict, 'package', self.output_format, 'package_show:')
+        assert_equal(export_store.get((u'package-id',) + cache_key), (b'Title', 'text/plain'))
+
+    def test_store_datasets_read_as_anonymous(self):
+        get_action = cli.toolkit.get_action
+        show_contexts = []
+
+        def package_show(context, show_dict):
+            show_contexts.append(context)
+            if show_dict[u'id'] == u'private-id':
+                raise cli.toolkit.NotAuthorized()
+            return dict(self.dataset_dict, id=show_dict[u'id'])
+        cli.toolkit.get_action = lambda name: package_show
+        try:
+            datasets = list(cli._iter_store_datasets(iter([{u'id': u'package-id'}, {u'id': u'private-id'}])))
+        finally:
+            cli.toolkit.get_action = get_action
+        assert_equal(datasets, [self.dataset_dict])
+        assert_equal(show_contexts, [{u'user': u''}] * 2)
+
+    def test_render_failure(self):
+        dataset_dict = dict(self.dataset_dict)
+        del dataset_dict[u'title']
+        dataset_id, num_rendered, failures = cli._render_dataset((dataset_dict, ['test_cli'], self.directory))
+        assert_equal((dataset_id, num_rendered, [format_name for format_name, message in failures]),
+                     (u'package-id', 0, ['test_cli']))
+
+    def test_render_needs_a_persistent_target(self):
+        set_export_cache(MemoryExportCache())
+        with assert_raises(click.UsageError) as raised:
+            cli.render.callback(('test_cli',), None, u'*:*', 1, 10)
+        assert_true(u'memory' in raised.exception.message)
+        set_export_cache(None)
+        assert_raises(click.UsageError, cli.render.callback, ('test_cli',), None, u'*:*', 1, 10)
+
+    def test_fork_context(self):
+        if hasattr(cli.multiprocessing, 'get_context'):
+            assert_equal(cli._get_fork_context().get_start_method(), 'fork')
@@ -0,0 +1,220 @@
+"""Tests for model/converter.py."""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+
+from ckanext.package_converter.model.metadata_format import MetadataFormats, MetadataFormat, FormatType
+from ckanext.package_converter.model.converter import Converter, Converters, LazyConverter, XSLConverter, \
+    BUILTIN_CONVERTER_FORMATS, load_converter
+from ckanext.package_converter.model.record import Record, XMLRecord
+
+from nose.tools import assert_equal, assert_true, assert_raises
+
+
+class TestConverters(object):
+
+    def setup_method(self, method=None):
+        self.formats = [MetadataFormat('test_chain_{0}'.format(i), '1.0', format_type=FormatType.TEXT)
+                        for i in range(4)]
+        self.converters = [Converter(self.formats[0], self.formats[1]), Converter(self.formats[1], self.formats[2])]
+        for converter in self.converters:
+            Converters().add_converter(converter)
+
+    def teardown_method(self, method=None):
+        for converter in Converters().get_all_converters():
+            if converter.get_input_format() in self.formats:
+                Converters().remove_converter(converter)
+
+    def test_chain_planned_once(self):
+        chain = Converters().find_conversion_chain(self.formats[0], self.formats[2])
+        assert_equal(chain, self.converters)
+        key = ('test_chain_0', '1.0', 'test_chain_2', '1.0', False, 3)
+        assert_true(Converters().snapshot.conversion_chains[key] == chain)
+        assert_equal(Converters().find_conversion_chain(self.formats[0], self.formats[3]), [])
+
+    def test_chain_invalidated_by_new_converter(self):
+        assert_equal(Converters().find_conversion_chain(self.formats[0], self.formats[3]), [])
+        converter = Converter(self.formats[2], self.formats[3])
+        Converters().add_converter(converter)
+        assert_equal(Converters().find_conversion_chain(self.formats[0], self.formats[3]),
+                     self.converters + [converter])
+
+    def test_reachable_formats(self):
+        reachable_formats = Converters().get_reachable_formats(self.formats[0])
+        assert_true(self.formats[1] in reachable_formats)
+        assert_true(self.formats[2] in reachable_formats)
+        assert_equal(Converters().get_reachable_formats(self.formats[0], limit=1), [self.formats[1]])
+
+
+class _UpperCaseConverter(Converter):
+
+    def convert(self, record):
+        return Record(self.output_format, record.get_content().upper())
+
+
+class _CountingLock(object):
+    # lock recording the threads acquiring it
+
+    def __init__(self, lock):
+        self.lock = lock
+        self.thread_names = set()
+
+    def __enter__(self):
+        self.thread_names.add(threading.current_thread().name)
+        return self.lock.__enter__()
+
+    def __exit__(self, *args):
+        return self.lock.__exit__(*args)
+
+
+class TestConvertersConcurrency(object):
+
+    def setup_method(self, method=None):
+        self.formats = [MetadataFormat('test_concurrency_{0}'.format(i), '1.0', format_type=FormatType.TEXT)
+                        for i in range(3)]
+        for metadata_format in self.formats:
+            MetadataFormats().add_metadata_format(metadata_format, replace=True)
+        self.converters = [_UpperCaseConverter(self.formats[0], self.formats[1]),
+                           _UpperCaseConverter(self.formats[1], self.formats[2])]
+        for converter in self.converters:
+            Converters().add_converter(converter)
+        self.write_lock = Converters().write_lock
+        Converters().write_lock = _CountingLock(self.write_lock)
+
+    def teardown_method(self, method=None):
+        Converters().write_lock = self.write_lock
+        for converter in Converters().get_all_converters():
+            if converter.get_input_format() in self.formats or converter.get_output_format() in self.formats:
+                Converters().remove_converter(converter)
+
+    def test_lookups_during_registration(self):
+        errors = []
+
+        def read():
+            try:
+                for i in range(500):
+                    converted_record = Converters().get_conversion(Record(self.formats[0], u'text {0}'.format(i)),
+                                                                   self.formats[2])
+                    assert_equal(converted_record.get_content(), u'TEXT {0}'.format(i))
+                    assert_true(self.formats[2] in Converters().get_reachable_formats(self.formats[0]))
+                    assert_true(MetadataFormats().get_metadata_formats('test_concurrency_0'))
+            except Exception as e:
+                errors.append(e)
+
+        def write():
+            for i in range(200):
+                converter = _UpperCaseConverter(self.formats[2], self.formats[0])
+                Converters().add_converter(converter)
+                Converters().remove_converter(converter)
+                MetadataFormats().add_metadata_format(self.formats[0], replace=True)
+
+        threads = [threading.Thread(target=read, name='reader-{0}'.format(i)) for i in range(8)]
+        threads += [threading.Thread(target=write, name='writer')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert_equal(errors, [])
+        # readers never take the lock
+        assert_equal(Converters().write_lock.thread_names, set(['writer']))
+
+
+class _LazyTestConverter(_UpperCaseConverter):
+    instances = 0
+
+    def __init__(self):
+        _LazyTestConverter.instances += 1
+        _UpperCaseConverter.__init__(self, MetadataFormats().get_metadata_formats('test_lazy_0')[0],
+                                     MetadataFormats().get_metadata_formats('test_lazy_1')[0])
+
+
+class TestLazyConverter(object):
+    converter_name = 'ckanext.package_converter.tests.test_converter._LazyTestConverter'
+
+    def setup_method(self, method=None):
+        self.formats = [MetadataFormat('test_lazy_{0}'.format(i), '1.0', format_type=FormatType.TEXT)
+                        for i in range(2)]
+        for metadata_format in self.formats:
+            MetadataFormats().add_metadata_format(metadata_format, replace=True)
+        _LazyTestConverter.instances = 0
+
+    def teardown_method(self, method=None):
+        for converter in Converters().get_all_converters():
+            if converter.get_input_format() in self.formats:
+                Converters().remove_converter(converter)
+
+    def test_loaded_on_first_conversion(self):
+        Converters().add_converter_by_name(self.converter_name + ':test_lazy_0/1.0:test_lazy_1')
+        lazy_converter = Converters().find_conversion_chain(self.formats[0], self.formats[1])[0]
+        assert_true(isinstance(lazy_converter, LazyConverter))
+        assert_equal(_LazyTestConverter.instances, 0)
+        for i in range(2):
+            converted_record = Converters().get_conversion(Record(self.formats[0], u'text'), self.formats[1])
+            assert_equal(converted_record.get_content(), u'TEXT')
+        assert_equal(_LazyTestConverter.instances, 1)
+
+    def test_fingerprint_of_loaded_converter(self):
+        Converters().add_converter_by_name(self.converter_name + ':test_lazy_0:test_lazy_1')
+        lazy_fingerprint = Converters().get_fingerprint()
+        Converters().remove_converter(Converters().get_converters_for_format(self.formats[0])[0])
+        Converters().add_converter_by_name(self.converter_name, lazy=False)
+        assert_true(isinstance(Converters().get_converters_for_format(self.formats[0])[0], _LazyTestConverter))
+        assert_equal(Converters().get_fingerprint(), lazy_fingerprint)
+
+    def test_undeclared_formats_loaded_now(self):
+        Converters().add_converter_by_name(self.converter_name)
+        assert_equal(_LazyTestConverter.instances, 1)
+        Converters().add_converter_by_name(self.converter_name + ':test_lazy_0:unknown_format')
+        assert_equal(_LazyTestConverter.instances, 2)
+        assert_raises(ValueError, Converters().add_converter_by_name, self.converter_name + ':test_lazy_0')
+
+
+class TestXSLConverter(object):
+
+    def setup_method(self, method=None):
+        self.directory = tempfile.mkdtemp()
+        self.xsl_path = os.path.join(self.directory, 'test.xsl')
+        with open(self.xsl_path, 'w') as xsl_file:
+            xsl_file.write('<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform" '
+                           'xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+                           '<xsl:template match="/"><rdf:RDF><xsl:value-of select="//title"/></rdf:RDF>'
+                           '</xsl:template></xsl:stylesheet>')
+        self.xml_format = MetadataFormat('test_xsl_xml', '1.0', format_type=FormatType.XML)
+        self.rdf_format = MetadataFormat('test_xsl_rdf', '1.0', format_type=FormatType.RDF)
+
+    def teardown_method(self, method=None):
+        shutil.rmtree(self.directory)
+
+    def test_dom_handed_to_rdf_output(self):
+        record = XMLRecord.from_dict(self.xml_format, {'resource': {'title': u'dataset'}})
+        converted_record = XSLConverter(self.xml_format, self.rdf_format, self.xsl_path).convert(record)
+        # neither the input nor the output record is serialized between the steps
+        assert_equal(record.content, None)
+        assert_true(isinstance(converted_record, XMLRecord))
+        assert_equal(converted_record.content, None)
+        assert_true(b'<rdf:RDF' in converted_record.get_content())
+        assert_true(b'>dataset</rdf:RDF>' in converted_record.get_content())
+
+
+class TestBuiltinConverters(object):
+
+    def test_declared_formats(self):
+        # the formats registered without importing a builtin converter are the ones it converts
+        for converter_name, (input_format_spec, output_format_spec) in sorted(BUILTIN_CONVERTER_FORMATS.items()):
+            converter = load_converter(converter_name)
+            assert_equal((converter.get_input_format(), converter.get_output_format()),
+                         (MetadataFormats().get_metadata_formats(*input_format_spec)[0],
+                          MetadataFormats().get_metadata_formats(*output_format_spec)[0]))
+
+    def test_registered_on_first_use(self):
+        # importing the model registers nothing, the registries add the builtin formats and XSL when created
+        script = ('import ckanext.package_converter.model.record\n'
+                  'from ckanext.package_converter.model.metadata_format import MetadataFormats\n'
+                  'from ckanext.package_converter.model.converter import Converters\n'
+                  'assert MetadataFormats.instance is None and Converters.instance is None\n'
+                  'assert Converters().get_num_converters() == 2\n'
+                  'assert MetadataFormats().get_metadata_formats("datacite", "4.4")\n')
+        subprocess.check_call([sys.executable, '-c', script])
@@ -0,0 +1,86 @@
+"""Tests for model/export_context.py."""
+import pickle
+
+from ckanext.package_converter.model import export_context as export_context_module
+from ckanext.package_converter.model.export_context import ExportContext, set_export_context_factory, \
+    get_default_export_context
+from ckanext.package_converter.model.metadata_format import MetadataFormat, FormatType
+from ckanext.package_converter.model.record import JSONRecord, XMLRecord
+
+from nose.tools import assert_equal, assert_true, assert_false, assert_is, assert_raises
+
+
+def _load_package_names():
+    _load_package_names.calls += 1
+    return ['related-one']
+
+
+_load_package_names.calls = 0
+
+
+class TestExportContext(object):
+
+    def test_urls(self):
+        export_context = ExportContext('https://www.envidat.ch/portal')
+        assert_equal(export_context.site_root, 'https://www.envidat.ch')
+        assert_equal(export_context.related_url_prefix, 'https://www.envidat.ch/portal/dataset')
+        assert_equal(export_context.get_package_url('name'), 'https://www.envidat.ch/dataset/name')
+        assert_equal(export_context.get_resource_url('id', 'res'), 'https://www.envidat.ch/dataset/id/resource/res')
+
+    def test_url_paths(self):
+        export_context = ExportContext('https://www.envidat.ch', url_paths={'dataset': '/data/{id}'})
+        assert_equal(export_context.get_package_url('name'), 'https://www.envidat.ch/data/name')
+        assert_equal(export_context.url_for('dataset_resource', id='id', resource_id='res'),
+                     '/dataset/id/resource/res')
+
+    def test_is_url(self):
+        export_context = ExportContext('https://www.envidat.ch', valid_url_schemes=['https'])
+        assert_true(export_context.is_url('https://www.envidat.ch/file.csv'))
+        assert_false(export_context.is_url('http://www.envidat.ch/file.csv'))
+        assert_false(export_context.is_url(''))
+        assert_false(export_context.is_url(None))
+
+    def test_package_names_loaded_once(self):
+        _load_package_names.calls = 0
+        export_context = ExportContext('https://www.envidat.ch', package_names_loader=_load_package_names)
+        assert_equal(export_context.get_package_names(), ['related-one'])
+        assert_equal(export_context.get_package_names(), ['related-one'])
+        assert_equal(_load_package_names.calls, 1)
+        assert_equal(ExportContext('https://www.envidat.ch').get_package_names(), [])
+
+    def test_pickle(self):
+        export_context = ExportContext('https://www.envidat.ch', package_names_loader=_load_package_names)
+        unpickled_context = pickle.loads(pickle.dumps(export_context))
+        assert_equal(unpickled_context.get_package_url('name'), 'https://www.envidat.ch/dataset/name')
+        assert_equal(unpickled_context.get_package_names(), ['related-one'])
+
+
+class TestRecordExportContext(object):
+
+    def setup_method(self, method=None):
+        self.json_format = MetadataFormat('test_json', '1.0', format_type=FormatType.JSON)
+        self.xml_format = MetadataFormat('test_xml', '1.0', format_type=FormatType.XML)
+        self.export_context_factory = export_context_module._export_context_factory
+
+    def teardown_method(self, method=None):
+        set_export_context_factory(self.export_context_factory)
+
+    def test_given(self):
+        export_context = ExportContext('https://www.envidat.ch')
+        record = JSONRecord(self.json_format, {}, export_context=export_context)
+        assert_is(record.get_export_context(), export_context)
+        assert_is(JSONRecord.from_record(record).get_export_context(), export_context)
+        xml_record = XMLRecord(self.xml_format, '<a/>', export_context=export_context)
+        assert_is(XMLRecord.from_record(xml_record).get_export_context(), export_context)
+
+    def test_default(self):
+        set_export_context_factory(lambda: ExportContext('https://www.envidat.ch'))
+        record = JSONRecord(self.json_format, {})
+        export_context = record.get_export_context()
+        assert_equal(export_context.site_url, 'https://www.envidat.ch')
+        assert_is(record.get_export_context(), export_context)
+
+    def test_no_default(self):
+        set_export_context_factory(None)
+        assert_raises(ValueError, get_default_export_context)
+        assert_raises(ValueError, JSONRecord(self.json_format, {}).get_export_context)
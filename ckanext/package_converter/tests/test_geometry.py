@@ -0,0 +1,48 @@
+"""Tests for model/geometry.py."""
+from ckanext.package_converter.model.geometry import Geometry, MIN_ARRAY_VERTICES
+from ckanext.package_converter.model.record import DecodedDict
+
+from nose.tools import assert_equal, assert_true, assert_false, assert_is
+
+RING = [[8, 46], [9.5, 46], [9.5, 47.25], [8, 47.25], [8, 46]]
+
+
+class TestGeometry(object):
+
+    def test_bounding_box(self):
+        geometry = Geometry({'type': 'Polygon', 'coordinates': [RING]})
+        # the original values, 8 is not written 8.0
+        assert_equal([repr(value) for value in geometry.get_bounding_box()], ['8', '9.5', '46', '47.25'])
+        assert_equal(geometry.get_center(), (8.75, 46.625))
+        assert_equal(Geometry({'type': 'Point', 'coordinates': [7.5, 46]}).get_bounding_box(), [7.5, 7.5, 46, 46])
+
+    def test_large_polygon(self):
+        # in an array if NumPy is installed
+        ring = [[8, 46]] + [[8 + index * 0.001, 46] for index in range(1, MIN_ARRAY_VERTICES)] + \
+            [[9, 47], [8, 47], [8, 46]]
+        geometry = Geometry({'type': 'Polygon', 'coordinates': [ring]})
+        assert_equal([repr(value) for value in geometry.get_bounding_box()], ['8', '9', '46', '47'])
+        assert_true(geometry.is_counter_clockwise())
+        assert_false(Geometry({'type': 'Polygon', 'coordinates': [ring[::-1]]}).is_counter_clockwise())
+
+    def test_rings_of_different_lengths(self):
+        geometry = Geometry({'type': 'Polygon', 'coordinates': [RING, [[8.5, 46.5], [9, 46.5], [8.5, 46.5]]]})
+        assert_equal(geometry.get_bounding_box(), [8, 9.5, 46, 47.25])
+
+    def test_orientation(self):
+        assert_true(Geometry({'type': 'Polygon', 'coordinates': [RING]}).is_counter_clockwise())
+        assert_false(Geometry({'type': 'Polygon', 'coordinates': [RING[::-1]]}).is_counter_clockwise())
+        assert_false(Geometry({'type': 'Polygon', 'coordinates': [RING[:3]]}).is_counter_clockwise())
+        assert_false(Geometry({'type': 'Polygon', 'coordinates': [[['a', 'b']] * 4]}).is_counter_clockwise())
+
+    def test_box(self):
+        assert_true(Geometry({'type': 'Polygon', 'coordinates': [[[8, 46], [8, 47], [9, 47], [9, 46], [8, 46]]]})
+                    .is_a_box())
+        assert_false(Geometry({'type': 'Polygon', 'coordinates': [RING]}).is_a_box())
+
+    def test_parsed_once(self):
+        dataset_dict = DecodedDict({'spatial': '{"type": "Point", "coordinates": [8, 46]}', 'empty': ''})
+        geometry = dataset_dict.get_parsed('spatial', Geometry)
+        assert_equal(geometry.type, 'Point')
+        assert_is(dataset_dict.get_parsed('spatial', Geometry), geometry)
+        assert_equal(dataset_dict.get_parsed('empty', Geometry), None)
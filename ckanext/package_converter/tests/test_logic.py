@@ -0,0 +1,249 @@
+"""Tests for logic.py."""
+import datetime
+import json
+
+from ckanext.package_converter import logic
+from ckanext.package_converter.cache import MemoryExportCache, get_export_cache, set_export_cache
+from ckanext.package_converter.logic import convert_dataset, get_embedded_json, get_export_validators, get_view_key, \
+    search_datasets, package_resources_export, _get_cache_key
+from ckanext.package_converter.model.converter import Converter, Converters
+from ckanext.package_converter.model.metadata_format import MetadataFormats, MetadataFormat, FormatType
+from ckanext.package_converter.model.record import JSONRecord
+
+from nose.tools import assert_equal, assert_true, assert_in, assert_raises
+
+
+class _NotesConverter(Converter):
+
+    def __init__(self, input_format, output_format):
+        Converter.__init__(self, input_format, output_format)
+        self.num_conversions = 0
+
+    def convert(self, record):
+        self.num_conversions += 1
+        return JSONRecord(self.output_format, {'description': record.get_json_dict()['notes']})
+
+
+class _ResourceConverter(Converter):
+
+    def __init__(self, input_format, output_format):
+        Converter.__init__(self, input_format, output_format)
+        self.export_contexts = []
+
+    def convert(self, record):
+        resource_dict = record.get_json_dict()
+        if resource_dict['id'] == 'resource-broken':
+            raise ValueError('broken resource')
+        self.export_contexts.append(record.get_export_context())
+        return JSONRecord(self.output_format, {'name': resource_dict['name'],
+                                               'package': resource_dict['package_dict']['name']})
+
+
+class TestEmbeddedJSON(object):
+
+    def setup_method(self, method=None):
+        self.export_cache = get_export_cache()
+        set_export_cache(MemoryExportCache())
+        self.output_format = MetadataFormat('test_embedded', '1.0', format_type=FormatType.JSON)
+        MetadataFormats().add_metadata_format(self.output_format, replace=True)
+        self.converter = _NotesConverter(MetadataFormats().get_metadata_formats('ckan')[0], self.output_format)
+        Converters().add_converter(self.converter)
+        self.dataset_dict = {'id': 'package-id', 'metadata_modified': '2021-01-01T00:00:00',
+                             'notes': u'</script><script>alert(1)</script>'}
+        self.get_request_user = logic._get_request_user
+        self.request_user = u''
+        logic._get_request_user = lambda: self.request_user
+
+    def teardown_method(self, method=None):
+        logic._get_request_user = self.get_request_user
+        Converters().remove_converter(self.converter)
+        set_export_cache(self.export_cache)
+
+    def test_embedded_text_cached(self):
+        embedded_json = get_embedded_json(self.dataset_dict, 'test_embedded')
+        assert_true('</' not in embedded_json)
+        assert_equal(json.loads(embedded_json), {'description': self.dataset_dict['notes']})
+        assert_equal(get_embedded_json(self.dataset_dict, 'test_embedded'), embedded_json)
+        assert_equal(self.converter.num_conversions, 1)
+
+    def test_export_cache_not_filled(self):
+        # the dataset of a view may have been changed by other plugins, its export must not be cached
+        get_embedded_json(self.dataset_dict, 'test_embedded')
+        cache_key = _get_cache_key(self.dataset_dict, 'package', self.output_format, 'package_show:')
+        assert_equal(get_export_cache().get(cache_key), None)
+        assert_true(get_export_cache().get(cache_key + ('embedded',)) is not None)
+
+    def test_embedded_text_cached_per_user(self):
+        get_embedded_json(self.dataset_dict, 'test_embedded')
+        self.request_user = u'editor'
+        get_embedded_json(self.dataset_dict, 'test_embedded')
+        assert_equal(self.converter.num_conversions, 2)
+        # outside of a request
+        self.request_user = None
+        get_embedded_json(self.dataset_dict, 'test_embedded')
+        get_embedded_json(self.dataset_dict, 'test_embedded')
+        assert_equal(self.converter.num_conversions, 4)
+
+    def test_not_json(self):
+        assert_equal(get_embedded_json(self.dataset_dict, 'bibtex'), '')
+
+
+class TestExportValidators(object):
+
+    def setup_method(self, method=None):
+        self.dataset_dict = {'id': 'package-id', 'metadata_modified': '2021-01-01T00:00:00'}
+        self.converter = None
+
+    def teardown_method(self, method=None):
+        if self.converter:
+            Converters().remove_converter(self.converter)
+
+    def test_etag_of_revision(self):
+        etag = get_export_validators(self.dataset_dict, 'datacite', 'package_show:')[0]
+        assert_equal(get_export_validators(dict(self.dataset_dict), 'DataCite', 'package_show:')[0], etag)
+        assert_true(get_export_validators(self.dataset_dict, 'bibtex', 'package_show:')[0] != etag)
+        assert_true(get_export_validators(dict(self.dataset_dict, metadata_modified='2021-01-02T00:00:00'),
+                                          'datacite', 'package_show:')[0] != etag)
+        assert_equal(get_export_validators(self.dataset_dict, 'unknown', 'package_show:'), (None, None))
+        assert_equal(get_export_validators({'id': 'package-id'}, 'datacite', 'package_show:'), (None, None))
+        assert_equal(get_export_validators(self.dataset_dict, 'datacite', None), (None, None))
+
+    def test_etag_of_view(self):
+        etag = get_export_validators(self.dataset_dict, 'datacite', 'package_show:')[0]
+        assert_true(get_export_validators(self.dataset_dict, 'datacite', 'package_show:editor')[0] != etag)
+        assert_true(get_export_validators(self.dataset_dict, 'datacite', 'package_search:')[0] != etag)
+
+    def test_last_modified(self):
+        # the package changed after the converters were loaded
+        new_dataset_dict = dict(self.dataset_dict, metadata_modified='2100-01-02T03:04:05.678')
+        assert_equal(get_export_validators(new_dataset_dict, 'datacite', 'package_show:')[1],
+                     datetime.datetime(2100, 1, 2, 3, 4, 5, 678000))
+        # the converters were loaded after the package changed
+        assert_equal(get_export_validators(self.dataset_dict, 'datacite', 'package_show:')[1],
+                     Converters().get_loaded_time())
+
+    def test_validators_change_with_converters(self):
+        etag, last_modified = get_export_validators(self.dataset_dict, 'datacite', 'package_show:')
+        output_format = MetadataFormat('test_etag', '1.0', format_type=FormatType.JSON)
+        MetadataFormats().add_metadata_format(output_format, replace=True)
+        self.converter = _NotesConverter(MetadataFormats().get_metadata_formats('ckan')[0], output_format)
+        Converters().add_converter(self.converter)
+        new_etag, new_last_modified = get_export_validators(self.dataset_dict, 'datacite', 'package_show:')
+        assert_true(new_etag != etag)
+        assert_true(new_last_modified >= last_modified)
+        assert_equal(new_last_modified, Converters().get_loaded_time())
+
+
+class TestViewKey(object):
+
+    def setup_method(self, method=None):
+        self.export_cache = get_export_cache()
+        set_export_cache(MemoryExportCache())
+        self.output_format = MetadataFormat('test_view', '1.0', format_type=FormatType.JSON)
+        MetadataFormats().add_metadata_format(self.output_format, replace=True)
+        self.converter = _NotesConverter(MetadataFormats().get_metadata_formats('ckan')[0], self.output_format)
+        Converters().add_converter(self.converter)
+        self.dataset_dict = {'id': 'package-id', 'metadata_modified': '2021-01-01T00:00:00', 'notes': u'Notes'}
+        self.get_request_user = logic._get_request_user
+        logic._get_request_user = lambda: None
+
+    def teardown_method(self, method=None):
+        logic._get_request_user = self.get_request_user
+        Converters().remove_converter(self.converter)
+        set_export_cache(self.export_cache)
+
+    def test_view_of_context(self):
+        assert_equal(get_view_key({'user': u'editor'}), u'package_show:editor')
+        assert_equal(get_view_key({'user': None}), u'package_show:')
+        assert_equal(get_view_key({'user': u''}, 'package_search'), u'package_search:')
+        # outside of a request
+        assert_equal(get_view_key({}), None)
+        logic._get_request_user = lambda: u'editor'
+        assert_equal(get_view_key({}), u'package_show:editor')
+
+    def test_cached_per_view(self):
+        for view_key in ['package_show:', 'package_show:editor', 'package_search:', 'package_show:']:
+            convert_dataset(self.dataset_dict, self.output_format, view_key=view_key)
+        assert_equal(self.converter.num_conversions, 3)
+
+    def test_not_cached_without_view(self):
+        convert_dataset(self.dataset_dict, self.output_format)
+        convert_dataset(self.dataset_dict, self.output_format)
+        assert_equal(self.converter.num_conversions, 2)
+
+
+class TestSearchDatasets(object):
+
+    def setup_method(self, method=None):
+        self.get_action = logic.toolkit.get_action
+        self.search_dicts = []
+        logic.toolkit.get_action = lambda name: self._package_search
+        self.batch_size = logic.BULK_EXPORT_BATCH_SIZE
+        logic.BULK_EXPORT_BATCH_SIZE = 2
+
+    def teardown_method(self, method=None):
+        logic.toolkit.get_action = self.get_action
+        logic.BULK_EXPORT_BATCH_SIZE = self.batch_size
+
+    def _package_search(self, context, search_dict):
+        self.search_dicts.append(search_dict)
+        results = [{'id': 'id-{0}'.format(i)} for i in range(5)]
+        return {'count': len(results), 'results': results[search_dict['start']:search_dict['start'] + search_dict['rows']]}
+
+    def test_pages_of_one_order(self):
+        datasets = list(search_datasets({}, query='groups:test'))
+        assert_equal([dataset_dict['id'] for dataset_dict in datasets], ['id-{0}'.format(i) for i in range(5)])
+        assert_equal([(search_dict['start'], search_dict['rows']) for search_dict in self.search_dicts],
+                     [(0, 2), (2, 2), (4, 2)])
+        assert_true(all(search_dict['sort'] == 'metadata_modified asc, id asc' for search_dict in self.search_dicts))
+
+    def test_limit(self):
+        assert_equal(len(list(search_datasets({}, limit=3))), 3)
+        assert_equal(self.search_dicts[-1]['rows'], 1)
+
+
+class TestPackageResourcesExport(object):
+
+    def setup_method(self, method=None):
+        self.get_action = logic.toolkit.get_action
+        self.get_export_context = logic.get_export_context
+        self.export_cache = get_export_cache()
+        set_export_cache(MemoryExportCache())
+        self.show_dicts = []
+        logic.toolkit.get_action = lambda name: self._package_show
+        self.export_context = object()
+        logic.get_export_context = lambda: self.export_context
+        self.output_format = MetadataFormat('test_resources', '1.0', format_type=FormatType.JSON)
+        MetadataFormats().add_metadata_format(self.output_format, replace=True)
+        self.converter = _ResourceConverter(MetadataFormats().get_metadata_formats('ckan_resource')[0],
+                                            self.output_format)
+        Converters().add_converter(self.converter)
+
+    def teardown_method(self, method=None):
+        logic.toolkit.get_action = self.get_action
+        logic.get_export_context = self.get_export_context
+        set_export_cache(self.export_cache)
+        Converters().remove_converter(self.converter)
+
+    def _package_show(self, context, show_dict):
+        self.show_dicts.append(show_dict)
+        return {'id': 'package-id', 'name': 'package', 'metadata_modified': '2021-01-01T00:00:00',
+                'resources': [{'id': 'resource-{0}'.format(name), 'name': name, 'package_id': 'package-id'}
+                              for name in ['one', 'broken', 'two']]}
+
+    def test_results_and_errors(self):
+        result = package_resources_export({}, {'id': 'package', 'format': 'TEST_RESOURCES'})
+        assert_equal(sorted(result['results']), ['resource-one', 'resource-two'])
+        assert_equal(result['results']['resource-two'], {'name': 'two', 'package': 'package'})
+        assert_equal(list(result['errors']), ['resource-broken'])
+        assert_in('broken resource', result['errors']['resource-broken'])
+
+    def test_package_read_once(self):
+        package_resources_export({}, {'id': 'package', 'format': 'test_resources'})
+        assert_equal(self.show_dicts, [{'id': 'package'}])
+        # one export context for all the resources
+        assert_equal(self.converter.export_contexts, [self.export_context] * 2)
+
+    def test_invalid(self):
+        assert_raises(logic.toolkit.ValidationError, package_resources_export, {}, {})
+        assert_raises(logic.toolkit.ValidationError, package_resources_export, {}, {'id': 'package', 'format': 'x'})
@@ -0,0 +1,24 @@
+"""Tests for model/metadata_format.py."""
+from ckanext.package_converter.model.metadata_format import MetadataFormats, MetadataFormat, FormatType
+
+from nose.tools import assert_equal, assert_true
+
+
+class TestMetadataFormats(object):
+
+    def test_lookups(self):
+        first_format = MetadataFormat('test_index', '1.0', format_type=FormatType.TEXT, file_extension='tix')
+        second_format = MetadataFormat('test_index', '2.0', format_type=FormatType.TEXT, file_extension='tix',
+                                       mimetype='text/x-test-index')
+        MetadataFormats().add_metadata_format(first_format, replace=True)
+        MetadataFormats().add_metadata_format(second_format)
+        assert_equal(MetadataFormats().get_metadata_formats('test_index', '1.0'), [first_format])
+        assert_equal(MetadataFormats().get_metadata_formats('test_index', '3.0'), [])
+        assert_equal(MetadataFormats().get_metadata_formats_by_extension('TIX'), [second_format, first_format])
+        assert_equal(MetadataFormats().get_metadata_formats_by_mimetype('text/x-test-index'), [second_format])
+
+    def test_index_rebuilt_when_format_added(self):
+        MetadataFormats().get_metadata_formats_by_extension('tiy')
+        added_format = MetadataFormat('test_index_added', '1.0', format_type=FormatType.TEXT, file_extension='tiy')
+        MetadataFormats().add_metadata_format(added_format, replace=True)
+        assert_true(added_format in MetadataFormats().get_metadata_formats_by_extension('tiy'))
@@ -0,0 +1,46 @@
+"""Tests for oai.py."""
+import datetime
+
+from ckanext.package_converter.oai import OAIError, _check_arguments, _get_resumption_token, \
+    _parse_resumption_token, _parse_date
+
+from nose.tools import assert_equal, assert_raises
+
+
+class TestOAIArguments(object):
+
+    def test_check_arguments(self):
+        assert_equal(_check_arguments('GetRecord', {'verb': ['GetRecord'], 'identifier': ['id'],
+                                                    'metadataPrefix': ['oai_dc']}),
+                     {'identifier': 'id', 'metadataPrefix': 'oai_dc'})
+        assert_equal(_check_arguments('ListRecords', {'verb': ['ListRecords'], 'resumptionToken': ['token']}),
+                     {'resumptionToken': 'token'})
+
+    def test_check_arguments_errors(self):
+        for verb, arguments, code in [('Harvest', {}, 'badVerb'),
+                                      ('ListRecords', {}, 'badArgument'),
+                                      ('Identify', {'identifier': ['id']}, 'badArgument'),
+                                      ('ListRecords', {'metadataPrefix': ['oai_dc', 'datacite']}, 'badArgument'),
+                                      ('ListRecords', {'metadataPrefix': ['oai_dc'], 'resumptionToken': ['token']},
+                                       'badArgument')]:
+            with assert_raises(OAIError) as context:
+                _check_arguments(verb, arguments)
+            assert_equal(context.exception.code, code)
+
+    def test_parse_date(self):
+        assert_equal(_parse_date('2021-01-02', 'until', end_of_day=True), datetime.datetime(2021, 1, 2, 23, 59, 59))
+        assert_equal(_parse_date('2021-01-02T10:00:00Z', 'from'), datetime.datetime(2021, 1, 2, 10, 0, 0))
+        assert_raises(OAIError, _parse_date, '2021-01-02T10:00', 'from')
+
+
+class TestResumptionToken(object):
+
+    def test_round_trip(self):
+        until_date = datetime.datetime(2021, 1, 2, 23, 59, 59)
+        token = _get_resumption_token('oai_dc', None, until_date, 200)
+        assert_equal(_parse_resumption_token(token), ('oai_dc', None, until_date, 200))
+
+    def test_bad_token(self):
+        with assert_raises(OAIError) as context:
+            _parse_resumption_token('not a token')
+        assert_equal(context.exception.code, 'badResumptionToken')
@@ -0,0 +1,38 @@
+"""Tests for profiling.py."""
+from ckanext.package_converter.profiling import profile_call, tracemalloc
+
+from nose.tools import assert_equal, assert_true, assert_false, assert_raises
+
+
+def _allocate():
+    return len(_make_blocks(100))
+
+
+def _make_blocks(num_blocks):
+    return [bytearray(10000) for i in range(num_blocks)]
+
+
+class TestProfileCall(object):
+
+    def test_result_and_profile(self):
+        result, profile = profile_call(_allocate, limit=5)
+        assert_equal(result, 100)
+        assert_true(profile['duration'] >= 0)
+        assert_true(len(profile['functions']) <= 5)
+        function_names = [function_stats['function'] for function_stats in profile['functions']]
+        assert_true(function_names[0].endswith('(_allocate)'))
+        assert_true([function_name for function_name in function_names if function_name.endswith('(_make_blocks)')])
+        if tracemalloc is not None:
+            assert_true(profile['peak_memory'] >= 100 * 10000)
+            assert_false(tracemalloc.is_tracing())
+
+    def test_sort(self):
+        result, profile = profile_call(_allocate, sort='calls')
+        calls = [function_stats['calls'] for function_stats in profile['functions']]
+        assert_equal(calls, sorted(calls, reverse=True))
+        assert_raises(ValueError, profile_call, _allocate, sort='name')
+
+    def test_exception(self):
+        assert_raises(ZeroDivisionError, profile_call, lambda: 1 / 0)
+        if tracemalloc is not None:
+            assert_false(tracemalloc.is_tracing())
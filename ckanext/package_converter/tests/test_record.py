@@ -0,0 +1,102 @@
+"""Tests for model/record.py."""
+import json
+import os
+import shutil
+import tempfile
+
+from ckanext.package_converter.model.metadata_format import MetadataFormat, FormatType
+from ckanext.package_converter.model.record import Record, JSONRecord, XMLRecord, get_compiled_xslt
+from ckanext.package_converter.model.xml_writer import unparse
+
+from nose.tools import assert_equal, assert_true
+
+
+class TestJSONRecord(object):
+
+    def setup_method(self, method=None):
+        self.json_format = MetadataFormat('test_json', '1.0', format_type=FormatType.JSON)
+        self.json_dict = {'name': u'dataset-é', 'resources': [{'id': '1'}, {'id': '2'}]}
+
+    def test_content_serialized_lazily(self):
+        record = JSONRecord(self.json_format, self.json_dict)
+        assert_equal(record.content, None)
+        assert_equal(record.get_content(), json.dumps(self.json_dict, indent=4, ensure_ascii=False))
+        assert_true(record.get_content() is record.get_content())
+
+    def test_compact_content(self):
+        record = JSONRecord(self.json_format, self.json_dict, compact=True)
+        assert_true('\n' not in record.get_content())
+        assert_equal(json.loads(record.get_content()), self.json_dict)
+
+    def test_from_record_keeps_content(self):
+        content = json.dumps(self.json_dict)
+        record = JSONRecord.from_record(Record(self.json_format, content))
+        assert_equal(record.get_content(), content)
+        assert_equal(record.get_json_dict(), self.json_dict)
+
+
+class TestXMLRecord(object):
+
+    def setup_method(self, method=None):
+        self.xml_format = MetadataFormat('test_xml', '1.0', format_type=FormatType.XML)
+        self.content = u'<?xml version="1.0" encoding="utf-8"?>\n<resource><title>dataset-\xe9</title></resource>'
+
+    def test_parsed_lazily(self):
+        record = XMLRecord(self.xml_format, self.content)
+        assert_equal(record.xml_dict, None)
+        assert_equal(record.xml_doms, {})
+        assert_equal(record.get_xml_dict()['resource']['title'], u'dataset-\xe9')
+        assert_true(record.get_xml_dict() is record.get_xml_dict())
+
+    def test_dom_cached_per_encoding(self):
+        record = XMLRecord(self.xml_format, self.content)
+        assert_true(record._get_dom('utf-8') is record._get_dom('utf-8'))
+        assert_equal(record._get_dom('utf-8').findtext('title'), u'dataset-\xe9')
+
+    def test_from_dom_serialized_lazily(self):
+        dom = XMLRecord(self.xml_format, self.content)._get_dom('utf-8')
+        record = XMLRecord.from_dom(self.xml_format, dom)
+        assert_equal(record.content, None)
+        assert_true(record._get_dom('utf-8') is dom)
+        assert_true(b'<title>' in record.get_content())
+
+    def test_from_dict_written_lazily(self):
+        xml_dict = {'resource': {'@xmlns': 'http://example.com/ns', 'title': u'dataset-\xe9'}}
+        record = XMLRecord.from_dict(self.xml_format, xml_dict)
+        assert_equal(record._get_dom('utf-8').findtext('{http://example.com/ns}title'), u'dataset-\xe9')
+        # the DOM is written from the dict, not parsed from the content
+        assert_equal(record.content, None)
+        assert_equal(record.get_content(), unparse(xml_dict, pretty=True))
+
+    def test_from_dict_with_invalid_characters(self):
+        record = XMLRecord.from_dict(self.xml_format, {'resource': {'title': u'dataset\x0b'}})
+        assert_equal(record._get_dom('utf-8').tag, 'resource')
+        assert_true(record.content is not None)
+
+
+class TestCompiledXSLT(object):
+
+    def setup_method(self, method=None):
+        self.directory = tempfile.mkdtemp()
+        self.xsl_path = os.path.join(self.directory, 'test.xsl')
+        self._write_xsl('first')
+
+    def teardown_method(self, method=None):
+        shutil.rmtree(self.directory)
+
+    def _write_xsl(self, text, modification_time=None):
+        with open(self.xsl_path, 'w') as xsl_file:
+            xsl_file.write('<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">'
+                           '<xsl:template match="/"><result>{0}</result></xsl:template></xsl:stylesheet>'.format(text))
+        if modification_time:
+            os.utime(self.xsl_path, (modification_time, modification_time))
+
+    def test_compiled_once(self):
+        assert_true(get_compiled_xslt(self.xsl_path) is get_compiled_xslt(self.xsl_path))
+
+    def test_compiled_again_when_modified(self):
+        compiled_xslt = get_compiled_xslt(self.xsl_path)
+        self._write_xsl('second', modification_time=os.path.getmtime(self.xsl_path) + 10)
+        assert_true(get_compiled_xslt(self.xsl_path) is not compiled_xslt)
+        record = XMLRecord(MetadataFormat('test_xml', '1.0', format_type=FormatType.XML), '<root/>')
+        assert_true(b'second' in record.xsl_transform(self.xsl_path))
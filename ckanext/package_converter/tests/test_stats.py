@@ -0,0 +1,180 @@
+"""Tests for model/stats.py."""
+import collections
+import socket
+import threading
+
+from ckanext.package_converter.model.converter import Converter, Converters
+from ckanext.package_converter.model.metadata_format import MetadataFormats, MetadataFormat, FormatType
+from ckanext.package_converter.model.record import Record
+from ckanext.package_converter.model.stats import LatencyHistogram, ConversionStats, StatsdExporter, timed, \
+    count_cache_lookup, configure_conversion_stats, get_conversion_stats, set_conversion_stats
+
+from nose.tools import assert_equal, assert_true, assert_in, assert_raises
+
+
+class _CopyConverter(Converter):
+
+    def convert(self, record):
+        return Record(self.output_format, record.get_content())
+
+
+class _CountingLock(object):
+
+    def __init__(self, lock):
+        self.lock = lock
+        self.thread_names = collections.Counter()
+
+    def __enter__(self):
+        self.thread_names[threading.current_thread().name] += 1
+        return self.lock.__enter__()
+
+    def __exit__(self, *args):
+        return self.lock.__exit__(*args)
+
+
+class TestLatencyHistogram(object):
+
+    def test_summary(self):
+        histogram = LatencyHistogram()
+        for milliseconds in range(1, 101):
+            histogram.observe(milliseconds / 1000.0)
+        summary = histogram.get_summary()
+        assert_equal(summary['count'], 100)
+        assert_equal(summary['p50'], 0.05)
+        assert_equal(summary['p95'], 0.095)
+        assert_equal(summary['p99'], 0.099)
+        assert_equal(summary['max'], 0.1)
+        # 1 ms, 2 ms
+        assert_equal(histogram.bucket_counts[:2], [1, 1])
+
+    def test_recent_samples(self):
+        histogram = LatencyHistogram(sample_size=10)
+        for seconds in [10.0] * 10 + [0.001] * 10:
+            histogram.observe(seconds)
+        assert_equal(histogram.get_percentile(99), 0.001)
+        assert_equal(histogram.count, 20)
+        assert_equal(histogram.max, 10.0)
+        assert_equal(LatencyHistogram().get_percentile(50), None)
+
+    def test_merge(self):
+        histogram = LatencyHistogram()
+        other_histogram = LatencyHistogram()
+        for seconds in [0.001, 0.002]:
+            histogram.observe(seconds)
+        other_histogram.observe(3.0)
+        histogram.merge(other_histogram)
+        assert_equal(histogram.count, 3)
+        assert_equal(histogram.max, 3.0)
+        assert_equal(sorted(histogram.samples), [0.001, 0.002, 3.0])
+        assert_equal(sum(histogram.bucket_counts), 3)
+
+
+class TestConversionStats(object):
+
+    def setup_method(self, method=None):
+        self.conversion_stats = get_conversion_stats()
+        set_conversion_stats(ConversionStats())
+        self.formats = [MetadataFormat('test_stats_{0}'.format(i), '1.0', format_type=FormatType.TEXT)
+                        for i in range(3)]
+        for metadata_format in self.formats:
+            MetadataFormats().add_metadata_format(metadata_format, replace=True)
+        self.converters = [_CopyConverter(self.formats[i], self.formats[i + 1]) for i in range(2)]
+        for converter in self.converters:
+            Converters().add_converter(converter)
+
+    def teardown_method(self, method=None):
+        set_conversion_stats(self.conversion_stats)
+        for converter in self.converters:
+            Converters().remove_converter(converter)
+
+    def test_conversion_timed(self):
+        Converters().get_conversion(Record(self.formats[0], u'text'), self.formats[2])
+        latency = get_conversion_stats().get_stats()['latency']
+        assert_equal(latency['conversion']['test_stats_2']['count'], 1)
+        assert_equal(sorted(latency['converter']), ['test_stats_0->test_stats_1', 'test_stats_1->test_stats_2'])
+
+    def test_cache_lookups(self):
+        for hit in [True, False, False, False]:
+            count_cache_lookup('export', 'datacite', hit)
+        assert_equal(get_conversion_stats().get_stats()['cache'],
+                     {'export': {'datacite': {'hits': 1, 'misses': 3, 'hit_ratio': 0.25}}})
+
+    def test_prometheus(self):
+        with timed('serialize', 'dat"a'):
+            pass
+        count_cache_lookup('store', 'bibtex', True)
+        prometheus_text = get_conversion_stats().format_prometheus()
+        assert_in(u'package_converter_latency_seconds_bucket{stage="serialize",name="dat\\"a",le="+Inf"} 1\n',
+                  prometheus_text)
+        assert_in(u'package_converter_latency_seconds_count{stage="serialize",name="dat\\"a"} 1\n', prometheus_text)
+        assert_in(u'package_converter_cache_lookups_total{cache="store",name="bibtex",result="miss"} 0\n',
+                  prometheus_text)
+
+    def test_concurrent_conversions(self):
+        conversion_stats = get_conversion_stats()
+        conversion_stats.lock = _CountingLock(conversion_stats.lock)
+        errors = []
+
+        def convert():
+            try:
+                for i in range(200):
+                    Converters().get_conversion(Record(self.formats[0], u'text'), self.formats[2])
+                    count_cache_lookup('export', 'test_stats_2', i % 2 == 0)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=convert, name='converter-{0}'.format(i)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        # read while converting
+        latency = conversion_stats.get_stats()['latency']
+        for thread in threads:
+            thread.join()
+        assert_equal(errors, [])
+        # a thread takes the lock once, to register its stats
+        assert_equal(dict((name, count) for name, count in conversion_stats.lock.thread_names.items()
+                          if name.startswith('converter-')),
+                     dict((thread.name, 1) for thread in threads))
+        stats = conversion_stats.get_stats()
+        assert_equal(stats['latency']['conversion']['test_stats_2']['count'], 1600)
+        assert_equal(stats['latency']['converter']['test_stats_0->test_stats_1']['count'], 1600)
+        assert_equal(stats['cache']['export']['test_stats_2'], {'hits': 800, 'misses': 800, 'hit_ratio': 0.5})
+        assert_true(latency.get('conversion', {}).get('test_stats_2', {'count': 0})['count'] <= 1600)
+        # the finished threads are merged once
+        assert_equal(conversion_stats.thread_stats, [])
+        conversion_stats.reset()
+        assert_equal(conversion_stats.get_stats(), {'latency': {}, 'cache': {}})
+
+    def test_disabled(self):
+        set_conversion_stats(None)
+        with timed('serialize', 'datacite'):
+            pass
+        count_cache_lookup('export', 'datacite', True)
+        assert_equal(configure_conversion_stats({'package_converter.stats': 'false'}), None)
+
+    def test_configure(self):
+        conversion_stats = configure_conversion_stats({'package_converter.stats.samples': '10',
+                                                       'package_converter.stats.statsd': 'localhost:8125'})
+        assert_true(get_conversion_stats() is conversion_stats)
+        assert_equal(conversion_stats.sample_size, 10)
+        assert_equal(conversion_stats.exporters[0].address, ('localhost', 8125))
+        assert_raises(ValueError, configure_conversion_stats, {'package_converter.stats.statsd': 'localhost'})
+
+
+class TestStatsdExporter(object):
+
+    def setup_method(self, method=None):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.settimeout(5)
+
+    def teardown_method(self, method=None):
+        self.server.close()
+
+    def test_send(self):
+        exporter = StatsdExporter('127.0.0.1', self.server.getsockname()[1], prefix='ckan')
+        conversion_stats = ConversionStats(exporters=[exporter])
+        conversion_stats.observe('converter', 'ckan->datacite', 0.0125)
+        conversion_stats.count_cache_lookup('export', 'datacite', False)
+        assert_equal(self.server.recv(1024), b'ckan.converter.ckan_to_datacite:12.500|ms')
+        assert_equal(self.server.recv(1024), b'ckan.cache.export.datacite.miss:1|c')
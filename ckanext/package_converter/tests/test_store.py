@@ -0,0 +1,96 @@
+"""Tests for store.py."""
+import shutil
+import tempfile
+
+from ckanext.package_converter import store
+from ckanext.package_converter.store import ExportStore, configure_export_store, get_export_store, \
+    get_store_context, get_stored_export, set_export_store
+
+from ckanext.package_converter.logic import get_view_key, _get_cache_key
+from ckanext.package_converter.model.metadata_format import MetadataFormats
+
+from nose.tools import assert_equal, assert_true
+
+
+class TestExportStore(object):
+
+    def setup_method(self, method=None):
+        self.directory = tempfile.mkdtemp()
+
+    def teardown_method(self, method=None):
+        set_export_store(None)
+        shutil.rmtree(self.directory)
+
+    def test_get_set_delete_package(self):
+        store = ExportStore(self.directory)
+        store.set(('package-id', 'package-id', 'package', 'datacite'), u'<resource/>', 'application/xml')
+        store.set(('package-id', 'resource-id', 'resource', 'datacite'), u'<resource/>', 'application/xml')
+        assert_equal(store.get(('package-id', 'package-id', 'package', 'datacite')),
+                     (b'<resource/>', 'application/xml'))
+        store.delete_package('package-id')
+        assert_equal(store.get(('package-id', 'package-id', 'package', 'datacite')), None)
+        assert_equal(store.get(('package-id', 'resource-id', 'resource', 'datacite')), None)
+
+    def test_configure(self):
+        configure_export_store({'package_converter.store': 'true',
+                                'package_converter.store.directory': self.directory})
+        assert_true(isinstance(get_export_store(), ExportStore))
+        configure_export_store({})
+        assert_equal(get_export_store(), None)
+
+    def test_stored_export_of_revision(self):
+        store = ExportStore(self.directory)
+        set_export_store(store)
+        dataset_dict = {'id': 'package-id', 'metadata_modified': '2021-01-01T00:00:00'}
+        assert_equal(get_stored_export(dataset_dict, 'datacite', 'package_show:'), None)
+        datacite_format = MetadataFormats().get_metadata_formats('datacite')[0]
+        store.set(('package-id',) + _get_cache_key(dataset_dict, 'package', datacite_format, 'package_show:'),
+                  u'<resource/>', 'application/xml')
+        assert_equal(get_stored_export(dataset_dict, 'datacite', 'package_show:'), (b'<resource/>', 'application/xml'))
+        dataset_dict['metadata_modified'] = '2021-01-02T00:00:00'
+        assert_equal(get_stored_export(dataset_dict, 'datacite', 'package_show:'), None)
+
+    def test_stored_export_of_anonymous_view(self):
+        store = ExportStore(self.directory)
+        set_export_store(store)
+        dataset_dict = {'id': 'package-id', 'metadata_modified': '2021-01-01T00:00:00'}
+        datacite_format = MetadataFormats().get_metadata_formats('datacite')[0]
+        for view_key in ['package_show:', 'package_show:editor', 'package_search:']:
+            store.set(('package-id',) + _get_cache_key(dataset_dict, 'package', datacite_format, view_key),
+                      u'<resource/>', 'application/xml')
+        assert_equal(get_view_key(get_store_context()), 'package_show:')
+        assert_equal(get_stored_export(dataset_dict, 'datacite', 'package_show:editor'), None)
+        assert_equal(get_stored_export(dataset_dict, 'datacite', 'package_search:'), None)
+        assert_equal(get_stored_export(dataset_dict, 'datacite', None), None)
+
+
+class TestRenderPackageExports(object):
+
+    def setup_method(self, method=None):
+        self.directory = tempfile.mkdtemp()
+        self.get_action = store.toolkit.get_action
+        self.show_contexts = []
+        store.toolkit.get_action = lambda name: self._package_show
+        set_export_store(ExportStore(self.directory), ['datacite'])
+
+    def teardown_method(self, method=None):
+        store.toolkit.get_action = self.get_action
+        set_export_store(None)
+        shutil.rmtree(self.directory)
+
+    def _package_show(self, context, show_dict):
+        self.show_contexts.append(context)
+        if show_dict['id'] == 'private-id':
+            raise store.toolkit.NotAuthorized()
+        return {'id': show_dict['id'], 'name': 'package', 'metadata_modified': '2021-01-01T00:00:00',
+                'resources': []}
+
+    def test_rendered_as_anonymous(self):
+        store.render_package_exports('package-id')
+        assert_equal(self.show_contexts, [{'user': u''}])
+
+    def test_not_readable_deleted(self):
+        entry_key = ('private-id', 'private-id', 'package', 'datacite')
+        get_export_store().set(entry_key, u'<resource/>', 'application/xml')
+        store.render_package_exports('private-id')
+        assert_equal(get_export_store().get(entry_key), None)
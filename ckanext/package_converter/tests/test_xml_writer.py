@@ -0,0 +1,47 @@
+"""Tests for model/xml_writer.py."""
+import collections
+
+import xmltodict
+from lxml import etree
+
+from ckanext.package_converter.model.xml_writer import StreamXMLWriter, unparse, dict_to_tree
+
+from nose.tools import assert_equal
+
+
+def _get_test_dict():
+    resource = collections.OrderedDict()
+    resource['@xmlns:gml'] = 'http://www.opengis.net/gml'
+    resource['@xsi:schemaLocation'] = 'a "b" \'c\'\n'
+    resource['title'] = [u'dataset \xe9 & <co>', {'@lang': 'en', '#text': 'title'}]
+    resource['empty'] = ''
+    resource['none'] = None
+    resource['skipped'] = []
+    resource['gml:pos'] = ['1.0 2.0', 3, True]
+    resource['#text'] = 'text after children'
+    return collections.OrderedDict([('resource', resource)])
+
+
+class TestXMLWriter(object):
+
+    def test_unparse_as_xmltodict(self):
+        for pretty in [True, False]:
+            for short_empty_elements in [True, False]:
+                assert_equal(unparse(_get_test_dict(), pretty=pretty, short_empty_elements=short_empty_elements),
+                             xmltodict.unparse(_get_test_dict(), pretty=pretty,
+                                               short_empty_elements=short_empty_elements))
+
+    def test_stream_events(self):
+        writer = StreamXMLWriter(pretty=True)
+        writer.start('resource', [('id', '1')])
+        writer.element('title', 'dataset')
+        writer.element('empty')
+        writer.end()
+        assert_equal(writer.get_content(), '<resource id="1">\n\t<title>dataset</title>\n\t<empty></empty>\n</resource>')
+
+    def test_tree_as_parsed_unparse(self):
+        xml_dict = _get_test_dict()
+        xml_dict['resource']['@xmlns:xsi'] = 'http://www.w3.org/2001/XMLSchema-instance'
+        parsed = etree.fromstring(xmltodict.unparse(xml_dict, pretty=True).encode('utf-8'))
+        assert_equal(etree.tostring(dict_to_tree(xml_dict, pretty=True), method='c14n'),
+                     etree.tostring(parsed, method='c14n'))
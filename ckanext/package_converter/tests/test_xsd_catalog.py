@@ -0,0 +1,71 @@
+"""Tests for model/xsd_catalog.py."""
+import os
+import shutil
+import tempfile
+
+from ckanext.package_converter.model.metadata_format import XMLMetadataFormat
+from ckanext.package_converter.model.record import XMLRecord
+from ckanext.package_converter.model.xsd_catalog import XSDCatalog, XSD_DIRECTORY, configure_xsd_catalog
+
+from nose.tools import assert_equal, assert_true, assert_false, assert_raises
+
+TEST_XSD = '''<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" targetNamespace="urn:test" xmlns="urn:test"
+elementFormDefault="qualified"><xs:include schemaLocation="include/types.xsd"/>
+<xs:element name="root" type="RootType"/></xs:schema>'''
+
+TEST_INCLUDED_XSD = '''<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" targetNamespace="urn:test" xmlns="urn:test"
+elementFormDefault="qualified"><xs:complexType name="RootType"><xs:sequence>
+<xs:element name="title" type="xs:string"/></xs:sequence></xs:complexType></xs:schema>'''
+
+
+class TestXSDCatalog(object):
+
+    def setup_method(self, method=None):
+        self.directory = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.directory, 'include'))
+        with open(os.path.join(self.directory, 'test.xsd'), 'w') as xsd_file:
+            xsd_file.write(TEST_XSD)
+        with open(os.path.join(self.directory, 'include', 'types.xsd'), 'w') as xsd_file:
+            xsd_file.write(TEST_INCLUDED_XSD)
+        self.download = XSDCatalog().download
+        XSDCatalog().download = False
+
+    def teardown_method(self, method=None):
+        XSDCatalog().download = self.download
+        XSDCatalog().__dict__.pop('_compile_schema', None)
+        XSDCatalog().failures = {}
+        shutil.rmtree(self.directory)
+
+    def test_shipped_schema(self):
+        assert_equal(XSDCatalog().get_local_path('http://gcmd.gsfc.nasa.gov/Aboutus/xml/dif/dif_v10.2.xsd'),
+                     os.path.abspath(os.path.join(XSD_DIRECTORY, 'dif_v10.2.xsd')))
+
+    def test_validate_with_mirrored_directory(self):
+        XSDCatalog().add_location('http://example.org/schema/', self.directory)
+        test_format = XMLMetadataFormat('test_xsd', '1.0', 'http://example.org/schema/test.xsd', 'urn:test')
+        valid_record = XMLRecord(test_format, u'<root xmlns="urn:test"><title>valid</title></root>')
+        invalid_record = XMLRecord(test_format, u'<root xmlns="urn:test"><name>invalid</name></root>')
+        assert_true(valid_record.validate())
+        assert_false(invalid_record.validate())
+        assert_true(XSDCatalog().get_schema(test_format) is XSDCatalog().get_schema(test_format))
+
+    def test_download_disabled_by_default(self):
+        configure_xsd_catalog({})
+        assert_false(XSDCatalog().download)
+
+    def test_failure_not_retried(self):
+        compile_schema = XSDCatalog()._compile_schema
+        xsd_urls = []
+
+        def counting_compile_schema(xsd_url):
+            xsd_urls.append(xsd_url)
+            return compile_schema(xsd_url)
+        XSDCatalog()._compile_schema = counting_compile_schema
+        test_format = XMLMetadataFormat('test_xsd_missing', '1.0', 'http://example.org/missing/test.xsd', 'urn:test')
+        assert_raises(ValueError, XSDCatalog().get_schema, test_format)
+        assert_raises(ValueError, XSDCatalog().get_schema, test_format)
+        assert_equal(len(xsd_urls), 1)
+        # a new location is tried at once
+        XSDCatalog().add_location('http://example.org/missing/', self.directory)
+        assert_true(XSDCatalog().get_schema(test_format) is not None)
+        assert_equal(len(xsd_urls), 2)
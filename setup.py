@@ -60,6 +60,10 @@ setup(
     # requirements files see:
     # https://packaging.python.org/en/latest/technical.html#install-requires-vs-requirements-files
     install_requires=[],
+    # NumPy speeds up the spatial summaries of large geometries, they are computed without it otherwise
+    extras_require={
+        'numpy': ['numpy>=1.16'],
+    },
 
     # If there are data files included in your packages that need to be
     # installed, specify them here.  If using Python 2.6 or less, then these